@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+import numpy as np
+
+# 关注的高阶 order：THP（order 9）与最大块（order 10）
+WATCH_ORDERS = (9, 10)
+# unusable_index（放大 1000 倍）越过该值时立即切到最短间隔，与 stats.py 在基线建立前沿用的标红阈值一致
+THRESHOLD = 500
+# 每秒变化量（放大 1000 倍）：超过 FAST_RATE 视为快速恶化/恢复，低于 STABLE_RATE 视为稳定
+FAST_RATE = 20
+STABLE_RATE = 2
+# 稳定时每个周期把间隔放宽的倍数
+BACKOFF = 1.5
+
+
+class AdaptiveInterval:
+    """
+    根据高阶 order 的 unusable_index 变化趋势调整采样间隔，取值限制在 [floor, ceiling]：
+    任一 zone 的指标变化速度超过 FAST_RATE 或越过 THRESHOLD 时直接降到 floor，
+    低于 STABLE_RATE 时逐周期放宽到 ceiling，介于两者之间保持不变。
+    """
+    def __init__(self, floor, ceiling, orders=WATCH_ORDERS):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.orders = list(orders)
+        self.zones = None
+        self.scores = None
+        self.timestamp = None
+
+    def clamp(self, interval):
+        return min(max(interval, self.floor), self.ceiling)
+
+    def update(self, snap, interval):
+        """根据新快照返回下一周期的间隔"""
+        if not snap.zones:
+            return self.clamp(interval)
+        scores = np.asarray(snap.score_b, dtype=np.int64)[:, self.orders]
+        previous, last = self.scores, self.timestamp
+        same_layout = snap.zones == self.zones
+        self.zones, self.scores, self.timestamp = snap.zones, scores, snap.timestamp
+        if previous is None or not same_layout or snap.timestamp <= last:
+            return self.clamp(interval)
+
+        rate = np.abs(scores - previous).max() / (snap.timestamp - last)
+        crossed = ((previous < THRESHOLD) != (scores < THRESHOLD)).any()
+        if crossed or rate >= FAST_RATE:
+            return self.floor
+        if rate < STABLE_RATE:
+            return self.clamp(interval * BACKOFF)
+        return self.clamp(interval)
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from adaptive import WATCH_ORDERS
+from exporter import BINARY_HEADER, BINARY_MAGIC, BINARY_TYPE, BINARY_VERSION, JSON_TYPE, \
+    PROMETHEUS_TYPE, parse_binary, render_binary
+from fragindex import fragmentation_columns
+from recorder import Recording
+from snapshot import NR_ORDERS, Snapshot
+
+USAGE = """usage: aggregator.py [-d DELAY] [-j MAX_INFLIGHT] [-x [HOST:]PORT] [-n TOP] [-t SECONDS]
+                     [-f FILE] [HOST:PORT ...]
+       aggregator.py simulate [-n AGENTS] [-P BASE_PORT] [-d DELAY] [-r FILE] [-o FILE]
+  拉取各主机 `extfrag_user.py -x` 导出的 /snapshot，按高阶 order 最差的 unusable_index 排名:
+    -f        主机列表文件，每行一个 HOST:PORT（# 开头为注释）
+    -d        拉取周期（秒，默认 2）
+    -j        同时进行中的请求数上限（默认 256）
+    -x        在 [HOST:]PORT 上提供 /fleet（JSON）与 /metrics，否则每个周期向标准输出打印排名
+    -n        打印前 TOP 名（默认 20）
+    -t        运行 SECONDS 秒后打印统计并退出
+  simulate   启动替身 agent，循环回放合成数据（或 -r 指定的录制文件）:
+    -n        agent 数（默认 1000）
+    -P        第一个端口（默认 20000），agent i 监听 BASE_PORT + i
+    -o        把主机列表写入 FILE，供 -f 使用"""
+
+DEFAULT_PORT = 9101
+# 响应头与响应体的长度上限，超过视为协议错误
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1 << 20
+# 连续失败时重连的退避上限（秒）
+MAX_BACKOFF = 60
+# 数据超过 STALE_FACTOR 个周期（拉取周期与 agent 自身采样间隔中较长者）没有更新视为过期
+STALE_FACTOR = 3
+# 超过 DOWN_FACTOR 个周期没有一次成功的拉取（连接失败、超时或协议错误）视为下线
+DOWN_FACTOR = 10
+STATES = ('ok', 'stale', 'down')
+
+
+class HttpError(Exception):
+    pass
+
+
+def parse_address(text, default_port=DEFAULT_PORT):
+    """HOST:PORT 或 HOST，IPv6 地址写作 [ADDR]:PORT"""
+    if text.startswith('['):
+        host, _, rest = text[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else default_port
+    host, sep, port = text.rpartition(':')
+    if not sep:
+        return text, default_port
+    return host or '127.0.0.1', int(port)
+
+
+class AgentConnection:
+    """
+    到一个 agent 的 HTTP/1.1 长连接，请求串行发送。出错或被取消（超时）时关闭连接，
+    下一次请求重新建立，不会读到上一个请求残留的响应
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.connects = 0
+
+    async def get(self, path, etag=None):
+        """返回 (status, headers, body)，headers 的键为小写"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.connects += 1
+        request = f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        if etag is not None:
+            request += f"If-None-Match: {etag}\r\n"
+        try:
+            self.writer.write((request + "\r\n").encode('latin-1'))
+            parts = (await self.reader.readline()).split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith(b'HTTP/1.'):
+                raise HttpError("bad status line")
+            status = int(parts[1])
+            headers = {}
+            size = 0
+            while True:
+                line = await self.reader.readline()
+                size += len(line)
+                if not line:
+                    raise HttpError("connection closed")
+                if size > MAX_HEADER_BYTES:
+                    raise HttpError("response header too long")
+                if line in (b'\r\n', b'\n'):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                raise HttpError("response body too long")
+            body = await self.reader.readexactly(length) if length else b''
+        except BaseException:
+            self.close()
+            raise
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Agent:
+    """一个 agent 的最新结果与拉取统计；时间均为 time.monotonic()"""
+    def __init__(self, name, host, port):
+        self.name = name
+        self.conn = AgentConnection(host, port)
+        self.etag = None
+        self.timestamp = None
+        self.interval = 0.0
+        # 最差的高阶 order unusable_index（放大 1000 倍）及其位置
+        self.worst = None
+        self.worst_zone = None
+        self.worst_order = None
+        self.received = None
+        self.changed = None
+        self.latency = 0.0
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.skipped = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.error = None
+
+    def update(self, body, orders, now):
+        timestamp, table, _, record = parse_binary(body)
+        self.timestamp = timestamp
+        self.interval = int(record['interval_ms']) / 1000.0
+        self.changed = now
+        if not len(table):
+            self.worst = self.worst_zone = self.worst_order = None
+            return
+        scores = fragmentation_columns(record['nr_free'])[4][:, orders]
+        z, k = divmod(int(scores.argmax()), len(orders))
+        self.worst = int(scores[z, k])
+        self.worst_zone = (int(table[z]['node_id']), table[z]['name'].decode('utf-8', 'replace'))
+        self.worst_order = orders[k]
+
+    def fail(self, error, now, interval):
+        """连续失败时按 interval * 2^n 退避重连，最长 MAX_BACKOFF 秒"""
+        self.errors += 1
+        self.failures += 1
+        self.error = str(error) or type(error).__name__
+        self.retry_at = now + min(interval * 2 ** (self.failures - 1), MAX_BACKOFF)
+
+    def state(self, now, interval):
+        """从未拿到数据或长时间拉取失败为 down，拉取成功但数据长时间没有更新为 stale"""
+        period = max(interval, self.interval)
+        if self.changed is None or self.received is None or now - self.received > DOWN_FACTOR * period:
+            return 'down'
+        if now - self.changed > STALE_FACTOR * period:
+            return 'stale'
+        return 'ok'
+
+
+class Aggregator:
+    """
+    按固定周期从每个 agent 拉取 /snapshot，汇总为按最差高阶 unusable_index 排序的全局视图。
+      - 每个 agent 一条长连接；各 agent 的节拍在一个周期内均匀错开，避免同时发出请求
+      - 背压：同时进行中的请求不超过 max_inflight，名额用完时的节拍直接跳过；一个 agent 的请求
+        超出自己的周期时也跳过错过的节拍（均计入 skipped），不会在慢主机上排队积压
+      - 快照未更新时 agent 返回 304，只传一个响应头
+      - 汇总视图每个周期渲染一次，/fleet 与 /metrics 直接返回缓存
+    """
+    def __init__(self, agents, interval=2, max_inflight=256, timeout=None, orders=WATCH_ORDERS):
+        self.agents = [Agent(name, host, port) for name, host, port in agents]
+        self.interval = interval
+        self.max_inflight = max_inflight
+        self.timeout = interval if timeout is None else timeout
+        self.orders = list(orders)
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.throttled = 0
+        self.rounds = 0
+        self.bodies = None
+        # 每个周期结束时以汇总视图调用
+        self.listeners = []
+        self.cpu_seconds = 0.0
+        self.cpu_percent = 0.0
+        self._running = False
+
+    async def run(self, duration=None):
+        self._running = True
+        start = time.monotonic()
+        tasks = [asyncio.create_task(self._agent_loop(agent, start + i * self.interval / len(self.agents)))
+                 for i, agent in enumerate(self.agents)]
+        tasks.append(asyncio.create_task(self._render_loop(start)))
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            self._running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for agent in self.agents:
+                agent.conn.close()
+
+    async def _agent_loop(self, agent, next_tick):
+        # 除了取消任务外还检查 _running：wait_for 与取消同时发生时取消可能被吞掉
+        while self._running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            now = time.monotonic()
+            lag = now - next_tick
+            if lag >= self.interval:
+                skipped = int(lag // self.interval)
+                agent.skipped += skipped
+                next_tick += skipped * self.interval
+            next_tick += self.interval
+            if now < agent.retry_at:
+                continue
+            # 并发名额用完时跳过本节拍，等下一个周期再试
+            if self.inflight >= self.max_inflight:
+                self.throttled += 1
+                agent.skipped += 1
+                continue
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            try:
+                await asyncio.wait_for(self._poll(agent), self.timeout)
+            except (OSError, EOFError, HttpError, ValueError, asyncio.TimeoutError) as e:
+                agent.fail(e, time.monotonic(), self.interval)
+            finally:
+                self.inflight -= 1
+
+    async def _poll(self, agent):
+        start = time.monotonic()
+        status, headers, body = await agent.conn.get('/snapshot', agent.etag)
+        now = time.monotonic()
+        if status == 304:
+            agent.not_modified += 1
+        elif status == 200:
+            agent.update(body, self.orders, now)
+            agent.etag = headers.get('etag')
+        else:
+            raise HttpError(f"HTTP {status}")
+        agent.latency = now - start
+        agent.received = now
+        agent.polls += 1
+        agent.failures = 0
+        agent.error = None
+
+    async def _render_loop(self, start):
+        next_tick = start + self.interval
+        cpu, wall = time.process_time(), time.monotonic()
+        while self._running:
+            await asyncio.sleep(max(next_tick - time.monotonic(), 0))
+            next_tick += self.interval
+            self.rounds += 1
+            now_cpu, now_wall = time.process_time(), time.monotonic()
+            self.cpu_seconds = now_cpu
+            self.cpu_percent = 100.0 * (now_cpu - cpu) / max(now_wall - wall, 1e-9)
+            cpu, wall = now_cpu, now_wall
+            rows = self.fleet()
+            self.bodies = (render_fleet_json(self, rows), render_fleet_prometheus(self, rows))
+            for listener in self.listeners:
+                listener(self, rows)
+
+    def fleet(self):
+        """按最差高阶 unusable_index 降序排列的全部主机，从未拿到数据的主机排在最后"""
+        now = time.monotonic()
+        rows = []
+        for agent in self.agents:
+            rows.append({
+                'host': agent.name,
+                'state': agent.state(now, self.interval),
+                'worst': None if agent.worst is None else agent.worst / 1000,
+                'node': None if agent.worst_zone is None else agent.worst_zone[0],
+                'zone': None if agent.worst_zone is None else agent.worst_zone[1],
+                'order': agent.worst_order,
+                'age': None if agent.changed is None else now - agent.changed,
+                'latency_ms': agent.latency * 1000,
+                'polls': agent.polls,
+                'not_modified': agent.not_modified,
+                'errors': agent.errors,
+                'skipped': agent.skipped,
+                'error': agent.error,
+            })
+        rows.sort(key=lambda row: (row['worst'] is None, -(row['worst'] or 0), row['host']))
+        return rows
+
+    def counts(self, rows):
+        counts = dict.fromkeys(STATES, 0)
+        for row in rows:
+            counts[row['state']] += 1
+        return counts
+
+    async def serve(self, host, port):
+        """在 host:port 上提供 /fleet 与 /metrics（HTTP/1.1 长连接）"""
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.split()
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                path = parts[1].split(b'?', 1)[0] if len(parts) > 1 else b''
+                if self.bodies is None:
+                    status, ctype, body = '503 Service Unavailable', 'text/plain', b'no data yet\n'
+                elif path == b'/fleet':
+                    status, ctype, body = '200 OK', JSON_TYPE, self.bodies[0]
+                elif path == b'/metrics':
+                    status, ctype, body = '200 OK', PROMETHEUS_TYPE, self.bodies[1]
+                else:
+                    status, ctype, body = '404 Not Found', 'text/plain', b'not found\n'
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+                             f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def render_fleet_json(aggregator, rows):
+    return json.dumps({'timestamp': time.time(), 'interval': aggregator.interval,
+                       'agents': aggregator.counts(rows), 'hosts': rows},
+                      separators=(',', ':')).encode()
+
+
+def render_fleet_prometheus(aggregator, rows):
+    lines = ["# HELP mfd_fleet_worst_unusable_index Worst unusable_index of the watched high orders",
+             "# TYPE mfd_fleet_worst_unusable_index gauge"]
+    for row in rows:
+        if row['worst'] is not None:
+            lines.append(f'mfd_fleet_worst_unusable_index{{host="{row["host"]}",node="{row["node"]}",'
+                         f'zone="{row["zone"]}",order="{row["order"]}"}} {row["worst"]}')
+    lines.append("# TYPE mfd_fleet_data_age_seconds gauge")
+    for row in rows:
+        if row['age'] is not None:
+            lines.append(f'mfd_fleet_data_age_seconds{{host="{row["host"]}"}} {row["age"]:.3f}')
+    for name, key in (('mfd_fleet_polls_total', 'polls'), ('mfd_fleet_poll_errors_total', 'errors'),
+                      ('mfd_fleet_skipped_polls_total', 'skipped')):
+        lines.append(f"# TYPE {name} counter")
+        for row in rows:
+            lines.append(f'{name}{{host="{row["host"]}"}} {row[key]}')
+    lines.append("# TYPE mfd_fleet_agents gauge")
+    for state, count in aggregator.counts(rows).items():
+        lines.append(f'mfd_fleet_agents{{state="{state}"}} {count}')
+    lines.append("# TYPE mfd_fleet_cpu_seconds_total counter")
+    lines.append(f"mfd_fleet_cpu_seconds_total {aggregator.cpu_seconds:.3f}")
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def format_fleet(aggregator, rows, out, top=20):
+    counts = aggregator.counts(rows)
+    print(f"{time.strftime('%H:%M:%S')} agents ok={counts['ok']} stale={counts['stale']} "
+          f"down={counts['down']} inflight_peak={aggregator.peak_inflight} "
+          f"throttled={aggregator.throttled} cpu={aggregator.cpu_percent:.1f}%", file=out)
+    print(f"{'RANK':>4} {'HOST':<24} {'STATE':<6} {'WORST':>6} {'NODE':>4} {'ZONE':<8} {'ORDER':>5} "
+          f"{'AGE(s)':>7} {'LAT(ms)':>8} {'ERRORS':>6}  ERROR", file=out)
+    for rank, row in enumerate(rows[:top], 1):
+        worst = '-' if row['worst'] is None else f"{row['worst']:.3f}"
+        age = '-' if row['age'] is None else f"{row['age']:.1f}"
+        print(f"{rank:>4} {row['host']:<24} {row['state']:<6} {worst:>6} {row['node'] if row['node'] is not None else '-':>4} "
+              f"{row['zone'] or '-':<8} {row['order'] if row['order'] is not None else '-':>5} {age:>7} "
+              f"{row['latency_ms']:>8.1f} {row['errors']:>6}  {row['error'] or ''}", file=out)
+    print(file=out)
+    out.flush()
+
+
+def synthetic_snapshots(count, seed=0, nodes=2):
+    """
+    合成 count 个连续的快照：每个节点 DMA32/Normal 两个 zone，nr_free 做随机游走，
+    指标与真实内核一样由 fragindex 计算
+    """
+    rng = np.random.default_rng(seed)
+    zones = []
+    for node_id in range(nodes):
+        base = node_id * (1 << 22)
+        zones.append((node_id, 'DMA32', base + 4096, 1044480, 782336))
+        zones.append((node_id, 'Normal', base + 1048576, 3145728, 3145728))
+    node_pfns = {node_id: node_id * (1 << 22) + 4096 for node_id in range(nodes)}
+    # 高阶 order 的空闲块少，游走的步长与初值按 order 递减
+    scale = 4096 >> np.arange(NR_ORDERS)
+    nr_free = rng.integers(0, 2, (len(zones), NR_ORDERS)) * scale + scale
+    snapshots = []
+    for i in range(count):
+        nr_free = np.maximum(nr_free + rng.integers(-1, 2, nr_free.shape) * (scale // 4 + 1), 0)
+        columns = fragmentation_columns(nr_free)
+        snapshots.append(Snapshot(float(i), zones, node_pfns,
+                                  *(tuple(map(tuple, c.tolist())) for c in columns), interval=2.0))
+    return snapshots
+
+
+class StandInAgents:
+    """
+    替身 agent：在本进程中监听 count 个端口，行为与 Exporter 的 /snapshot 一致（ETag、304、长连接）。
+    快照预先编码，每个 agent 以不同的相位按 interval 循环回放，响应时只改写头部的时间戳。
+    base_port 为 0 时由系统分配端口
+    """
+    def __init__(self, count, base_port, interval=2, snapshots=None, host='127.0.0.1'):
+        self.count = count
+        self.base_port = base_port
+        self.interval = interval
+        self.host = host
+        snapshots = snapshots or synthetic_snapshots(64)
+        # 去掉头部，只保留 zone 表、节点表与记录
+        self.payloads = [(len(snap.zones), len(snap.nodes), render_binary(snap)[BINARY_HEADER.size:])
+                         for snap in snapshots]
+        self.servers = []
+        self.writers = set()
+        self.requests = 0
+
+    def body(self, index):
+        """返回 agent index 当前的 (etag, body)"""
+        generation = int(time.time() / self.interval)
+        nr_zones, nr_nodes, payload = self.payloads[(generation + index * 7) % len(self.payloads)]
+        header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, NR_ORDERS, nr_zones, nr_nodes,
+                                    int(generation * self.interval * 1e9))
+        return f'"{generation:x}"', header + payload
+
+    async def start(self):
+        for i in range(self.count):
+            handler = lambda reader, writer, index=i: self._handle(index, reader, writer)
+            port = self.base_port + i if self.base_port else 0
+            self.servers.append(await asyncio.start_server(handler, self.host, port))
+
+    def addresses(self):
+        return [f"{self.host}:{server.sockets[0].getsockname()[1]}" for server in self.servers]
+
+    async def _handle(self, index, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                etag = None
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'if-none-match':
+                        etag = value.strip()
+                self.requests += 1
+                current, body = self.body(index)
+                if etag == current:
+                    writer.write(f"HTTP/1.1 304 Not Modified\r\nETag: {current}\r\n\r\n".encode())
+                else:
+                    writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {BINARY_TYPE}\r\nETag: {current}\r\n"
+                                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def close(self):
+        """停止监听并断开已建立的长连接"""
+        for server in self.servers:
+            server.close()
+        for writer in list(self.writers):
+            writer.close()
+
+
+async def simulate_main(count, base_port, interval, path, output):
+    snapshots = None
+    if path is not None:
+        recording = Recording(path)
+        snapshots = [recording.snapshot(i) for i in range(min(len(recording), 256))]
+    agents = StandInAgents(count, base_port, interval, snapshots)
+    await agents.start()
+    if output is not None:
+        with open(output, 'w') as f:
+            f.write('\n'.join(agents.addresses()) + '\n')
+    print(f"{count} stand-in agents on {agents.host}:{base_port}-{base_port + count - 1}", file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        agents.close()
+
+
+async def aggregate_main(addresses, interval, max_inflight, listen, top, duration):
+    aggregator = Aggregator([(text,) + parse_address(text) for text in addresses],
+                            interval=interval, max_inflight=max_inflight)
+    server = None
+    if listen is not None:
+        server = await aggregator.serve(*listen)
+    else:
+        aggregator.listeners.append(lambda agg, rows: format_fleet(agg, rows, sys.stdout, top))
+    cpu = time.process_time()
+    try:
+        await aggregator.run(duration)
+    finally:
+        if server is not None:
+            server.close()
+    cpu = time.process_time() - cpu
+    if duration is not None:
+        rows = aggregator.fleet()
+        polls = sum(row['polls'] for row in rows)
+        print(f"{len(rows)} agents, {polls} polls "
+              f"({sum(row['not_modified'] for row in rows)} not modified), "
+              f"{sum(row['errors'] for row in rows)} errors, {sum(row['skipped'] for row in rows)} skipped, "
+              f"cpu {cpu:.2f}s over {duration:g}s ({100 * cpu / duration:.1f}% of one core)")
+
+
+def read_hosts(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def main(argv):
+    simulate = bool(argv) and argv[0] == 'simulate'
+    args = argv[1:] if simulate else argv
+    interval, max_inflight, listen, top, duration = 2, 256, None, 20, None
+    count, base_port, path, output = 1000, 20000, None, None
+    addresses = []
+    i = 0
+    try:
+        while i < len(args):
+            arg = args[i]
+            value = args[i + 1] if i + 1 < len(args) else None
+            if arg == '-d' and value is not None:
+                interval = float(value)
+            elif arg == '-n' and value is not None and value.isdigit() and int(value) > 0:
+                if simulate:
+                    count = int(value)
+                else:
+                    top = int(value)
+            elif simulate and arg == '-P' and value is not None:
+                base_port = int(value)
+            elif simulate and arg == '-r' and value is not None:
+                path = value
+            elif simulate and arg == '-o' and value is not None:
+                output = value
+            elif not simulate and arg == '-j' and value is not None and value.isdigit() and int(value) > 0:
+                max_inflight = int(value)
+            elif not simulate and arg == '-x' and value is not None:
+                host, sep, port = value.rpartition(':')
+                listen = (host or '127.0.0.1', int(port))
+            elif not simulate and arg == '-t' and value is not None:
+                duration = float(value)
+            elif not simulate and arg == '-f' and value is not None:
+                addresses.extend(read_hosts(value))
+            elif not simulate and not arg.startswith('-'):
+                addresses.append(arg)
+                i += 1
+                continue
+            else:
+                raise ValueError(arg)
+            i += 2
+        if interval <= 0 or (not simulate and not addresses):
+            raise ValueError("no agents")
+    except (ValueError, OSError):
+        print(USAGE, file=sys.stderr)
+        return 2
+    try:
+        if simulate:
+            asyncio.run(simulate_main(count, base_port, interval, path, output))
+        else:
+            asyncio.run(aggregate_main(addresses, interval, max_inflight, listen, top, duration))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
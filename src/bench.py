@@ -0,0 +1,747 @@
+#!/usr/bin/env python3
+import ctypes
+import fcntl
+import json
+import mmap
+import os
+import platform
+import pty
+import resource
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import termios
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from snapshot import NR_ORDERS
+
+USAGE = """usage: bench.py startup [-m timer|kprobe|count] [-n RUNS] [-j]
+       bench.py ticks [-N NODES] [-Z ZONES] [-T TASKS] [-n TICKS] [-g COLSxROWS] [-v VIEW,...] [-p] [-j]
+       bench.py probes [-m MODE,...] [-P PAGES] [-n RUNS] [-d DELAY] [-H] [-j]
+       bench.py verify [-m MODE,...] [-c] [-j]
+  startup  测量 ExtFrag 初始化（加载 eBPF 程序）的耗时与峰值内存，以及加载后在同一程序中
+           切换数据源（-s/-a 视图）的平均耗时，需要 root:
+             cold - 不使用缓存，每次由 BCC 编译
+             miss - 清空缓存后第一次启动：编译并固定到 bpffs
+             warm - 命中缓存，直接打开固定的程序与表
+  ticks    用合成的 zone_map/counts_map 内容驱动 ExtFrag 的读取路径与界面的各个视图，
+           测量每个周期的 CPU 时间与内存分配，不需要 root 与 BCC
+  probes   缺页/页分配微基准：分别在不加载与加载 eBPF 程序时逐页触发缺页，
+           给出每次分配增加的纳秒数，需要 root
+  verify   在本机内核上编译并加载拼接后的 eBPF 程序，依次用 switch_source 开关各数据源，
+           核对每一步挂载的 kprobe/tracepoint 数与采集结果，最后检查卸载后没有残留，需要 root
+  -m       采样方式，count 另外开启 -s 的 extfraginfo.c 数据源（默认 timer）；
+           probes 可用逗号分隔多个，另有 stall 开启 -a 的 allocstall.c 数据源（默认全部）；
+           verify 为 timer、kprobe，逗号分隔（默认全部）
+  -c       verify 使用程序缓存（默认不使用，每次由 BCC 编译）
+  -n       startup/probes 每种情况的运行次数（默认 5），ticks 的测量周期数（默认 200）
+  -N, -Z   ticks 合成的节点数与每个节点的 zone 数（默认 2 与 3）
+  -T       ticks 中 counts_map 的任务数（默认 4096，即 LRU 表满）
+  -g       ticks 的终端尺寸（默认 250x50）
+  -v       ticks 测量的视图，逗号分隔（默认全部）: summary zone bar view node count
+  -p       ticks 时打开 --profile 的分阶段计时，可对比其开销，并给出计时轮中各阶段的平均耗时
+  -P       probes 每次运行触发缺页的页数（默认 65536）
+  -d       probes 中 eBPF 程序的采样间隔秒数（默认 2）
+  -H       probes 改为每次缺页分配一个 PMD 大页（order 9）
+  -j       以 JSON 输出，附带内核版本、CPU 数等主机信息，便于保存后对比"""
+
+STARTUP_PATHS = ('cold', 'miss', 'warm')
+
+
+def startup_child(mode, path):
+    """在子进程中执行，保证每次都是全新的解释器与 BCC 状态"""
+    from extfrag import ExtFrag
+    if path == 'miss':
+        from bpfcache import META_ROOT, PIN_ROOT
+        shutil.rmtree(PIN_ROOT, ignore_errors=True)
+        shutil.rmtree(META_ROOT, ignore_errors=True)
+    # 只计 ExtFrag 初始化本身，解释器启动与模块导入计入 wall_seconds
+    start = time.perf_counter()
+    extfrag = ExtFrag(mode='kprobe' if mode == 'kprobe' else 'timer',
+                      output_count=(mode == 'count'), bpf_cache=(path != 'cold'))
+    elapsed = time.perf_counter() - start
+    hit = extfrag.program_cache is not None and extfrag.program_cache.hit
+    # 不重新加载、只切换开关与探针（含切换后的第一次采集），对比再启动一个实例的耗时
+    start = time.perf_counter()
+    extfrag.switch_source(output_count=True)
+    extfrag.switch_source(output_stall=True)
+    extfrag.switch_source(output_count=(mode == 'count'))
+    switch = (time.perf_counter() - start) / 3
+    print(json.dumps({'seconds': elapsed, 'hit': hit, 'switch_seconds': switch,
+                      'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def run_startup(mode, runs):
+    results = {}
+    for path in STARTUP_PATHS:
+        samples = []
+        for _ in range(runs):
+            wall = time.perf_counter()
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '_startup', mode, path],
+                                 check=True, capture_output=True, text=True).stdout
+            sample = json.loads(out.splitlines()[-1])
+            sample['wall_seconds'] = time.perf_counter() - wall
+            samples.append(sample)
+        results[path] = {
+            'runs': runs,
+            'median_seconds': statistics.median(s['seconds'] for s in samples),
+            'min_seconds': min(s['seconds'] for s in samples),
+            'max_seconds': max(s['seconds'] for s in samples),
+            'median_wall_seconds': statistics.median(s['wall_seconds'] for s in samples),
+            'max_rss_mb': max(s['maxrss_kb'] for s in samples) / 1024,
+            'hits': sum(s['hit'] for s in samples),
+            'median_switch_seconds': statistics.median(s['switch_seconds'] for s in samples),
+        }
+    return results
+
+
+def format_startup(mode, results, out):
+    print(f"startup mode={mode}", file=out)
+    print(f"{'PATH':<6} {'RUNS':>4} {'MEDIAN(s)':>10} {'MIN(s)':>8} {'MAX(s)':>8} "
+          f"{'WALL(s)':>8} {'RSS(MB)':>8} {'HITS':>4} {'SWITCH(ms)':>10}", file=out)
+    for path in STARTUP_PATHS:
+        r = results[path]
+        print(f"{path:<6} {r['runs']:>4} {r['median_seconds']:>10.3f} {r['min_seconds']:>8.3f} "
+              f"{r['max_seconds']:>8.3f} {r['median_wall_seconds']:>8.3f} {r['max_rss_mb']:>8.1f} "
+              f"{r['hits']:>4} {r['median_switch_seconds'] * 1000:>10.1f}", file=out)
+
+
+# 与 fraginfo.c、extfraginfo.c 中的表结构一致
+MAX_NR_ZONES = 5
+ZONE_NAMES = ('DMA', 'DMA32', 'Normal', 'Movable', 'Device')
+NR_MIGRATETYPES = 8
+HIST_SLOTS = NR_ORDERS * NR_ORDERS * NR_MIGRATETYPES * 2
+TASK_ENTRIES = 4096
+
+
+class PgdatInfo(ctypes.Structure):
+    _fields_ = [('node_start_pfn', ctypes.c_uint64), ('nr_zones', ctypes.c_int),
+                ('node_id', ctypes.c_int)]
+
+
+class ZoneMeta(ctypes.Structure):
+    _fields_ = [('zone_start_pfn', ctypes.c_uint64), ('spanned_pages', ctypes.c_uint64),
+                ('present_pages', ctypes.c_uint64), ('name', ctypes.c_char * 16)]
+
+
+class ZoneFree(ctypes.Structure):
+    _fields_ = [('nr_free', ctypes.c_uint64 * NR_ORDERS)]
+
+
+class TaskData(ctypes.Structure):
+    _fields_ = [('last_pfn', ctypes.c_uint64), ('last_alloc_order', ctypes.c_int),
+                ('last_fallback_order', ctypes.c_int), ('pid', ctypes.c_int),
+                ('count', ctypes.c_uint64), ('pcomm', ctypes.c_char * 32)]
+
+
+class SyntheticTable:
+    """
+    与 BCC 表接口相同的内存表。和 BCC 一样每次批量读取都构造新的 ctypes 对象，
+    只是省去了系统调用
+    """
+    def __init__(self, keys, values):
+        self.keys = keys
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+
+    def items_lookup_batch(self):
+        return [(type(k).from_buffer_copy(k), type(v).from_buffer_copy(v))
+                for k, v in zip(self.keys, self.values)]
+
+
+class SyntheticKernel:
+    """
+    合成的 eBPF 表内容：nodes 个节点、每个节点 zones 个 zone（槽位数与内核的 MAX_NR_ZONES 一致，
+    多出的槽位为空），tasks 个任务的 counts_map 与各 CPU 的 hist_map。
+    每次 advance() 让全部 zone 的 nr_free 随机游走、随机一部分任务累加外碎片化事件，
+    每个周期界面上的每一行都会变化，测得的是最坏情况
+    """
+    def __init__(self, nodes=2, zones=3, tasks=TASK_ENTRIES, seed=1):
+        self.rng = np.random.default_rng(seed)
+        self.nodes = nodes
+        self.slots = max(zones, MAX_NR_ZONES)
+        zone_pages = 1 << 22
+        pgdat = [PgdatInfo(n * zones * zone_pages, zones, n) for n in range(nodes)]
+        meta = [ZoneMeta() for _ in range(nodes * self.slots)]
+        for n in range(nodes):
+            for z in range(zones):
+                name = ZONE_NAMES[z] if z < len(ZONE_NAMES) else f'Zone{z}'
+                meta[n * self.slots + z] = ZoneMeta((n * zones + z) * zone_pages, zone_pages,
+                                                    zone_pages - 1024, name.encode())
+        self.live = [n * self.slots + z for n in range(nodes) for z in range(zones)]
+        self.nr_free = self.rng.integers(0, 1 << 12, (len(self.live), NR_ORDERS)) >> np.arange(NR_ORDERS)
+        self.free = [ZoneFree() for _ in meta]
+
+        self.tasks = [TaskData(self.rng.integers(1 << 30), 0, 1, 1000 + i, 1, f'task-{i}'.encode())
+                      for i in range(tasks)]
+        cpus = os.cpu_count() or 1
+        self.hist = [(ctypes.c_uint64 * cpus)() for _ in range(HIST_SLOTS)]
+        self.tables = {
+            'pgdat_map': SyntheticTable([ctypes.c_int(i) for i in range(nodes)], pgdat),
+            'zone_meta_map': SyntheticTable([ctypes.c_int(i) for i in range(len(meta))], meta),
+            'zone_map': SyntheticTable([ctypes.c_int(i) for i in range(len(meta))], self.free),
+            'counts_map': SyntheticTable([ctypes.c_int(t.pid) for t in self.tasks], self.tasks),
+            'hist_map': SyntheticTable([ctypes.c_int(i) for i in range(HIST_SLOTS)], self.hist),
+            'delay_map': SyntheticTable([ctypes.c_int(0)], [ctypes.c_int(0)]),
+            'last_time_map': SyntheticTable([ctypes.c_int(0)], [ctypes.c_ulonglong(0)]),
+        }
+        self.advance()
+
+    def advance(self):
+        rng = self.rng
+        self.nr_free = np.maximum(self.nr_free + rng.integers(-8, 9, self.nr_free.shape), 0)
+        for slot, row in zip(self.live, self.nr_free.tolist()):
+            self.free[slot].nr_free[:] = row
+        for i in rng.integers(0, len(self.tasks), len(self.tasks) // 10 + 1).tolist():
+            task = self.tasks[i]
+            task.count += 1
+            task.last_alloc_order = int(rng.integers(0, 4))
+            task.last_fallback_order = task.last_alloc_order + int(rng.integers(1, 4))
+        for slot in rng.integers(0, HIST_SLOTS, 64).tolist():
+            self.hist[slot][0] += 1
+
+
+def synthetic_extfrag(kernel, output_count=False):
+    """
+    构造读取合成表的 ExtFrag：以不需要 BCC 的 buddyinfo 后端创建，再换成 bpf 后端的表，
+    之后 sample() 走的就是 _read_bpf、get_count_data 与 get_hist_data 的原有路径
+    """
+    from extfrag import ExtFrag
+    from fragindex import IndexCache
+    extfrag = ExtFrag(backend='buddyinfo')
+    extfrag.source = None
+    extfrag.backend = 'bpf'
+    extfrag.b = kernel.tables
+    extfrag.nr_nodes = kernel.nodes
+    extfrag.nr_zone_slots = kernel.slots
+    extfrag.index = IndexCache()
+    extfrag.output_count = output_count
+    return extfrag
+
+
+TICK_VIEWS = ('summary', 'zone', 'bar', 'view', 'node', 'count')
+TICK_STAGES = ('collect', 'draw')
+WARMUP_TICKS = 10
+
+
+def view_args(view):
+    """与 extfrag_user.py 的命令行参数对应：zone 为 -z，bar 为 -z -b，view 为 -v，node 为 -n，count 为 -s"""
+    return {
+        'node_id': None, 'comm': None, 'extfrag_index': False, 'unusable_index': False,
+        'alloc_stall': False, 'zone_info': view in ('zone', 'bar'), 'bar': view == 'bar',
+        'view': view == 'view', 'node_info': view == 'node', 'output_count': view == 'count',
+        'sort': 'zone', 'alerts': False, 'migratetype': False, 'heatmap': False,
+    }
+
+
+def summarize_ns(samples):
+    samples = sorted(samples)
+    return {
+        'median_us': statistics.median(samples) / 1000,
+        'p99_us': samples[min(len(samples) - 1, len(samples) * 99 // 100)] / 1000,
+        'mean_us': statistics.fmean(samples) / 1000,
+        'max_us': samples[-1] / 1000,
+    }
+
+
+def ticks_child(view, config, fd):
+    """
+    在伪终端上运行的子进程：先计时 ticks 个周期，再打开 tracemalloc 重跑同样多的周期统计内存分配
+    （tracemalloc 会拖慢执行，两轮分开）。每个周期分两段：
+      collect - extfrag.sample()：读表、计算指标、更新在线统计
+      draw    - extfrag_user.draw_frame()：格式化变化的行并刷新到终端
+    合成数据的更新不计入
+    """
+    import curses
+    from extfrag_user import draw_frame
+    from render import BarPanel, Frame, Viewport
+
+    from selfprof import Profiler
+
+    kernel = SyntheticKernel(config['nodes'], config['zones'], config['tasks'])
+    extfrag = synthetic_extfrag(kernel, output_count=(view == 'count'))
+    extfrag.profile = Profiler(enabled=config['profile'])
+    args = view_args(view)
+
+    def measure(screen):
+        frame, panel, viewport = Frame(screen, extfrag.profile), BarPanel(NR_ORDERS), Viewport()
+
+        def tick():
+            kernel.advance()
+            start = time.process_time_ns()
+            data = extfrag.sample()
+            collected = time.process_time_ns()
+            draw_frame(screen, frame, panel, viewport, extfrag, args, data)
+            return collected - start, time.process_time_ns() - collected
+
+        for _ in range(WARMUP_TICKS):
+            tick()
+        cpu = {stage: [] for stage in TICK_STAGES}
+        for _ in range(config['ticks']):
+            for stage, ns in zip(TICK_STAGES, tick()):
+                cpu[stage].append(ns)
+        stages = {name: stage.total_ns / 1000 / (WARMUP_TICKS + config['ticks'])
+                  for name, stage in sorted(extfrag.profile.stages.items())}
+
+        # 每段的峰值为该段执行期间新分配的最大字节数。刚打开 tracemalloc 时各种缓存还在逐步
+        # 换成受跟踪的对象，retained 只取后一半周期里占用内存的增长，持续为正说明每个周期都有泄漏
+        # 结果存入预先分配的数组，测量本身不在循环中占用新的内存
+        peak = {stage: np.zeros(config['ticks'], dtype=np.int64) for stage in TICK_STAGES}
+        half = config['ticks'] // 2
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        for i in range(config['ticks']):
+            if i == half:
+                base = tracemalloc.get_traced_memory()[0]
+            kernel.advance()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            data = extfrag.sample()
+            current, top = tracemalloc.get_traced_memory()
+            peak['collect'][i] = top - before
+            tracemalloc.reset_peak()
+            draw_frame(screen, frame, panel, viewport, extfrag, args, data)
+            peak['draw'][i] = tracemalloc.get_traced_memory()[1] - current
+        retained = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+
+        result = {'frames': WARMUP_TICKS + 2 * config['ticks']}
+        for stage in TICK_STAGES:
+            result[stage] = summarize_ns(cpu[stage])
+            result[stage]['peak_alloc_kb'] = float(np.median(peak[stage])) / 1024
+        total = [c + d for c, d in zip(cpu['collect'], cpu['draw'])]
+        result['tick'] = summarize_ns(total)
+        result['retained_bytes_per_tick'] = retained / max(config['ticks'] - half, 1)
+        if stages:
+            result['stages_us'] = stages
+        return result
+
+    result = curses.wrapper(measure)
+    os.write(fd, json.dumps(result).encode())
+
+
+def run_ticks_view(view, config):
+    """每个视图一个子进程，标准输入输出接到 cols x rows 的伪终端，同时统计写到终端的字节数"""
+    cols, rows = config['geometry']
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', rows, cols, 0, 0))
+    rfd, wfd = os.pipe()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '_ticks', view,
+                             json.dumps(config), str(wfd)],
+                            stdin=slave, stdout=slave, stderr=subprocess.PIPE, pass_fds=(wfd,),
+                            env=dict(os.environ, TERM='xterm-256color'), start_new_session=True)
+    os.close(slave)
+    os.close(wfd)
+    written = [0]
+
+    def drain():
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                # 子进程关闭终端后读到 EIO
+                break
+            if not data:
+                break
+            written[0] += len(data)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    with os.fdopen(rfd, 'rb') as f:
+        out = f.read()
+    err = proc.stderr.read().decode(errors='replace')
+    proc.wait()
+    reader.join()
+    os.close(master)
+    if proc.returncode != 0 or not out:
+        raise RuntimeError(f"ticks {view}: {err.strip() or proc.returncode}")
+    result = json.loads(out)
+    result['terminal_bytes_per_tick'] = written[0] / result.pop('frames')
+    return result
+
+
+def run_ticks(config):
+    return {view: run_ticks_view(view, config) for view in config['views']}
+
+
+def format_ticks(config, results, out):
+    cols, rows = config['geometry']
+    print(f"ticks nodes={config['nodes']} zones={config['zones']} tasks={config['tasks']} "
+          f"ticks={config['ticks']} terminal={cols}x{rows}", file=out)
+    print(f"{'VIEW':<8} {'COLLECT(us)':>11} {'P99':>8} {'DRAW(us)':>9} {'P99':>8} {'TICK(us)':>9} "
+          f"{'ALLOC(KB)':>10} {'RETAINED(B)':>11} {'TTY(B)':>8}", file=out)
+    for view, r in results.items():
+        print(f"{view:<8} {r['collect']['median_us']:>11.1f} {r['collect']['p99_us']:>8.1f} "
+              f"{r['draw']['median_us']:>9.1f} {r['draw']['p99_us']:>8.1f} {r['tick']['median_us']:>9.1f} "
+              f"{r['collect']['peak_alloc_kb'] + r['draw']['peak_alloc_kb']:>10.1f} "
+              f"{r['retained_bytes_per_tick']:>11.1f} {r['terminal_bytes_per_tick']:>8.0f}", file=out)
+        if 'stages_us' in r:
+            print(' ' * 9 + '  '.join(f"{name} {us:.1f}" for name, us in r['stages_us'].items()), file=out)
+
+
+PROBE_MODES = ('timer', 'kprobe', 'count', 'stall')
+
+
+def hpage_size():
+    try:
+        with open("/sys/kernel/mm/transparent_hugepage/hpage_pmd_size") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 2 << 20
+
+
+def fault_pages(pages, huge):
+    """
+    匿名映射中逐页写一个字节触发缺页，每次缺页分配一个页（huge 时为一个 PMD 大页），
+    返回 (每次分配的纳秒数, 每次分配的缺页次数)。写入由 NumPy 的跨步赋值完成，没有解释器开销
+    """
+    step = hpage_size() if huge else mmap.PAGESIZE
+    size = pages * step + (step if huge else 0)
+    mm = mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+    mm.madvise(mmap.MADV_HUGEPAGE if huge else mmap.MADV_NOHUGEPAGE)
+    buf = np.frombuffer(mm, dtype=np.uint8)
+    # 大页只在按大页对齐的地址上分配
+    offset = -buf.ctypes.data % step if huge else 0
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    start = time.perf_counter_ns()
+    buf[offset:offset + pages * step:step] = 1
+    elapsed = time.perf_counter_ns() - start
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+    del buf
+    mm.close()
+    return elapsed / pages, faults / pages
+
+
+def probes_child(mode, pages, runs, delay, huge):
+    """
+    不加载、加载、卸载后各跑 runs 次，基线取前后两轮，抵消运行期间的频率与内存状态漂移。
+    进程固定在 CPU 0 上：timer 模式的 cpu-clock 事件也挂在 CPU 0，其开销同样计入
+    """
+    from extfrag import ExtFrag
+    os.sched_setaffinity(0, {0})
+    fault_pages(pages, huge)
+    before = [fault_pages(pages, huge) for _ in range(runs)]
+    extfrag = ExtFrag(interval=delay, mode='kprobe' if mode == 'kprobe' else 'timer',
+                      output_count=(mode == 'count'), output_stall=(mode == 'stall'))
+    probed = [fault_pages(pages, huge) for _ in range(runs)]
+    extfrag.b.cleanup()
+    after = [fault_pages(pages, huge) for _ in range(runs)]
+    baseline = [ns for ns, _ in before + after]
+    with_probes = [ns for ns, _ in probed]
+    print(json.dumps({
+        'attached_mode': extfrag.mode,
+        'baseline_ns': statistics.median(baseline),
+        'probed_ns': statistics.median(with_probes),
+        'baseline_mean_ns': statistics.fmean(baseline),
+        'probed_mean_ns': statistics.fmean(with_probes),
+        'faults_per_alloc': statistics.fmean(f for _, f in before + probed + after),
+    }))
+
+
+def run_probes(modes, pages, runs, delay, huge):
+    results = {}
+    for mode in modes:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '_probes', mode,
+                               str(pages), str(runs), str(delay), str(int(huge))],
+                              capture_output=True, text=True)
+        if proc.returncode != 0 or not proc.stdout:
+            lines = proc.stderr.strip().splitlines()
+            raise RuntimeError(f"probes {mode}: {lines[-1] if lines else proc.returncode}")
+        r = json.loads(proc.stdout.splitlines()[-1])
+        r['added_ns'] = r['probed_ns'] - r['baseline_ns']
+        r['added_pct'] = r['added_ns'] * 100 / r['baseline_ns']
+        results[mode] = r
+    return results
+
+
+def format_probes(config, results, out):
+    unit = 'PMD page' if config['huge'] else 'page'
+    print(f"probes allocations={config['pages']} runs={config['runs']} delay={config['delay']:g}s "
+          f"per {unit}", file=out)
+    print(f"{'MODE':<7} {'BASE(ns)':>9} {'PROBED(ns)':>10} {'ADDED(ns)':>9} {'ADDED%':>7} "
+          f"{'BASE_MEAN':>9} {'PROBED_MEAN':>11} {'FAULTS':>6}", file=out)
+    for mode, r in results.items():
+        print(f"{mode:<7} {r['baseline_ns']:>9.0f} {r['probed_ns']:>10.0f} {r['added_ns']:>9.0f} "
+              f"{r['added_pct']:>6.1f}% {r['baseline_mean_ns']:>9.0f} {r['probed_mean_ns']:>11.0f} "
+              f"{r['faults_per_alloc']:>6.2f}", file=out)
+
+
+# verify 依次切换的视图：(名称, output_count, output_stall)，最后切回快照视图检查探针已卸下
+VERIFY_MODES = ('timer', 'kprobe')
+VERIFY_STEPS = (('zones', False, False), ('events', True, False), ('stall', False, True),
+                ('events+stall', True, True), ('zones', False, False))
+# 每一步切换后触发缺页的页数，让分配路径上的探针有机会运行
+VERIFY_PAGES = 4096
+
+
+def expected_probes(extfrag):
+    """当前开启的数据源应挂载的 (kprobe 与 kretprobe 数, tracepoint 数)"""
+    from extfrag import SOURCE_PROBES
+    kprobes = tracepoints = 0
+    for source in extfrag.enabled_sources():
+        if source == 'zones' and extfrag.mode == 'timer':
+            continue
+        for kind, _, _ in SOURCE_PROBES[source]:
+            if kind == 'tracepoint':
+                tracepoints += 1
+            else:
+                kprobes += 1
+    return kprobes, tracepoints
+
+
+def summarize_sample(view, data):
+    """采集结果的概要，结果不合理时抛出 ValueError"""
+    if view == 'zones':
+        free = sum(sum(orders) for orders in data.free_pages)
+        if not data.zones or not free:
+            raise ValueError(f"empty snapshot: {len(data.zones)} zones, {free} free pages")
+        return f"{len(data.zones)} zones, {free} free pages"
+    if view.startswith('events'):
+        tasks, _ = data
+        return f"{len(tasks)} tasks, {sum(task['count'] for task in tasks)} events"
+    slowpath = sum(stats['slowpath'] for stats in data['stats'].values())
+    return f"{slowpath} slowpath, {sum(data['compaction'].values())} compactions"
+
+
+def verify_child(mode, cached):
+    """在子进程中编译、加载并逐步切换数据源，每一步的结果写成一行 JSON"""
+    from extfrag import TIMER_TICK_NS, ExtFrag
+    result = {'mode': mode, 'steps': []}
+    start = time.perf_counter()
+    extfrag = ExtFrag(interval=1, mode=mode, bpf_cache=cached)
+    result['load_seconds'] = time.perf_counter() - start
+    result['attached_mode'] = extfrag.mode
+    result['hit'] = extfrag.program_cache is not None and extfrag.program_cache.hit
+    for view, output_count, output_stall in VERIFY_STEPS:
+        step = {'view': view}
+        try:
+            start = time.perf_counter()
+            extfrag.switch_source(output_count=output_count, output_stall=output_stall)
+            step['switch_seconds'] = time.perf_counter() - start
+            step['sources'] = sorted(extfrag.enabled_sources())
+            step['expected'] = expected_probes(extfrag)
+            step['attached'] = (extfrag.b.num_open_kprobes(), extfrag.b.num_open_tracepoints())
+            # 等一个 timer 周期并制造分配，再采集一次
+            extfrag.trigger()
+            fault_pages(VERIFY_PAGES, False)
+            time.sleep(2 * TIMER_TICK_NS / 1e9)
+            step['sample'] = summarize_sample(view, extfrag.sample())
+            step['ok'] = step['attached'] == step['expected']
+        except Exception as e:
+            # BCC 挂载失败时抛出的是 Exception
+            step['error'] = str(e)
+            step['ok'] = False
+        result['steps'].append(step)
+    extfrag.b.cleanup()
+    result['after_cleanup'] = (extfrag.b.num_open_kprobes(), extfrag.b.num_open_tracepoints())
+    result['ok'] = all(step['ok'] for step in result['steps']) and result['after_cleanup'] == (0, 0)
+    print(json.dumps(result))
+
+
+def run_verify(modes, cached):
+    results = {}
+    for mode in modes:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '_verify', mode, str(int(cached))],
+                              capture_output=True, text=True)
+        if proc.returncode != 0 or not proc.stdout:
+            # 编译或加载失败也是验证结果，记下错误继续验证其它模式
+            lines = proc.stderr.strip().splitlines()
+            results[mode] = {'mode': mode, 'ok': False, 'steps': [],
+                             'error': lines[-1] if lines else f"exit status {proc.returncode}"}
+            continue
+        results[mode] = json.loads(proc.stdout.splitlines()[-1])
+    return results
+
+
+def format_verify(config, results, out):
+    for mode, r in results.items():
+        if 'error' in r:
+            print(f"verify mode={mode}: FAILED to load: {r['error']}", file=out)
+            continue
+        cache = 'hit' if r['hit'] else ('miss' if config['cached'] else 'off')
+        print(f"verify mode={mode} attached={r['attached_mode']} load={r['load_seconds']:.3f}s "
+              f"cache={cache}", file=out)
+        print(f"  {'VIEW':<13} {'SOURCES':<20} {'KPROBES':>7} {'TRACEPOINTS':>11} {'SWITCH(ms)':>10}  RESULT",
+              file=out)
+        for step in r['steps']:
+            if 'error' in step:
+                print(f"  {step['view']:<13} FAILED: {step['error']}", file=out)
+                continue
+            (kprobes, tracepoints), (want_k, want_t) = step['attached'], step['expected']
+            result = step['sample'] if step['ok'] else f"MISMATCH, expected {want_k}/{want_t}"
+            print(f"  {step['view']:<13} {','.join(step['sources']):<20} {kprobes:>7} {tracepoints:>11} "
+                  f"{step['switch_seconds'] * 1000:>10.1f}  {result}", file=out)
+        left = r['after_cleanup']
+        print(f"  after cleanup: {left[0]} kprobes, {left[1]} tracepoints", file=out)
+        print(f"  {'OK' if r['ok'] else 'FAILED'}", file=out)
+
+
+def host_info():
+    return {
+        'time': time.time(),
+        'kernel': platform.release(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise ValueError(text)
+    return value
+
+
+def one_of(allowed):
+    def convert(text):
+        if text not in allowed:
+            raise ValueError(text)
+        return text
+    return convert
+
+
+def choices(allowed):
+    """逗号分隔、取自 allowed 的一个或多个值"""
+    def convert(text):
+        values = text.split(',')
+        if not all(v in allowed for v in values):
+            raise ValueError(text)
+        return values
+    return convert
+
+
+def geometry(text):
+    cols, _, rows = text.partition('x')
+    return positive_int(cols), positive_int(rows)
+
+
+def parse_options(args, options, values):
+    """
+    options 为 {选项: (键, 转换函数)}，转换函数为 None 的选项不带参数、出现即为 True。
+    结果写入 values（其中为默认值），有未知选项或参数不合法时返回 None
+    """
+    i = 0
+    while i < len(args):
+        if args[i] not in options:
+            return None
+        key, convert = options[args[i]]
+        if convert is None:
+            values[key] = True
+            i += 1
+            continue
+        if i + 1 >= len(args):
+            return None
+        try:
+            values[key] = convert(args[i + 1])
+        except ValueError:
+            return None
+        i += 2
+    return values
+
+
+def main(argv):
+    if argv and argv[0] == '_startup':
+        startup_child(argv[1], argv[2])
+        return 0
+    if argv and argv[0] == '_ticks':
+        ticks_child(argv[1], json.loads(argv[2]), int(argv[3]))
+        return 0
+    if argv and argv[0] == '_probes':
+        probes_child(argv[1], int(argv[2]), int(argv[3]), float(argv[4]), argv[5] == '1')
+        return 0
+    if argv and argv[0] == '_verify':
+        verify_child(argv[1], argv[2] == '1')
+        return 0
+    command = argv[0] if argv else None
+    if command == 'startup':
+        config = parse_options(argv[1:], {
+            '-m': ('mode', one_of(('timer', 'kprobe', 'count'))),
+            '-n': ('runs', positive_int),
+            '-j': ('json', None),
+        }, {'mode': 'timer', 'runs': 5, 'json': False})
+    elif command == 'ticks':
+        config = parse_options(argv[1:], {
+            '-N': ('nodes', positive_int),
+            '-Z': ('zones', positive_int),
+            '-T': ('tasks', positive_int),
+            '-n': ('ticks', positive_int),
+            '-g': ('geometry', geometry),
+            '-v': ('views', choices(TICK_VIEWS)),
+            '-p': ('profile', None),
+            '-j': ('json', None),
+        }, {'nodes': 2, 'zones': 3, 'tasks': TASK_ENTRIES, 'ticks': 200, 'geometry': (250, 50),
+            'views': list(TICK_VIEWS), 'profile': False, 'json': False})
+    elif command == 'probes':
+        config = parse_options(argv[1:], {
+            '-m': ('modes', choices(PROBE_MODES)),
+            '-P': ('pages', positive_int),
+            '-n': ('runs', positive_int),
+            '-d': ('delay', float),
+            '-H': ('huge', None),
+            '-j': ('json', None),
+        }, {'modes': list(PROBE_MODES), 'pages': 65536, 'runs': 5, 'delay': 2.0,
+            'huge': False, 'json': False})
+    elif command == 'verify':
+        config = parse_options(argv[1:], {
+            '-m': ('modes', choices(VERIFY_MODES)),
+            '-c': ('cached', None),
+            '-j': ('json', None),
+        }, {'modes': list(VERIFY_MODES), 'cached': False, 'json': False})
+    else:
+        config = None
+    if config is None:
+        print(USAGE, file=sys.stderr)
+        return 2
+
+    as_json = config.pop('json')
+    if command in ('probes', 'verify') and os.geteuid() != 0:
+        print(f"[ERROR] bench.py {command} requires root", file=sys.stderr)
+        return 1
+    try:
+        if command == 'startup':
+            results = run_startup(config['mode'], config['runs'])
+        elif command == 'ticks':
+            results = run_ticks(config)
+        elif command == 'verify':
+            results = run_verify(config['modes'], config['cached'])
+        else:
+            results = run_probes(config['modes'], config['pages'], config['runs'],
+                                 config['delay'], config['huge'])
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    if as_json:
+        json.dump({'host': host_info(), command: dict(config, results=results)}, sys.stdout, indent=2)
+        print()
+    elif command == 'startup':
+        format_startup(config['mode'], results, sys.stdout)
+    elif command == 'ticks':
+        format_ticks(config, results, sys.stdout)
+    elif command == 'verify':
+        format_verify(config, results, sys.stdout)
+    else:
+        format_probes(config, results, sys.stdout)
+    if command == 'verify' and not all(r['ok'] for r in results.values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # eBPF 源码按相对路径 ./bpf/ 加载
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,168 @@
+// 慢速路径分配与内存规整数据源，拼接在 common.h 之后
+
+// log2(微秒) 桶，与 BCC 的 log2 直方图一致：桶 i 覆盖 [2^(i-1), 2^i)，
+// 最后一个桶收纳更长的延迟
+#define NR_SLOTS 32
+#define LAT_SLOTS (MAX_NR_ZONES * NR_ORDERS * NR_SLOTS)
+// 同时处于慢速路径 / 内存规整中的线程数上限
+#define MAX_INFLIGHT 10240
+
+// 按 order 计数的事件，stat_map 下标为 item * NR_ORDERS + order
+enum stall_item {
+  STALL_SLOWPATH,
+  STALL_SLOWPATH_FAIL,
+  STALL_ALLOC_FAIL,
+  STALL_KCOMPACTD_WAKE,
+  NR_STALL_ITEMS,
+};
+
+// mm_compaction_end 的结果分类
+enum compact_item {
+  CSTAT_SUCCESS,
+  CSTAT_FAIL,
+  CSTAT_SKIPPED,
+  NR_CSTATS,
+};
+
+struct stall_start {
+  u64 ts;
+  u32 order;
+  u32 zidx;
+};
+
+struct zone_name {
+  char name[16];
+};
+
+BPF_HASH(start_map, u32, struct stall_start, MAX_INFLIGHT);
+BPF_HASH(compact_start_map, u32, u64, MAX_INFLIGHT);
+// 慢速路径延迟，按 [zone][order][slot] 计数，zone 为首选 zone 的类型下标
+BPF_PERCPU_ARRAY(lat_hist, u64, LAT_SLOTS);
+BPF_PERCPU_ARRAY(stat_map, u64, NR_STALL_ITEMS * NR_ORDERS);
+BPF_PERCPU_ARRAY(compact_map, u64, NR_CSTATS);
+BPF_PERCPU_ARRAY(compact_hist, u64, NR_SLOTS);
+// zone 类型下标对应的名字，第一次遇到时填写
+BPF_ARRAY(zone_name_map, struct zone_name, MAX_NR_ZONES);
+
+static void count_stat(u32 item, u32 order) {
+  u32 idx = item * NR_ORDERS + order;
+  u64 *value;
+  if (order >= NR_ORDERS)
+    return;
+  value = stat_map.lookup(&idx);
+  if (value)
+    (*value)++;
+}
+
+static u32 latency_slot(u64 start) {
+  u32 slot = bpf_log2l((bpf_ktime_get_ns() - start) / 1000);
+  return slot < NR_SLOTS ? slot : NR_SLOTS - 1;
+}
+
+int trace_slowpath_entry(struct pt_regs *ctx, gfp_t gfp_mask,
+                         unsigned int order, struct alloc_context *ac) {
+  u32 tid = bpf_get_current_pid_tgid();
+  struct stall_start start = {};
+  struct zoneref *zref = NULL;
+  struct zone *z = NULL;
+  struct zone_name *zn;
+  const char *name = NULL;
+
+  if (order >= NR_ORDERS || !source_enabled(SOURCE_STALL))
+    return 0;
+  start.ts = bpf_ktime_get_ns();
+  start.order = order;
+  bpf_probe_read_kernel(&zref, sizeof(zref), &ac->preferred_zoneref);
+  if (zref) {
+    bpf_probe_read_kernel(&start.zidx, sizeof(start.zidx), &zref->zone_idx);
+    bpf_probe_read_kernel(&z, sizeof(z), &zref->zone);
+  }
+  if (start.zidx >= MAX_NR_ZONES)
+    start.zidx = 0;
+  zn = zone_name_map.lookup(&start.zidx);
+  if (zn && z && !zn->name[0]) {
+    bpf_probe_read_kernel(&name, sizeof(name), &z->name);
+    bpf_probe_read_kernel_str(&zn->name, sizeof(zn->name), name);
+  }
+  start_map.update(&tid, &start);
+  count_stat(STALL_SLOWPATH, order);
+  return 0;
+}
+
+int trace_slowpath_return(struct pt_regs *ctx) {
+  u32 tid = bpf_get_current_pid_tgid();
+  struct stall_start *start = start_map.lookup(&tid);
+  u64 *value;
+  u32 idx;
+
+  if (!start)
+    return 0;
+  idx = (start->zidx * NR_ORDERS + start->order) * NR_SLOTS +
+        latency_slot(start->ts);
+  value = lat_hist.lookup(&idx);
+  if (value)
+    (*value)++;
+  // 返回 NULL 表示慢速路径也没能分配到页
+  if (!PT_REGS_RC(ctx))
+    count_stat(STALL_SLOWPATH_FAIL, start->order);
+  start_map.delete(&tid);
+  return 0;
+}
+
+TRACEPOINT_PROBE(compaction, mm_compaction_begin) {
+  u32 tid = bpf_get_current_pid_tgid();
+  u64 ts = bpf_ktime_get_ns();
+  if (!source_enabled(SOURCE_STALL))
+    return 0;
+  compact_start_map.update(&tid, &ts);
+  return 0;
+}
+
+TRACEPOINT_PROBE(compaction, mm_compaction_end) {
+  u32 tid = bpf_get_current_pid_tgid();
+  u64 *ts = compact_start_map.lookup(&tid);
+  u64 *value;
+  u32 idx;
+
+  if (!source_enabled(SOURCE_STALL))
+    return 0;
+  switch (args->status) {
+  case COMPACT_SUCCESS:
+    idx = CSTAT_SUCCESS;
+    break;
+  case COMPACT_SKIPPED:
+  case COMPACT_DEFERRED:
+  case COMPACT_NOT_SUITABLE_ZONE:
+    idx = CSTAT_SKIPPED;
+    break;
+  default:
+    idx = CSTAT_FAIL;
+  }
+  value = compact_map.lookup(&idx);
+  if (value)
+    (*value)++;
+
+  if (ts) {
+    idx = latency_slot(*ts);
+    value = compact_hist.lookup(&idx);
+    if (value)
+      (*value)++;
+    compact_start_map.delete(&tid);
+  }
+  return 0;
+}
+
+TRACEPOINT_PROBE(compaction, mm_compaction_kcompactd_wake) {
+  if (!source_enabled(SOURCE_STALL))
+    return 0;
+  count_stat(STALL_KCOMPACTD_WAKE, args->order);
+  return 0;
+}
+
+// 每次分配都会触发，成功的分配立即返回
+TRACEPOINT_PROBE(kmem, mm_page_alloc) {
+  if (args->pfn != -1UL || !source_enabled(SOURCE_STALL))
+    return 0;
+  count_stat(STALL_ALLOC_FAIL, args->order);
+  return 0;
+}
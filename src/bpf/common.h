@@ -0,0 +1,68 @@
+// 各数据源共用的头文件、常量、开关表与采样门限。
+// extfrag.py 把本文件与 fraginfo.c、extfraginfo.c、allocstall.c 拼接成一个程序，只编译、加载一次
+#include <linux/compaction.h>
+#include <linux/gfp.h>
+#include <linux/mm.h>
+#include <linux/mmzone.h>
+#include <linux/sched.h>
+#include <linux/version.h>
+#include <uapi/linux/bpf_perf_event.h>
+#include <uapi/linux/ptrace.h>
+
+#ifndef NR_NODES
+#define NR_NODES 1
+#endif
+
+#define MAX_ORDER 10
+
+#define NR_ORDERS (MAX_ORDER + 1)
+
+struct alloc_context {
+  struct zonelist *zonelist;
+  nodemask_t *nodemask;
+  struct zoneref *preferred_zoneref;
+  int migratetype;
+  enum zone_type highest_zoneidx;
+  bool spread_dirty_pages;
+};
+
+// 数据源，与 extfrag.py 中的 SOURCES 一致
+enum source {
+  SOURCE_ZONES,
+  SOURCE_EVENTS,
+  SOURCE_STALL,
+  NR_SOURCES,
+};
+
+// 每个数据源的开关，用户态按当前视图随时修改，切换视图无需重新加载程序
+BPF_ARRAY(source_map, u32, NR_SOURCES);
+// 上一次采样的时间戳，只有一个槽位，内存占用固定
+BPF_ARRAY(last_time_map, u64, 1);
+BPF_ARRAY(delay_map, int, 1);
+
+static int source_enabled(u32 source) {
+  u32 *enabled = source_map.lookup(&source);
+  return enabled && *enabled;
+}
+
+// 采样频率门限：距离上一次采样不足 delay 毫秒时直接返回，O(1) 开销。
+// delay_map 可由用户态随时修改，自适应采样无需重新加载程序。
+// kprobe 模式下多个 CPU 可能同时通过时间判断，用比较并交换抢占本周期，只有成功的一方扫描
+static int sample_due(void) {
+  int key = 0;
+  u64 current_time = bpf_ktime_get_ns();  // 获取当前时间
+  u64 *last_time = last_time_map.lookup(&key);
+  int *delay_ptr = delay_map.lookup(&key);
+  if (!last_time || !delay_ptr)
+    return 0;
+  u64 prev = *last_time;
+  if (prev && current_time - prev < (u64)*delay_ptr * 1000000ULL)
+    return 0;
+#if LINUX_VERSION_CODE >= KERNEL_VERSION(5, 12, 0)
+  return __sync_val_compare_and_swap(last_time, prev, current_time) == prev;
+#else
+  // 5.12 之前的内核没有 BPF_CMPXCHG，timer 模式只在 CPU 0 上运行，不受影响
+  *last_time = current_time;
+  return 1;
+#endif
+}
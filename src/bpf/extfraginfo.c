@@ -1,34 +1,51 @@
+// 外碎片化事件数据源：按进程与 (order, fallback order, migratetype) 计数，拼接在 common.h 之后
 
-#include <linux/gfp.h>
-#include <linux/mm.h>
-#include <linux/sched.h>
-#include <uapi/linux/ptrace.h>
+// 覆盖所有内核配置下的 MIGRATE_TYPES
+#define NR_MIGRATETYPES 8
+#define HIST_SLOTS (NR_ORDERS * NR_ORDERS * NR_MIGRATETYPES * 2)
+// 每个进程一项，按 LRU 淘汰，fork 频繁的主机上内存占用也是固定的。
+// 表满后淘汰最久没有事件的进程，用户态看到的是最近活跃的进程，不是全局事件最多的前 TASK_ENTRIES 个；
+// 被淘汰的进程再次出现时从 1 重新计数
+#define TASK_ENTRIES 4096
 
+// count 为累计值，last_* 只是该进程最近一次事件的值，按 (order, fallback order) 的分布见 hist_map
 struct data_t {
-  u64 pfn;
-  int alloc_order;
-  int fallback_order;
+  u64 last_pfn;
+  int last_alloc_order;
+  int last_fallback_order;
   pid_t pid;
   u64 count;
   char pcomm[32];
 };
 
-BPF_HASH(counts_map, pid_t, struct data_t);
-BPF_HASH(last_time_map, u64, u64);
-BPF_ARRAY(delay_map, int, 1);
+BPF_TABLE("lru_hash", pid_t, struct data_t, counts_map, TASK_ENTRIES);
+// 按 (alloc_order, fallback_order, alloc_migratetype, change_ownership) 计数，
+// 每个 CPU 一份，没有跨核竞争，用户态每个周期汇总一次
+BPF_PERCPU_ARRAY(hist_map, u64, HIST_SLOTS);
+// 事件总数，每个 CPU 一份。用户态每个周期只读这一项，按事件速率触发高频捕获（见 trigger.py）
+BPF_PERCPU_ARRAY(event_total, u64, 1);
 
 TRACEPOINT_PROBE(kmem, mm_page_alloc_extfrag) {
-  u64 *last_time, current_time;
-  current_time = bpf_ktime_get_ns();  // 获取当前时间
-  last_time = last_time_map.lookup(&current_time);
-  int key = 0;
-  int *delay_ptr = delay_map.lookup(&key);
-  int delay;
-  if (delay_ptr) {
-    delay = *delay_ptr;
-  }
-  if (last_time && (current_time - *last_time < delay * 1000000000)) {
+  u32 alloc_order = args->alloc_order;
+  u32 fallback_order = args->fallback_order;
+  u32 migratetype = args->alloc_migratetype;
+  u32 change_ownership = args->change_ownership ? 1 : 0;
+
+  if (!source_enabled(SOURCE_EVENTS))
     return 0;
+
+  u32 total_key = 0;
+  u64 *total = event_total.lookup(&total_key);
+  if (total)
+    (*total)++;
+
+  if (alloc_order < NR_ORDERS && fallback_order < NR_ORDERS &&
+      migratetype < NR_MIGRATETYPES) {
+    u32 slot = ((alloc_order * NR_ORDERS + fallback_order) * NR_MIGRATETYPES +
+                migratetype) * 2 + change_ownership;
+    u64 *hist = hist_map.lookup(&slot);
+    if (hist)
+      (*hist)++;
   }
 
   struct data_t *data, zero = {};
@@ -39,20 +56,18 @@ TRACEPOINT_PROBE(kmem, mm_page_alloc_extfrag) {
   if (!data) {
     // 如果没有对应PID的数据，初始化一个新的结构体
     zero.pid = pid;
-    zero.pfn = args->pfn;
-    zero.alloc_order = args->alloc_order;
-    zero.fallback_order = args->fallback_order;
+    zero.last_pfn = args->pfn;
+    zero.last_alloc_order = args->alloc_order;
+    zero.last_fallback_order = args->fallback_order;
     zero.count = 1;
     bpf_get_current_comm(&zero.pcomm, sizeof(zero.pcomm));
     counts_map.update(&pid, &zero);
   } else {
-    // 如果找到了，更新结构体中的计数
-    data->count += 1;
-    data->pfn = args->pfn;
-    data->alloc_order = args->alloc_order;
-    data->fallback_order = args->fallback_order;
-    bpf_get_current_comm(&data->pcomm, sizeof(data->pcomm));
-    counts_map.update(&pid, data);
+    // 同一进程的多个线程可能在不同 CPU 上同时更新
+    lock_xadd(&data->count, 1);
+    data->last_pfn = args->pfn;
+    data->last_alloc_order = args->alloc_order;
+    data->last_fallback_order = args->fallback_order;
   }
 
   return 0;
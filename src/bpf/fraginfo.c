@@ -1,168 +1,132 @@
-#include <linux/gfp.h>
-#include <linux/mm.h>
-#include <linux/mmzone.h>
-#include <uapi/linux/ptrace.h>
+// zone 数据源：按 delay_map 间隔扫描所有 zone 各 order 的 nr_free，拼接在 common.h 之后
 
-#define MAX_ORDER 10
+// 定长表的槽位数：[node] / [node][zone]
+#define NR_ZONE_SLOTS (NR_NODES * MAX_NR_ZONES)
 
 struct pgdat_info {
-  u64 pgdat_ptr;
+  u64 node_start_pfn;
   int nr_zones;
   int node_id;
 };
 
-struct zone_info {
-  u64 zone_ptr;
+// zone 的静态信息，按 [node][zone] 存放，present_pages 为 0 表示槽位未使用
+struct zone_meta {
   u64 zone_start_pfn;
   u64 spanned_pages;
   u64 present_pages;
-  unsigned long free_pages;
-  unsigned long free_blocks_total;
-  unsigned long free_blocks_suitable;
-  char name[32];
-  int order;
-  int score_a;
-  int score_b;
-  int node_id;
-};
-struct alloc_context {
-  struct zonelist *zonelist;
-  nodemask_t *nodemask;
-  struct zoneref *preferred_zoneref;
-  int migratetype;
-  enum zone_type highest_zoneidx;
-  bool spread_dirty_pages;
+  char name[16];
 };
 
-struct contig_page_info {
-  unsigned long free_pages;
-  unsigned long free_blocks_total;
-  unsigned long free_blocks_suitable;
+// 每个 zone 只导出各 order 的 nr_free 原始计数，指标由用户态计算
+struct zone_free {
+  u64 nr_free[NR_ORDERS];
 };
 
-BPF_HASH(pgdat_map, u64, struct pgdat_info);
-BPF_HASH(zone_map, u64, struct zone_info);
-BPF_HASH(last_time_map, u64, u64);
-BPF_ARRAY(delay_map, int, 1);
-
-static int unusable_free_index(unsigned int order,
-                               struct contig_page_info *info) {
-  if (info->free_pages == 0)
-    return 1000;
-  return div_u64(
-      (info->free_pages - (info->free_blocks_suitable << order)) * 1000ULL,
-      info->free_pages);
-}
-
-static int __fragmentation_index(unsigned int order,
-                                 struct contig_page_info *info) {
-  unsigned long requested = 1UL << order;
-  if (WARN_ON_ONCE(order > MAX_ORDER))
-    return 0;
-  if (!info->free_blocks_total)
-    return 0;
-  if (info->free_blocks_suitable)
-    return -1000;
-  return 1000 -
-         div_u64((1000 + (div_u64(info->free_pages * 1000ULL, requested))),
-                 info->free_blocks_total);
-}
+// 全部是定长数组：下标由 node/zone 直接算出，没有哈希与动态分配，
+// 用户态一次批量读取即可按下标还原整张矩阵
+BPF_ARRAY(pgdat_map, struct pgdat_info, NR_NODES);
+BPF_ARRAY(zone_meta_map, struct zone_meta, NR_ZONE_SLOTS);
+BPF_ARRAY(zone_map, struct zone_free, NR_ZONE_SLOTS);
+
+static void scan_zone(struct zone *z, u32 zidx) {
+  struct pglist_data *pgdat = NULL;
+  struct pgdat_info *node;
+  struct zone_meta *meta;
+  struct zone_free *free;
+  const char *name = NULL;
+  u32 nid = 0, slot, order;
+
+  bpf_probe_read_kernel(&pgdat, sizeof(pgdat), &z->zone_pgdat);
+  if (!pgdat)
+    return;
+  bpf_probe_read_kernel(&nid, sizeof(nid), &pgdat->node_id);
+  if (nid >= NR_NODES || zidx >= MAX_NR_ZONES)
+    return;
+
+  // 节点信息只在第一次见到该节点时填写
+  node = pgdat_map.lookup(&nid);
+  if (node && !node->nr_zones) {
+    bpf_probe_read_kernel(&node->node_start_pfn, sizeof(u64),
+                          &pgdat->node_start_pfn);
+    bpf_probe_read_kernel(&node->nr_zones, sizeof(int), &pgdat->nr_zones);
+    node->node_id = nid;
+  }
 
-static void fill_contig_page_info(struct zone *zone,
-                                  unsigned int suitable_order,
-                                  struct contig_page_info *info) {
-  unsigned int order;
-  info->free_pages = 0;
-  info->free_blocks_total = 0;
-  info->free_blocks_suitable = 0;
-  for (order = 0; order <= MAX_ORDER; order++) {
-    unsigned long blocks;
-    unsigned long nr_free;
-    bpf_probe_read_kernel(&nr_free, sizeof(nr_free),
-                          &zone->free_area[order].nr_free);
-    blocks = nr_free;
-    info->free_blocks_total += blocks;
-    info->free_pages += blocks << order;
-    if (order >= suitable_order)
-      info->free_blocks_suitable += blocks << (order - suitable_order);
+  slot = nid * MAX_NR_ZONES + zidx;
+  meta = zone_meta_map.lookup(&slot);
+  if (!meta)
+    return;
+  if (!meta->name[0]) {
+    bpf_probe_read_kernel(&name, sizeof(name), &z->name);
+    bpf_probe_read_kernel_str(&meta->name, sizeof(meta->name), name);
   }
+  // 内存热插拔会改变 zone 的大小，每次扫描都刷新
+  bpf_probe_read_kernel(&meta->zone_start_pfn, sizeof(u64),
+                        &z->zone_start_pfn);
+  bpf_probe_read_kernel(&meta->spanned_pages, sizeof(u64), &z->spanned_pages);
+  bpf_probe_read_kernel(&meta->present_pages, sizeof(u64), &z->present_pages);
+
+  // 每个 order 一次读取，共 NR_ORDERS 次
+  free = zone_map.lookup(&slot);
+  if (!free)
+    return;
+  for (order = 0; order < NR_ORDERS; ++order)
+    bpf_probe_read_kernel(&free->nr_free[order], sizeof(u64),
+                          &z->free_area[order].nr_free);
 }
 
-int kprobe__get_page_from_freelist(struct pt_regs *ctx, gfp_t gfp_mask,
-                                   unsigned int order, int alloc_flags,
-                                   const struct alloc_context *ac) {
-  u64 *last_time, current_time;
-  current_time = bpf_ktime_get_ns();  // 获取当前时间
-  last_time = last_time_map.lookup(&current_time);
-  int key = 0;
-  int *delay_ptr = delay_map.lookup(&key);
-  int delay;
-  if (delay_ptr) {
-    delay = *delay_ptr;
-  }
-  if (last_time && (current_time - *last_time < delay * 1000000000)) {
+// kprobe 模式：在分配路径上按门限采样。首选节点的 fallback zonelist
+// 包含所有节点上有内存的 zone，因此同样覆盖全部在线节点
+int trace_get_page_from_freelist(struct pt_regs *ctx, gfp_t gfp_mask,
+                                 unsigned int order, int alloc_flags,
+                                 const struct alloc_context *ac) {
+  if (!source_enabled(SOURCE_ZONES) || !sample_due())
     return 0;
-  }
 
   struct pglist_data *pgdat;
-  struct zone *z;
   struct zoneref *zref;
-  int i, tmp, index, res;
-  unsigned int a_order;
-  
+  struct zone *z;
+  int i;
+
   pgdat = ac->preferred_zoneref->zone->zone_pgdat;
 
-  for (i = 0; i < MAX_NR_ZONES; i++) {
-    struct zone_info zone_data = {};
-    struct pgdat_info pgdat_data = {};
-    struct pgdat_info *a_pgdat;
-    struct pglist_data *pgdata;
-    u64 node_key, zone_key;
+  for (i = 0; i < NR_ZONE_SLOTS; i++) {
     zref = &pgdat->node_zonelists[ZONELIST_FALLBACK]._zonerefs[i];
     z = zref->zone;
     if (!z)
-      continue;
+      break;
+    scan_zone(z, zref->zone_idx);
+  }
+  return 0;
+}
+
+#if defined(NODE_DATA_ADDR) || defined(CONTIG_PAGE_DATA_ADDR)
+// timer 模式：由单个 CPU 上的 cpu-clock 事件周期触发，遍历所有在线节点，
+// 分配路径上没有任何探针
+int sample_zones(struct bpf_perf_event_data *ctx) {
+  if (!source_enabled(SOURCE_ZONES) || !sample_due())
+    return 0;
 
-    // 更新node信息
-    pgdata = z->zone_pgdat;
-    if (!pgdata)
+  int nid, i;
+  for (nid = 0; nid < NR_NODES; nid++) {
+    struct pglist_data *pgdat = NULL;
+#ifdef NODE_DATA_ADDR
+    bpf_probe_read_kernel(&pgdat, sizeof(pgdat),
+                          (void *)(NODE_DATA_ADDR + nid * sizeof(void *)));
+#else
+    pgdat = (struct pglist_data *)CONTIG_PAGE_DATA_ADDR;
+#endif
+    if (!pgdat)
       continue;
-    node_key = (u64)pgdata;
-    a_pgdat = pgdat_map.lookup(&node_key);
-    if (!a_pgdat) {
-      pgdat_data.pgdat_ptr = (u64)pgdata->node_start_pfn;
-      pgdat_data.nr_zones = pgdata->nr_zones;
-      pgdat_data.node_id = pgdata->node_id;
-      pgdat_map.update(&node_key, &pgdat_data);
-    }
-    // 更新zone信息
-    zone_data.zone_ptr = (u64)z;
-
-    zone_data.zone_start_pfn = z->zone_start_pfn;
-    zone_data.spanned_pages = z->spanned_pages;
-    zone_data.present_pages = z->present_pages;
-    zone_data.node_id = z->zone_pgdat->node_id;
-    bpf_probe_read_kernel_str(&zone_data.name, sizeof(zone_data.name), z->name);
-
-    for (a_order = 0; a_order <= MAX_ORDER; ++a_order) {
-      zone_data.order = a_order;
-      zone_key = zone_data.zone_ptr + zone_data.order;
-
-      struct contig_page_info ctg_info;
-      fill_contig_page_info(z, a_order, &ctg_info);
-      zone_data.free_blocks_suitable = ctg_info.free_blocks_suitable;
-      zone_data.free_blocks_total = ctg_info.free_blocks_total;
-      zone_data.free_pages = ctg_info.free_pages;
-
-      tmp = unusable_free_index(a_order, &ctg_info);
-      zone_data.score_b = tmp;
-      index = __fragmentation_index(a_order, &ctg_info);
-      zone_data.score_a = index;
-
-      zone_map.update(&zone_key, &zone_data);
-      zone_key++;
+    for (i = 0; i < MAX_NR_ZONES; i++) {
+      struct zone *z = &pgdat->node_zones[i];
+      unsigned long present = 0;
+      bpf_probe_read_kernel(&present, sizeof(present), &z->present_pages);
+      if (!present)
+        continue;
+      scan_zone(z, i);
     }
   }
-  last_time_map.update(&current_time, &current_time);
   return 0;
-}
\ No newline at end of file
+}
+#endif
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+import atexit
+import ctypes as ct
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from bpfcc import BPF, __version__ as BCC_VERSION
+from bpfcc.libbcc import lib
+from bpfcc.utils import get_possible_cpus
+
+# 已加载的程序与表固定在 bpffs 上，进程退出后仍留在内核中，重启后自动消失
+PIN_ROOT = "/sys/fs/bpf/pilotgo-mfd"
+# 表的类型描述（键/值的 ctypes 布局）等元数据，不能放在 bpffs 上
+META_ROOT = "/var/cache/pilotgo-mfd"
+
+BPF_MAP_TYPE_HASH = 1
+BPF_MAP_TYPE_ARRAY = 2
+BPF_MAP_TYPE_PERCPU_HASH = 5
+BPF_MAP_TYPE_PERCPU_ARRAY = 6
+BPF_MAP_TYPE_LRU_HASH = 9
+BPF_MAP_TYPE_LRU_PERCPU_HASH = 10
+ARRAY_TYPES = (BPF_MAP_TYPE_ARRAY, BPF_MAP_TYPE_PERCPU_ARRAY)
+PERCPU_TYPES = (BPF_MAP_TYPE_PERCPU_HASH, BPF_MAP_TYPE_PERCPU_ARRAY,
+                BPF_MAP_TYPE_LRU_PERCPU_HASH)
+# 编译参数中的内核符号地址（-DNODE_DATA_ADDR= 等），KASLR 下每次启动都会变化
+ADDRESS_FLAG = re.compile(r'-D\w+_ADDR=')
+BPF_PROBE_ENTRY = 0
+BPF_PROBE_RETURN = 1
+
+lib.bpf_num_tables.restype = ct.c_ulonglong
+lib.bpf_num_tables.argtypes = [ct.c_void_p]
+lib.bpf_table_name.restype = ct.c_char_p
+lib.bpf_table_name.argtypes = [ct.c_void_p, ct.c_ulonglong]
+
+
+def kernel_config():
+    """当前内核的配置文本，找不到时返回空串"""
+    release = os.uname().release
+    for path in (f"/boot/config-{release}", f"/lib/modules/{release}/config"):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+    try:
+        with gzip.open("/proc/config.gz") as f:
+            return f.read()
+    except OSError:
+        return b''
+
+
+def cache_key(text, cflags=None):
+    """
+    由内核版本、内核配置、BPF 源码、编译参数与 BCC 版本共同决定。
+    符号地址不计入，同一内核每次启动都对应同一个缓存项；地址记录在元数据中，由 load() 核对
+    """
+    h = hashlib.sha256()
+    h.update(os.uname().release.encode())
+    h.update(kernel_config())
+    h.update(text.encode())
+    for flag in cflags or ():
+        if not ADDRESS_FLAG.match(flag):
+            h.update(b'\0' + flag.encode())
+    h.update(BCC_VERSION.encode())
+    return h.hexdigest()[:16]
+
+
+def try_lock(path):
+    """以非阻塞方式独占 path 上的文件锁，返回持有锁的文件对象，失败时返回 None"""
+    try:
+        lock = open(path, 'a')
+    except OSError:
+        return None
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+class PinnedTable:
+    """
+    通过固定路径打开的 BPF 表，提供 extfrag.py 用到的那部分 BCC 表接口：
+    下标读写、items()、len()。per-CPU 表的值是每个 CPU 一项的数组
+    """
+    def __init__(self, fd, map_type, max_entries, keytype, leaftype):
+        self.map_fd = fd
+        self.map_type = map_type
+        self.max_entries = max_entries
+        self.Key = keytype
+        self.Leaf = leaftype
+        if map_type in PERCPU_TYPES:
+            if ct.sizeof(leaftype) % 8:
+                raise ValueError("per-cpu leaf size must be a multiple of 8")
+            self.Leaf = leaftype * len(get_possible_cpus())
+
+    def _key(self, key):
+        return key if isinstance(key, self.Key) else self.Key(key)
+
+    def __getitem__(self, key):
+        leaf = self.Leaf()
+        if lib.bpf_lookup_elem(self.map_fd, ct.byref(self._key(key)), ct.byref(leaf)) < 0:
+            raise KeyError(key)
+        return leaf
+
+    def __setitem__(self, key, leaf):
+        if lib.bpf_update_elem(self.map_fd, ct.byref(self._key(key)), ct.byref(leaf), 0) < 0:
+            raise OSError(ct.get_errno(), f"bpf_update_elem failed for key {key}")
+
+    def __len__(self):
+        if self.map_type in ARRAY_TYPES:
+            return self.max_entries
+        return sum(1 for _ in self.keys())
+
+    def keys(self):
+        if self.map_type in ARRAY_TYPES:
+            for i in range(self.max_entries):
+                yield self.Key(i)
+            return
+        key = self.Key()
+        next_key = self.Key()
+        if lib.bpf_get_first_key(self.map_fd, ct.byref(next_key), ct.sizeof(next_key)) < 0:
+            return
+        while True:
+            yield next_key
+            key = next_key
+            next_key = self.Key()
+            if lib.bpf_get_next_key(self.map_fd, ct.byref(key), ct.byref(next_key)) < 0:
+                return
+
+    def items(self):
+        ret = []
+        for key in self.keys():
+            try:
+                ret.append((key, self[key]))
+            except KeyError:
+                # 哈希表在遍历期间被内核删除的项
+                pass
+        return ret
+
+    def clear(self):
+        """数组表清零，哈希表删除全部项"""
+        if self.map_type in ARRAY_TYPES:
+            zero = self.Leaf()
+            for key in self.keys():
+                self[key] = zero
+        else:
+            for key in list(self.keys()):
+                lib.bpf_delete_elem(self.map_fd, ct.byref(key))
+
+
+class CachedBPF:
+    """
+    由缓存的固定对象构造，接口与 BCC 的 BPF 对象中 extfrag.py 用到的部分一致。
+    与 BCC 相同，名为 tracepoint__<category>__<event> 的程序在构造时自动挂载
+    """
+    def __init__(self, pin_dir, meta):
+        self.tables = {}
+        self.progs = {}
+        self.kprobes = {}
+        self.tracepoints = {}
+        self.perf_fds = []
+        for name, desc in meta['maps'].items():
+            fd = lib.bpf_obj_get(os.path.join(pin_dir, f"map.{name}").encode())
+            if fd < 0:
+                raise OSError(ct.get_errno(), f"cannot open pinned map {name}")
+            keytype = BPF._decode_table_type(json.loads(desc['key']))
+            leaftype = BPF._decode_table_type(json.loads(desc['leaf']))
+            self.tables[name] = PinnedTable(fd, desc['type'], desc['max_entries'],
+                                            keytype, leaftype)
+        for name in meta['progs']:
+            fd = lib.bpf_obj_get(os.path.join(pin_dir, f"prog.{name}").encode())
+            if fd < 0:
+                raise OSError(ct.get_errno(), f"cannot open pinned program {name}")
+            self.progs[name] = fd
+        # 复用的表里还留着上一次运行的数据
+        for table in self.tables.values():
+            table.clear()
+        try:
+            for name in self.progs:
+                if name.startswith("tracepoint__"):
+                    category, event = name[len("tracepoint__"):].split("__", 1)
+                    self.attach_tracepoint(tp=f"{category}:{event}", fn_name=name)
+        except OSError:
+            # 调用方会改为重新编译，不能留下已挂载的缓存程序
+            self.cleanup()
+            raise
+        atexit.register(self.cleanup)
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def attach_kprobe(self, event, fn_name):
+        self._attach_probe("p_", BPF_PROBE_ENTRY, event, fn_name)
+
+    def attach_kretprobe(self, event, fn_name):
+        self._attach_probe("r_", BPF_PROBE_RETURN, event, fn_name)
+
+    def _attach_probe(self, prefix, attach_type, event, fn_name):
+        ev_name = prefix + event.replace("+", "_").replace(".", "_")
+        fd = lib.bpf_attach_kprobe(self.progs[fn_name], attach_type,
+                                   ev_name.encode(), event.encode(), 0, 0)
+        if fd < 0:
+            raise OSError(ct.get_errno(), f"Failed to attach BPF program {fn_name} to kprobe {event}")
+        self.kprobes[ev_name] = fd
+
+    def detach_kprobe(self, event):
+        self._detach_probe("p_", event)
+
+    def detach_kretprobe(self, event):
+        self._detach_probe("r_", event)
+
+    def _detach_probe(self, prefix, event):
+        ev_name = prefix + event.replace("+", "_").replace(".", "_")
+        fd = self.kprobes.pop(ev_name, None)
+        if fd is None:
+            raise Exception(f"Kprobe {event} is not attached")
+        lib.bpf_close_perf_event_fd(fd)
+        lib.bpf_detach_kprobe(ev_name.encode())
+
+    def attach_tracepoint(self, tp, fn_name):
+        category, event = tp.split(":", 1)
+        fd = lib.bpf_attach_tracepoint(self.progs[fn_name], category.encode(), event.encode())
+        if fd < 0:
+            raise OSError(ct.get_errno(), f"Failed to attach BPF program {fn_name} to tracepoint {tp}")
+        self.tracepoints[tp] = fd
+
+    def detach_tracepoint(self, tp):
+        fd = self.tracepoints.pop(tp, None)
+        if fd is None:
+            raise Exception(f"Tracepoint {tp} is not attached")
+        lib.bpf_close_perf_event_fd(fd)
+
+    def attach_perf_event(self, ev_type, ev_config, fn_name, sample_period=0,
+                          sample_freq=0, pid=-1, cpu=-1, group_fd=-1):
+        fd = lib.bpf_attach_perf_event(self.progs[fn_name], ev_type, ev_config,
+                                       sample_period, sample_freq, pid, cpu, group_fd)
+        if fd < 0:
+            raise OSError(ct.get_errno(), f"Failed to attach BPF program {fn_name} to perf event")
+        self.perf_fds.append(fd)
+
+    def num_open_kprobes(self):
+        return len(self.kprobes)
+
+    def num_open_tracepoints(self):
+        return len(self.tracepoints)
+
+    def cleanup(self):
+        for ev_name, fd in self.kprobes.items():
+            lib.bpf_close_perf_event_fd(fd)
+            lib.bpf_detach_kprobe(ev_name.encode())
+        for fd in list(self.tracepoints.values()) + self.perf_fds:
+            lib.bpf_close_perf_event_fd(fd)
+        self.kprobes = {}
+        self.tracepoints = {}
+        self.perf_fds = []
+
+
+class ProgramCache:
+    """
+    编译结果缓存。load() 命中时直接打开固定在 bpffs 上的程序与表（毫秒级），
+    未命中时用 BCC 编译；调用方挂载完探针后调用 store() 把本次编译结果固定下来。
+    同一缓存项同时只允许一个进程使用，否则两个进程会共享同一组表，
+    拿不到锁的进程直接编译一份私有的程序。
+    缓存项按内核与源码区分，store() 成功后删除其它没有进程在用的旧缓存项
+    """
+    def __init__(self, text, cflags=None):
+        self.text = text
+        self.cflags = cflags
+        self.key = cache_key(text, cflags)
+        self.pin_dir = os.path.join(PIN_ROOT, self.key)
+        self.meta_path = os.path.join(META_ROOT, f"{self.key}.json")
+        self.hit = False
+        self._lock = None
+
+    def _acquire(self):
+        try:
+            os.makedirs(META_ROOT, exist_ok=True)
+        except OSError:
+            return False
+        self._lock = try_lock(self.meta_path + ".lock")
+        return self._lock is not None
+
+    def load(self):
+        if self._acquire():
+            try:
+                with open(self.meta_path) as f:
+                    meta = json.load(f)
+                if meta.get('cflags') != list(self.cflags or ()):
+                    raise ValueError("symbol addresses changed")
+                b = CachedBPF(self.pin_dir, meta)
+                self.hit = True
+                return b
+            except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                # 没有缓存、元数据损坏、固定对象已随重启消失、符号地址变化或挂载失败
+                self.invalidate()
+        if self.cflags:
+            return BPF(text=self.text, cflags=self.cflags)
+        return BPF(text=self.text)
+
+    def store(self, b):
+        """固定 b 中已加载的程序与全部表；失败时不影响本次运行"""
+        if self.hit or self._lock is None:
+            return
+        try:
+            meta = {'cflags': list(self.cflags or ()), 'maps': {}, 'progs': []}
+            os.makedirs(self.pin_dir, exist_ok=True)
+            for i in range(lib.bpf_num_tables(b.module)):
+                name = lib.bpf_table_name(b.module, i)
+                map_id = lib.bpf_table_id(b.module, name)
+                fd = lib.bpf_table_fd_id(b.module, map_id)
+                if lib.bpf_obj_pin(fd, os.path.join(self.pin_dir, f"map.{name.decode()}").encode()) < 0:
+                    raise OSError(ct.get_errno(), f"cannot pin map {name.decode()}")
+                meta['maps'][name.decode()] = {
+                    'type': lib.bpf_table_type_id(b.module, map_id),
+                    'max_entries': lib.bpf_table_max_entries_id(b.module, map_id),
+                    'key': lib.bpf_table_key_desc(b.module, name).decode(),
+                    'leaf': lib.bpf_table_leaf_desc(b.module, name).decode(),
+                }
+            for name, fn in b.funcs.items():
+                name = name.decode() if isinstance(name, bytes) else name
+                if lib.bpf_obj_pin(fn.fd, os.path.join(self.pin_dir, f"prog.{name}").encode()) < 0:
+                    raise OSError(ct.get_errno(), f"cannot pin program {name}")
+                meta['progs'].append(name)
+            tmp = self.meta_path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, self.meta_path)
+        except OSError:
+            self.invalidate()
+            return
+        self.evict()
+
+    def evict(self):
+        """删除其它缓存项（旧内核、旧版本源码留下的元数据、锁文件与固定对象），正被其它进程使用的保留"""
+        keys = set()
+        for root in (META_ROOT, PIN_ROOT):
+            try:
+                # 元数据为 <key>.json、<key>.json.lock，固定对象在目录 <key> 下
+                keys.update(name.split('.', 1)[0] for name in os.listdir(root))
+            except OSError:
+                pass
+        keys.discard(self.key)
+        for key in keys:
+            meta_path = os.path.join(META_ROOT, f"{key}.json")
+            lock = try_lock(meta_path + ".lock")
+            if lock is None:
+                continue
+            for path in (meta_path, meta_path + ".tmp", meta_path + ".lock"):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            shutil.rmtree(os.path.join(PIN_ROOT, key), ignore_errors=True)
+            lock.close()
+
+    def invalidate(self):
+        """删除本缓存项的元数据与固定对象"""
+        try:
+            os.unlink(self.meta_path)
+        except OSError:
+            pass
+        shutil.rmtree(self.pin_dir, ignore_errors=True)
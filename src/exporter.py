@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from recorder import COLUMNS, NODE_DTYPE, ZONE_DTYPE, fill_record, node_dict, node_table, record_columns, \
+    record_dtype, zone_table, zone_tuples
+from snapshot import NR_ORDERS, Snapshot
+
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_TYPE = 'application/json'
+BINARY_TYPE = 'application/octet-stream'
+
+# /snapshot 的二进制快照：头部 + zone 表 + 节点表 + 一条与录制文件相同布局的记录
+BINARY_MAGIC = b'MFDS'
+BINARY_VERSION = 3
+# magic, version, nr_orders, nr_zones, nr_nodes, timestamp(ns)
+BINARY_HEADER = struct.Struct('<4sHHHHQ')
+
+# (指标名, Snapshot 列名, 帮助信息, 缩放)
+ORDER_METRICS = (
+    ('mfd_free_pages', 'free_pages', 'Free pages in the zone', 1),
+    ('mfd_free_blocks_total', 'free_blocks_total', 'Free blocks of any order in the zone', 1),
+    ('mfd_free_blocks_suitable', 'free_blocks_suitable', 'Free blocks usable for an allocation of this order', 1),
+    ('mfd_extfrag_index', 'score_a', 'Kernel extfrag_index (fragmentation_index) of this order', 1000),
+    ('mfd_unusable_index', 'score_b', 'Kernel unusable_index of this order', 1000),
+)
+
+
+class Bodies:
+    """
+    一个采集周期预先渲染好的响应体，整体替换，读者无需加锁。
+    etag 由快照时间戳生成，/snapshot 的请求带上一次的 etag 且快照未更新时返回 304
+    """
+    __slots__ = ('prometheus', 'prometheus_gz', 'json', 'json_gz', 'binary', 'etag')
+
+    def __init__(self, prometheus, json_body, binary, etag):
+        self.prometheus = prometheus
+        self.prometheus_gz = gzip.compress(prometheus, 6)
+        self.json = json_body
+        self.json_gz = gzip.compress(json_body, 6)
+        self.binary = binary
+        self.etag = etag
+
+
+def render_binary(snap):
+    """
+    紧凑的二进制快照（每个 zone 84 字节、每个节点 16 字节），供 aggregator.py 拉取，
+    数值均为小端定长整数，解析时不需要逐项转换
+    """
+    records = np.zeros(1, dtype=record_dtype(len(snap.zones)))
+    fill_record(records, 0, snap, snap.interval)
+    return BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, NR_ORDERS, len(snap.zones),
+                              len(snap.nodes), int(snap.timestamp * 1e9)) \
+        + zone_table(snap.zones).tobytes() + node_table(snap.nodes).tobytes() + records.tobytes()
+
+
+def parse_binary(body):
+    """
+    返回 (timestamp, zone 表, 节点表, 记录)，各表与记录是直接引用 body 的 NumPy 视图；
+    格式不符时抛出 ValueError
+    """
+    if len(body) < BINARY_HEADER.size:
+        raise ValueError("short snapshot")
+    magic, version, nr_orders, nr_zones, nr_nodes, timestamp = BINARY_HEADER.unpack_from(body)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION or nr_orders != NR_ORDERS:
+        raise ValueError("not a fragmentation snapshot")
+    dtype = record_dtype(nr_zones)
+    table_end = BINARY_HEADER.size + nr_zones * ZONE_DTYPE.itemsize
+    nodes_end = table_end + nr_nodes * NODE_DTYPE.itemsize
+    if len(body) != nodes_end + dtype.itemsize:
+        raise ValueError("truncated snapshot")
+    table = np.frombuffer(body, dtype=ZONE_DTYPE, count=nr_zones, offset=BINARY_HEADER.size)
+    nodes = np.frombuffer(body, dtype=NODE_DTYPE, count=nr_nodes, offset=table_end)
+    record = np.frombuffer(body, dtype=dtype, count=1, offset=nodes_end)[0]
+    return timestamp / 1e9, table, nodes, record
+
+
+def decode_binary(body):
+    """把 render_binary() 的结果还原为 Snapshot"""
+    timestamp, table, nodes, record = parse_binary(body)
+    columns = record_columns(record)
+    columns = [tuple(map(tuple, columns[name].tolist())) for name in COLUMNS]
+    return Snapshot(timestamp, zone_tuples(table), node_dict(nodes), *columns,
+                    interval=int(record['interval_ms']) / 1000.0)
+
+
+def render_prometheus(snap, stats=None, profile=None):
+    lines = []
+    zone_labels = [f'node="{node_id}",zone="{comm}"' for node_id, comm, _, _, _ in snap.zones]
+    for name, column, help_text, scale in ORDER_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        values = getattr(snap, column)
+        for z, labels in enumerate(zone_labels):
+            for order in range(NR_ORDERS):
+                value = values[z][order]
+                value = value / scale if scale != 1 else value
+                lines.append(f'{name}{{{labels},order="{order}"}} {value}')
+    for name, field, help_text in (('mfd_zone_spanned_pages', 3, 'Pages spanned by the zone, including holes'),
+                                   ('mfd_zone_present_pages', 4, 'Physical pages present in the zone')):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for z, labels in enumerate(zone_labels):
+            lines.append(f'{name}{{{labels}}} {snap.zones[z][field]}')
+    lines.append("# HELP mfd_last_collect_timestamp_seconds Unix time of the last collected snapshot")
+    lines.append("# TYPE mfd_last_collect_timestamp_seconds gauge")
+    lines.append(f"mfd_last_collect_timestamp_seconds {snap.timestamp:.3f}")
+    lines.append("# HELP mfd_sample_interval_seconds Sampling interval in effect for the last snapshot")
+    lines.append("# TYPE mfd_sample_interval_seconds gauge")
+    lines.append(f"mfd_sample_interval_seconds {snap.interval:g}")
+    if stats is not None:
+        for name, key, help_text in (
+                ('mfd_collector_ticks_total', 'ticks', 'Collector ticks completed'),
+                ('mfd_collector_missed_ticks_total', 'missed', 'Collector ticks skipped because a collection overran'),
+                ('mfd_collector_late_ticks_total', 'late', 'Collector ticks that started late')):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {stats[key]}")
+        lines.append("# HELP mfd_collector_duration_seconds Duration of the last collection")
+        lines.append("# TYPE mfd_collector_duration_seconds gauge")
+        lines.append(f"mfd_collector_duration_seconds {stats['collect_seconds']:.6f}")
+    if profile is not None:
+        for name, group, label, key, help_text in (
+                ('mfd_profile_stage_seconds_total', 'stages', 'stage', 'seconds', 'Time spent in each tool stage'),
+                ('mfd_profile_stage_calls_total', 'stages', 'stage', 'calls', 'Calls of each tool stage'),
+                ('mfd_bpf_prog_run_seconds_total', 'bpf', 'prog', 'seconds', 'Run time of each eBPF program'),
+                ('mfd_bpf_prog_runs_total', 'bpf', 'prog', 'calls', 'Runs of each eBPF program')):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for item, values in profile[group].items():
+                lines.append(f'{name}{{{label}="{item}"}} {values[key]}')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def render_json(snap, profile=None):
+    zones = []
+    for z, (node_id, comm, zone_pfn, spanned, present) in enumerate(snap.zones):
+        zones.append({
+            'node': node_id,
+            'zone': comm,
+            'zone_pfn': zone_pfn,
+            'spanned_pages': spanned,
+            'present_pages': present,
+            'orders': [{
+                'order': order,
+                'free_pages': snap.free_pages[z][order],
+                'free_blocks_total': snap.free_blocks_total[z][order],
+                'free_blocks_suitable': snap.free_blocks_suitable[z][order],
+                'extfrag_index': snap.score_a[z][order] / 1000,
+                'unusable_index': snap.score_b[z][order] / 1000,
+            } for order in range(NR_ORDERS)],
+        })
+    body = {'timestamp': snap.timestamp, 'interval': snap.interval, 'zones': zones}
+    if profile is not None:
+        body['profile'] = profile
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        bodies = self.server.exporter.bodies
+        path = self.path.split('?', 1)[0]
+        if bodies is None:
+            self.send_error(503, "no snapshot collected yet")
+            return
+        if path == '/snapshot':
+            if self.headers.get('If-None-Match') == bodies.etag:
+                self.send_response(304)
+                self.send_header('ETag', bodies.etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', BINARY_TYPE)
+            self.send_header('ETag', bodies.etag)
+            self.send_header('Content-Length', str(len(bodies.binary)))
+            self.end_headers()
+            self.wfile.write(bodies.binary)
+            return
+        if path == '/metrics':
+            body, body_gz, ctype = bodies.prometheus, bodies.prometheus_gz, PROMETHEUS_TYPE
+        elif path == '/json':
+            body, body_gz, ctype = bodies.json, bodies.json_gz, JSON_TYPE
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        # 响应体随 Accept-Encoding 变化，前面的缓存不能把 gzip 版本交给不支持的客户端
+        self.send_header('Vary', 'Accept-Encoding')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = body_gz
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Exporter:
+    """
+    无界面指标服务：每个采集周期把快照渲染一次 Prometheus 文本与 JSON（以及 gzip 版本），
+    之后所有抓取请求都直接返回缓存，不再读取 BPF 表或重新格式化。
+    /snapshot 返回二进制快照（见 render_binary），供 aggregator.py 通过长连接拉取。
+    HTTP 服务运行在独立线程中，每个请求一个线程，不会阻塞采集。
+    stats 为返回采集节拍统计的函数（ExtFrag.collector_stats），用于导出 missed/late 计数；
+    profile 为 selfprof.Profiler 时同时导出各阶段与 BPF 程序的累计耗时和次数。
+    """
+    def __init__(self, host='127.0.0.1', port=9101, stats=None, profile=None):
+        self.bodies = None
+        self.stats = stats
+        self.profile = profile
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.exporter = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def update(self, snap):
+        stats = self.stats() if self.stats is not None else None
+        profile = self.profile.export() if self.profile is not None else None
+        self.bodies = Bodies(render_prometheus(snap, stats, profile), render_json(snap, profile),
+                             render_binary(snap), f'"{int(snap.timestamp * 1e9):x}"')
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,141 +1,555 @@
 #!/usr/bin/env python3
-from bpfcc import BPF
+try:
+    from bpfcc import BPF, PerfType, PerfSWConfig
+    from bpfcache import ProgramCache
+except ImportError:
+    # 纯用户态后端（/proc/buddyinfo）不需要 BCC
+    BPF = None
 import os
+import threading
 import time
 import ctypes
 
+import numpy as np
+
+from adaptive import AdaptiveInterval
+from fragindex import IndexCache
+from procfs import BuddyinfoSource, PagetypeinfoReader
+from replay import ReplaySource
+from selfprof import Profiler
+from snapshot import NR_ORDERS, Snapshot
+from stats import StreamStats
+
+# timer 模式下 cpu-clock 事件的触发周期，真正的采样间隔由 delay_map 决定
+TIMER_TICK_NS = 100 * 1000 * 1000
+# 与 extfraginfo.c 中的 NR_MIGRATETYPES 一致
+NR_MIGRATETYPES = 8
+MIGRATETYPE_NAMES = ('Unmovable', 'Movable', 'Reclaimable', 'HighAtomic')
+# 与 allocstall.c 中的 NR_SLOTS、enum stall_item、enum compact_item 一致
+NR_LAT_SLOTS = 32
+STALL_ITEMS = ('slowpath', 'slowpath_fail', 'alloc_fail', 'kcompactd_wake')
+COMPACT_RESULTS = ('success', 'fail', 'skipped')
+# 采集比计划时间晚出这么多秒即记为一次迟到
+LATE_TOLERANCE = 0.05
+# 拼接成一个 eBPF 程序的源文件：common.h 为共用的定义、开关表与采样门限，其余每个文件是一个数据源
+BPF_DIR = "./bpf"
+BPF_SOURCES = ("common.h", "fraginfo.c", "extfraginfo.c", "allocstall.c")
+# 数据源，下标与 common.h 中的 enum source 一致
+SOURCES = ('zones', 'events', 'stall')
+# 各数据源的探针 (类型, 挂载点, 程序名)，数据源关闭时卸下，不再占用分配路径。
+# zones 的 kprobe 只在 kprobe 模式下使用，timer 模式的 cpu-clock 事件一直挂着，关闭时只多一次查表
+SOURCE_PROBES = {
+    'zones': (('kprobe', 'get_page_from_freelist', 'trace_get_page_from_freelist'),),
+    'events': (('tracepoint', 'kmem:mm_page_alloc_extfrag', 'tracepoint__kmem__mm_page_alloc_extfrag'),),
+    'stall': (('kprobe', '__alloc_pages_slowpath', 'trace_slowpath_entry'),
+              ('kretprobe', '__alloc_pages_slowpath', 'trace_slowpath_return'),
+              ('tracepoint', 'compaction:mm_compaction_begin', 'tracepoint__compaction__mm_compaction_begin'),
+              ('tracepoint', 'compaction:mm_compaction_end', 'tracepoint__compaction__mm_compaction_end'),
+              ('tracepoint', 'compaction:mm_compaction_kcompactd_wake',
+               'tracepoint__compaction__mm_compaction_kcompactd_wake'),
+              ('tracepoint', 'kmem:mm_page_alloc', 'tracepoint__kmem__mm_page_alloc')),
+}
+
+
+def online_nodes(path="/sys/devices/system/node/online"):
+    """解析在线节点列表，例如 "0-1,3" """
+    nodes = []
+    try:
+        with open(path) as f:
+            text = f.read().strip()
+    except OSError:
+        return [0]
+    for part in text.split(','):
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-')
+            nodes.extend(range(int(lo), int(hi) + 1))
+        else:
+            nodes.append(int(part))
+    return nodes or [0]
+
+
+def find_ksym(name, path="/proc/kallsyms"):
+    """返回内核中名为 name 的函数，找不到时返回编译器生成的 name.constprop.N 等变体"""
+    variant = None
+    with open(path) as f:
+        for line in f:
+            sym = line.split()[2]
+            if sym == name:
+                return sym
+            if variant is None and sym.startswith(name + '.'):
+                variant = sym
+    if variant is None:
+        raise LookupError(f"kernel function {name} not found")
+    return variant
+
+
+def compose_program(bpf_dir=BPF_DIR, sources=BPF_SOURCES):
+    """把各数据源拼接成一段程序文本。BCC 只改写主文件中的表操作，所以拼接而不是 #include"""
+    parts = []
+    for name in sources:
+        with open(os.path.join(bpf_dir, name)) as f:
+            parts.append(f"// {name}\n" + f.read())
+    return '\n'.join(parts)
+
+
+def hist_percentile(counts, q):
+    """
+    log2 直方图的第 q 百分位，返回所在桶的上界（微秒，不含），没有样本时返回 0。
+    桶 i 覆盖 [2^(i-1), 2^i)
+    """
+    total = sum(counts)
+    if not total:
+        return 0
+    rank = total * q / 100.0
+    seen = 0
+    for slot, count in enumerate(counts):
+        seen += count
+        if count and seen >= rank:
+            return 1 << slot
+    return 1 << (len(counts) - 1)
+
+
+def read_table(table):
+    """优先用一次批量系统调用读取整张 BPF 表，内核或 BCC 不支持时退回逐项读取"""
+    try:
+        return list(table.items_lookup_batch())
+    except Exception:
+        return list(table.items())
+
+
 class ExtFrag:
-    def __init__(self, interval=2, output_extfrag_index=False, output_unusable_index=False,output_count=False,zone_info=False):
+    """
+    mode 选择 zone 扫描的触发方式:
+      timer  - 单个 CPU 上的 cpu-clock 事件按 delay_map 间隔遍历所有节点，分配路径零开销
+      kprobe - 在 get_page_from_freelist 上按 delay_map 间隔采样（旧行为，O(1) 门限）
+    找不到 node_data/contig_page_data 符号时 timer 模式自动回退到 kprobe 模式。
+    bpf 后端加载由 BPF_SOURCES 拼接成的一个程序，各数据源由 source_map 中的开关启停：
+    zone 扫描一直开启，output_count 另外开启外碎片化事件统计（extfraginfo.c），output_stall
+    另外开启慢速路径分配延迟与内存规整结果统计（allocstall.c），二者的 sample() 都不产生快照。
+    switch_source() 在运行中切换，不重新编译、加载。
+    backend 选择数据来源:
+      bpf       - 加载 eBPF 程序（需要 root 与 BCC）
+      buddyinfo - 读取 /proc/buddyinfo 在用户态计算指标，不支持 output_count
+      replay    - 回放 path 指定的录制文件，不支持 output_count
+    bpf_cache 为 True 时复用固定在 bpffs 上的已编译程序（见 bpfcache.py），省去每次启动的编译。
+    adaptive 为 (floor, ceiling) 时按高阶 order 的碎片化趋势在该范围内自动调整采样间隔（回放时忽略）。
+    每个快照都会加入 self.stats（见 stats.py），stats_window 为其滚动窗口的秒数。
+    profile 为 selfprof.Profiler 时记录采集各阶段（collect.*）的耗时与 BPF 程序的运行统计。
+    migratetypes 为 True 时每个快照附加 /proc/pagetypeinfo 中各 migratetype 的空闲块与指标
+    （回放时不支持），set_migratetypes() 在运行中开关。
+    triggers 为 trigger.TriggerEngine 时每个快照评估其触发条件，捕获窗口内按其返回的高频间隔采集；
+    bpf 后端在捕获窗口内（有按事件速率的条件时一直）开启外碎片化事件统计，供转储的进程表使用。
+    """
+    def __init__(self, interval=2, output_extfrag_index=False, output_unusable_index=False,output_count=False,zone_info=False,mode='timer',backend='bpf',path=None,bpf_cache=True,output_stall=False,adaptive=None,stats_window=600,profile=None,migratetypes=False,triggers=None):
         self.interval = interval
+        self.adaptive = None
+        if adaptive is not None and backend != 'replay':
+            self.adaptive = AdaptiveInterval(*adaptive)
+            self.interval = self.adaptive.clamp(interval)
         self.output_extfrag_index = output_extfrag_index
         self.output_unusable_index = output_unusable_index
         self.output_count = output_count
+        self.output_stall = output_stall
         self.zone_info = zone_info
-        
- 
+        self.mode = mode
+        self.backend = backend
+        self.source = None
+        self.recorder = None
+        self.bpf_cache = bpf_cache
+        self.program_cache = None
+        # 每个新快照都会传给这些回调，例如 Exporter.update
+        self.listeners = []
+        self.stats = StreamStats(stats_window)
+        self.triggers = triggers
+        self.profile = profile if profile is not None else Profiler(enabled=False)
+        # 后台采集线程发布的最新结果与节拍统计，见 start()
+        self.latest = None
+        self.seq = 0
+        self.ticks = 0
+        self.missed = 0
+        self.late = 0
+        self.collect_seconds = 0.0
+        self.error = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._poke = threading.Event()
+        self._wake_fd = None
+        # 采集与切换数据源互斥，保证 self.latest 总是当前模式的结果
+        self._lock = threading.Lock()
+        self.pagetypes = None
+        if migratetypes:
+            self.set_migratetypes(True)
+        self.attached = set()
+        self._ksyms = {}
 
-        if self.output_count:
-            self.b = BPF(src_file="./bpf/extfraginfo.c")
-        else:
-            self.b = BPF(src_file="./bpf/fraginfo.c")
+        if self.backend in ('buddyinfo', 'replay'):
+            if self.output_count or self.output_stall:
+                raise ValueError("output_count/output_stall requires the bpf backend")
+            if triggers is not None and triggers.needs_events:
+                raise ValueError("event-rate triggers require the bpf backend")
+            self.b = None
+            if self.backend == 'replay':
+                self.source = ReplaySource(path)
+            else:
+                self.source = BuddyinfoSource()
+            return
+        if BPF is None:
+            raise ImportError("bpfcc is required for the bpf backend")
+        self.nr_nodes = max(online_nodes()) + 1
+        cflags = [f"-DNR_NODES={self.nr_nodes}"]
+        timer_cflags = self._timer_cflags() if self.mode == 'timer' else None
+        if timer_cflags is None:
+            self.mode = 'kprobe'
+        self.b = self._load(compose_program(), cflags + (timer_cflags or []))
+        # BCC 与 CachedBPF 在加载时挂载全部 tracepoint，随后由 _set_sources 卸下用不到的
+        self.attached = {(kind, point) for probes in SOURCE_PROBES.values()
+                         for kind, point, _ in probes if kind == 'tracepoint'}
+        load_func = getattr(self.b, 'load_func', None)
+        if load_func is not None:
+            # 缓存只固定已加载的程序，按需挂载的 kprobe 程序先全部加载
+            for probes in SOURCE_PROBES.values():
+                for kind, _, fn_name in probes:
+                    if kind != 'tracepoint':
+                        load_func(fn_name, BPF.KPROBE)
+        if self.mode == 'timer':
+            # 只挂在 CPU 0 上，保证每个周期只触发一次
+            self.b.attach_perf_event(ev_type=PerfType.SOFTWARE,
+                                     ev_config=PerfSWConfig.CPU_CLOCK,
+                                     fn_name="sample_zones",
+                                     sample_period=TIMER_TICK_NS, cpu=0)
+        # 每个节点的 zone 槽位数即内核的 MAX_NR_ZONES
+        self.nr_zone_slots = len(self.b["zone_meta_map"]) // self.nr_nodes
+        self.index = IndexCache()
+        if self.program_cache is not None:
+            self.program_cache.store(self.b)
+        self.profile.attach_bpf(self.b)
+        if self.triggers is not None:
+            self.triggers.task_counts = self.get_count_data
         delay_key = 0
-        self.b["delay_map"][delay_key] = ctypes.c_int(interval)
+        self.b["delay_map"][delay_key] = ctypes.c_int(int(self.interval * 1000))
+        self._set_sources()
 
-    
-    def calculate_scoreA(self, extfrag_index):
-        extfrag_index_int_part = int(extfrag_index) // 1000
-        extfrag_index_dec_part = int(extfrag_index) % 1000
-        return f"{extfrag_index_int_part:2d}.{extfrag_index_dec_part:03d}"
+    def _load(self, text, cflags=None):
+        """优先复用缓存的已编译程序，未命中时由 BCC 编译"""
+        if not self.bpf_cache:
+            return BPF(text=text, cflags=cflags or [])
+        self.program_cache = ProgramCache(text, cflags)
+        return self.program_cache.load()
 
-    def calculate_scoreB(self, unusable_index):
-        unusable_index_int_part = int(unusable_index) // 1000
-        unusable_index_dec_part = int(unusable_index) % 1000
-        return f"{unusable_index_int_part:2d}.{unusable_index_dec_part:03d}"
+    def _ksym(self, name):
+        # 编译器可能把函数生成为 __alloc_pages_slowpath.constprop.0 等
+        if name not in self._ksyms:
+            self._ksyms[name] = find_ksym(name)
+        return self._ksyms[name]
 
-    def get_zone_data(self,filter_node_id=None):
-        zone_data_dict = {}
-        zone_map = self.b["zone_map"]
+    def _attach(self, kind, point, fn_name):
+        if kind == 'tracepoint':
+            self.b.attach_tracepoint(tp=point, fn_name=fn_name)
+        elif kind == 'kprobe':
+            self.b.attach_kprobe(event=self._ksym(point), fn_name=fn_name)
+        else:
+            self.b.attach_kretprobe(event=self._ksym(point), fn_name=fn_name)
 
-        for key, value in zone_map.items():
-            comm = value.name.decode('utf-8', 'replace').rstrip('\x00')
-            node_id =value.node_id
-            if filter_node_id is not None and node_id != filter_node_id:
-                continue
-            data = {
+    def _detach(self, kind, point):
+        if kind == 'tracepoint':
+            self.b.detach_tracepoint(tp=point)
+        elif kind == 'kprobe':
+            self.b.detach_kprobe(event=self._ksym(point))
+        else:
+            self.b.detach_kretprobe(event=self._ksym(point))
+
+    def enabled_sources(self):
+        """当前模式需要的数据源：zone 扫描一直开启，切回快照视图时立即有数据"""
+        sources = {'zones'}
+        if self.output_count or (self.triggers is not None and
+                                 (self.triggers.needs_events or self.triggers.capturing)):
+            sources.add('events')
+        if self.output_stall:
+            sources.add('stall')
+        return sources
+
+    def _set_sources(self):
+        """
+        按 enabled_sources() 写入 source_map 并挂载或卸下各数据源的探针。
+        开启时先打开开关再挂载，关闭时先关开关再卸下，挂载期间的事件都被完整计数或忽略
+        """
+        enabled = self.enabled_sources()
+        for idx, source in enumerate(SOURCES):
+            on = source in enabled
+            self.b["source_map"][idx] = ctypes.c_uint(int(on))
+            for kind, point, fn_name in SOURCE_PROBES[source]:
+                if source == 'zones' and self.mode == 'timer':
+                    continue
+                probe = (kind, point)
+                if on and probe not in self.attached:
+                    self._attach(kind, point, fn_name)
+                    self.attached.add(probe)
+                elif not on and probe in self.attached:
+                    self._detach(kind, point)
+                    self.attached.discard(probe)
+
+    def switch_source(self, output_count=False, output_stall=False):
+        """
+        运行中切换 sample() 采集的数据（进程事件、慢速路径延迟或快照），只改开关与探针，
+        不重新加载程序。返回前完成一次新模式的采集，之后 self.latest 一定是新模式的结果
+        """
+        if self.backend != 'bpf' and (output_count or output_stall):
+            raise ValueError("output_count/output_stall requires the bpf backend")
+        with self._lock:
+            self.output_count = output_count
+            self.output_stall = output_stall
+            if self.b is not None:
+                self._set_sources()
+            # 与 _publish 不同，采集失败时直接抛出，不留下上一个模式的结果
+            self.latest = self.sample()
+            self.seq += 1
+
+    def _timer_cflags(self):
+        addr = BPF.ksymname("node_data")
+        if addr > 0:
+            return [f"-DNODE_DATA_ADDR={addr:#x}UL"]
+        addr = BPF.ksymname("contig_page_data")
+        if addr > 0:
+            return [f"-DCONTIG_PAGE_DATA_ADDR={addr:#x}UL"]
+        return None
+
+    def set_migratetypes(self, enabled):
+        """开关 /proc/pagetypeinfo 的读取，从下一次采集起生效"""
+        if enabled and self.backend == 'replay':
+            raise ValueError("migratetypes are not recorded, they need a live backend")
+        with self._lock:
+            if not enabled:
+                self.pagetypes = None
+            elif self.pagetypes is None:
+                self.pagetypes = PagetypeinfoReader()
+
+    def trigger(self):
+        """清空上一次采样时间，让下一个 timer 周期立即重新扫描"""
+        if self.b is not None:
+            self.b["last_time_map"][0] = ctypes.c_ulonglong(0)
+
+    def set_interval(self, interval):
+        """修改采样间隔：写入 delay_map 立即对内核侧生效，采集线程从下一个节拍起使用新间隔"""
+        if interval == self.interval:
+            return
+        faster = interval < self.interval
+        self.interval = interval
+        if self.b is not None:
+            self.b["delay_map"][0] = ctypes.c_int(int(interval * 1000))
+            if faster:
+                self.trigger()
+
+    def snapshot(self):
+        """
+        读取一次数据源生成本周期共享的只读快照（记录当时生效的采样间隔）并更新在线统计，
+        设置了 recorder 时同时落盘，并通知 listeners；开启自适应采样时据此调整下一周期的间隔
+        """
+        profile = self.profile
+        if self.source is not None:
+            with profile.stage('collect.read'):
+                snap = self.source.snapshot(self.interval)
+        else:
+            snap = self._read_bpf()
+        if self.pagetypes is not None:
+            with profile.stage('collect.pagetypes'):
+                snap = self.pagetypes.extend(snap)
+        # 在发布快照之前更新，读到新快照的界面也能读到包含它的统计
+        with profile.stage('collect.stats'):
+            self.stats.update(snap)
+        if self.recorder is not None:
+            with profile.stage('collect.record'):
+                self.recorder.append(snap)
+        with profile.stage('collect.export'):
+            for listener in self.listeners:
+                listener(snap)
+        interval = self.interval
+        if self.adaptive is not None:
+            interval = self.adaptive.update(snap, interval)
+        if self.triggers is not None:
+            with profile.stage('collect.trigger'):
+                capturing = self.triggers.capturing
+                interval = self.triggers.update(snap, interval, self._event_total())
+                if self.b is not None and self.triggers.capturing != capturing:
+                    self._set_sources()
+        self.set_interval(interval)
+        return snap
+
+    def _event_total(self):
+        """外碎片化事件的累计次数，事件统计没有开启时返回 None"""
+        if self.b is None or 'events' not in self.enabled_sources():
+            return None
+        return sum(sum(value) for key, value in read_table(self.b["event_total"]))
+
+    def _read_bpf(self):
+        """
+        批量读取三张定长数组表，zone_map 每个 [node][zone] 槽位只有各 order 的 nr_free，
+        指标在用户态由 IndexCache 计算，只重新计算 nr_free 发生变化的 zone
+        """
+        with self.profile.stage('collect.read'):
+            nodes = {}
+            for key, value in read_table(self.b["pgdat_map"]):
+                if value.nr_zones:
+                    nodes[key.value] = value.node_start_pfn
+
+            rows = []
+            for key, meta in read_table(self.b["zone_meta_map"]):
+                if not meta.present_pages:
+                    continue
+                slot = key.value
+                comm = meta.name.decode('utf-8', 'replace').rstrip('\x00')
+                rows.append((slot // self.nr_zone_slots, comm, slot, meta))
+            rows.sort(key=lambda row: row[:2])
+
+            # 数组表按下标顺序返回全部槽位
+            counters = [value for key, value in read_table(self.b["zone_map"])]
+        with self.profile.stage('collect.index'):
+            zones = tuple((node_id, comm, meta.zone_start_pfn, meta.spanned_pages, meta.present_pages)
+                          for node_id, comm, slot, meta in rows)
+            nr_free = np.array([counters[slot].nr_free[:] for _, _, slot, _ in rows],
+                               dtype=np.int64).reshape(-1, NR_ORDERS)
+            columns = self.index.columns([zone[:2] for zone in zones], nr_free)
+            return Snapshot(time.time(), zones, nodes, *columns, interval=self.interval)
+
+    def summary_for(self, snap):
+        """snap 对应的在线统计，zone 集合与统计不一致（例如刚切换布局）时返回 None"""
+        summary = self.stats.summary
+        if summary is not None and summary.zones != tuple(zone[:2] for zone in snap.zones):
+            return None
+        return summary
+
+    def get_zone_rows(self, snap, cells):
+        """
+        cells 为 [(zone 下标, order)]，返回对应的行（格式同 get_zone_data），
+        界面只为可见的行调用，开销与 zone 总数无关
+        """
+        summary = self.summary_for(snap)
+        rows = []
+        for z, order in cells:
+            node_id, comm, zone_pfn, spanned, present = snap.zones[z]
+            rows.append({
                 'comm': comm,
-                'zone_pfn': value.zone_start_pfn,
-                'spanned_pages': value.spanned_pages,
-                'present_pages': value.present_pages,
-                'order': value.order,
-                'free_blocks_total': value.free_blocks_total,
-                'free_blocks_suitable': value.free_blocks_suitable,
-                'free_pages': value.free_pages,
-                'scoreA': self.calculate_scoreA(value.score_a),
-                'scoreB': self.calculate_scoreB(value.score_b),
-                'node_id': value.node_id  
-            }
-            if comm not in zone_data_dict:
-                zone_data_dict[comm] = []
-            zone_data_dict[comm].append(data)
-            for comm in zone_data_dict:
-                zone_data_dict[comm].sort(key=lambda x: x['order'])
+                'zone_pfn': zone_pfn,
+                'spanned_pages': spanned,
+                'present_pages': present,
+                'order': order,
+                'free_blocks_total': snap.free_blocks_total[z][order],
+                'free_blocks_suitable': snap.free_blocks_suitable[z][order],
+                'free_pages': snap.free_pages[z][order],
+                'scoreA': snap.score_a[z][order] / 1000,
+                'scoreB': snap.score_b[z][order] / 1000,
+                'node_id': node_id,
+                'stats': None if summary is None else {
+                    'scoreA': summary.cell('score_a', z, order),
+                    'scoreB': summary.cell('score_b', z, order),
+                }
+            })
+        return rows
 
-        return zone_data_dict
-    def get_view_data(self, filter_node_id=None):
-        zone_data_dict = {}
-        ret_dict={}
-        zone_map = self.b["zone_map"]
+    def get_migratetype_rows(self, snap, cells):
+        """
+        cells 为 [(zone 下标, order)]，每行含该 order 在各 migratetype（snap.migratetypes 的顺序）
+        的空闲块数 free 与指标 scoreA/scoreB；快照没有 migratetype 数据时返回空列表
+        """
+        if not snap.migratetypes:
+            return []
+        rows = []
+        for z, order in cells:
+            node_id, comm = snap.zones[z][:2]
+            rows.append({
+                'comm': comm,
+                'node_id': node_id,
+                'order': order,
+                'free': tuple(mt[order] for mt in snap.mt_nr_free[z]),
+                'scoreA': tuple(mt[order] / 1000 for mt in snap.mt_score_a[z]),
+                'scoreB': tuple(mt[order] / 1000 for mt in snap.mt_score_b[z]),
+            })
+        return rows
 
-        for key, value in zone_map.items():
-            comm = value.name.decode('utf-8', 'replace').rstrip('\x00')
-            node_id = value.node_id
-            
+    def _projected(self, snap):
+        """
+        get_*_data 只做投影、不采集：没有传入 snap 时使用采集线程最近发布的快照，
+        还没有快照或当前发布的是 -s/-a 的数据时返回 None
+        """
+        if snap is None:
+            snap = self.latest
+        return snap if isinstance(snap, Snapshot) else None
+
+    def get_zone_data(self, filter_node_id=None, snap=None):
+        """
+        按 comm 分组的每个 order 的一行数据，scoreA/scoreB 为数值，由界面负责格式化；
+        stats 为 {'scoreA': ..., 'scoreB': ...} 的在线统计（见 StatsSummary.cell），还没有统计时为 None
+        """
+        snap = self._projected(snap)
+        if snap is None:
+            return {}
+        zone_data_dict = {}
+        for z, (node_id, comm, _, _, _) in enumerate(snap.zones):
             if filter_node_id is not None and node_id != filter_node_id:
                 continue
+            rows = zone_data_dict.setdefault(comm, [])
+            rows.extend(self.get_zone_rows(snap, [(z, order) for order in range(NR_ORDERS)]))
+        return zone_data_dict
 
-            data = {
-                'scoreB': self.calculate_scoreB(value.score_b),
-                'order': value.order,
+    def get_view_data(self, filter_node_id=None, snap=None):
+        """每个 zone 最高 order（NR_ORDERS - 1）的 unusable_index"""
+        snap = self._projected(snap)
+        if snap is None:
+            return {}
+        ret_dict = {}
+        # zones 已按 (node_id, comm) 排序
+        for z, (node_id, comm, _, _, _) in enumerate(snap.zones):
+            if filter_node_id is not None and node_id != filter_node_id:
+                continue
+            ret_dict[(node_id, comm)] = {
+                'scoreB': snap.score_b[z][NR_ORDERS - 1] / 1000,
+                'order': NR_ORDERS - 1,
             }
-            
-            # 使用 (node_id, comm) 作为键
-            zone_data_dict[(node_id, comm)] = data
-        sorted_keys = sorted(zone_data_dict.keys())
-        for key in sorted_keys:
-            ret_dict[key]= zone_data_dict[key]
         return ret_dict
-    def get_nr_zones(self, filter_node_id=None):
-        node_zone_map = {} 
-        zone_map = self.b["zone_map"]
 
-        for key, value in zone_map.items():
-            comm = value.name.decode('utf-8', 'replace').rstrip('\x00')
-            node_id = value.node_id
-            
+    def get_nr_zones(self, filter_node_id=None, snap=None):
+        snap = self._projected(snap)
+        if snap is None:
+            return {}
+        node_zone_map = {}
+        for node_id, comm, _, _, _ in snap.zones:
             if filter_node_id is not None and node_id != filter_node_id:
                 continue
-
-            data = {
-                'scoreB': self.calculate_scoreB(value.score_b),
-                'order': value.order,
-            }
-            
-            # 使用 (node_id, comm) 作为键
-            if node_id not in node_zone_map:
-                node_zone_map[node_id] = []  # 初始化列表
-            node_zone_map[node_id].append(comm)  # 追加 comm
-
+            node_zone_map.setdefault(node_id, []).append(comm)
         return node_zone_map
-    def get_node_data(self):
-        node_data_dict = {}
-        pgdat_map = self.b["pgdat_map"]
-        zone_data = self.get_nr_zones()
 
-        for key, value in pgdat_map.items():
-            node_id = value.node_id
-            nr_zones =  int(len(zone_data.get(node_id, []))/11)
-            data = {
-                'pgdat_ptr': value.pgdat_ptr,
-                'nr_zones': nr_zones,
-                'node_id': value.node_id
+    def get_node_data(self, snap=None):
+        snap = self._projected(snap)
+        if snap is None:
+            return {}
+        node_data_dict = {}
+        zone_data = self.get_nr_zones(snap=snap)
+        for node_id, pgdat_ptr in snap.nodes.items():
+            node_data_dict[node_id] = {
+                'pgdat_ptr': pgdat_ptr,
+                'nr_zones': len(zone_data.get(node_id, [])),
+                'node_id': node_id
             }
-            node_data_dict[node_id] = data
-
         return node_data_dict
-        
-    def get_count_data(self):
+
+    def get_count_data(self, top=None):
+        """
+        按进程统计的外碎片化事件，按 count 降序，top 限制条数。counts_map 为 LRU 表，
+        只含最近活跃的进程；last_* 为该进程最近一次事件的值
+        """
         count_data_list = []
-        counts_map = self.b["counts_map"]  # 'counts_map' 是 BPF 程序中的哈希表名
+        counts_map = self.b["counts_map"]  # 'counts_map' 是 BPF 程序中的 LRU 哈希表名
 
         # 从BPF哈希表中提取所有数据
-        for key, value in counts_map.items():
+        for key, value in read_table(counts_map):
             _comm = value.pcomm.decode('utf-8', 'replace').rstrip('\x00')
             data = {
                 'pcomm':_comm,
                 'pid': value.pid,
-                'pfn': value.pfn,
-                'alloc_order': value.alloc_order,
-                'fallback_order': value.fallback_order,
+                'last_pfn': value.last_pfn,
+                'last_alloc_order': value.last_alloc_order,
+                'last_fallback_order': value.last_fallback_order,
                 'count': value.count
                 
             }
@@ -145,11 +559,170 @@ class ExtFrag:
         # 根据 'count' 字段进行降序排序
         count_data_list.sort(key=lambda x: x['count'], reverse=True)
 
-        return count_data_list
+        return count_data_list[:top] if top else count_data_list
 
-    def run(self):
-        while True:
+    def get_hist_data(self):
+        """
+        汇总 hist_map 各 CPU 的计数，返回非零的
+        {(alloc_order, fallback_order, migratetype, change_ownership): count}
+        """
+        hist = {}
+        for key, value in read_table(self.b["hist_map"]):
+            count = sum(value)
+            if not count:
+                continue
+            slot = key.value
+            change_ownership = slot % 2
+            migratetype = (slot // 2) % NR_MIGRATETYPES
+            fallback_order = (slot // (2 * NR_MIGRATETYPES)) % NR_ORDERS
+            alloc_order = slot // (2 * NR_MIGRATETYPES * NR_ORDERS)
+            hist[(alloc_order, fallback_order, migratetype, change_ownership)] = count
+        return hist
+
+    def get_stall_data(self):
+        """
+        汇总 allocstall.c 各表在所有 CPU 上的计数（自加载以来累计），返回
+          latency         {(zone_comm, order): [每个 log2 微秒桶的次数]}，只含有样本的项
+          stats           {order: {STALL_ITEMS 中的事件: 次数}}
+          compaction      {COMPACT_RESULTS 中的结果: 次数}
+          compact_latency [每个 log2 微秒桶的次数]
+        """
+        names = {}
+        for key, value in read_table(self.b["zone_name_map"]):
+            names[key.value] = value.name.decode('utf-8', 'replace').rstrip('\x00') or str(key.value)
+
+        latency = {}
+        for key, value in read_table(self.b["lat_hist"]):
+            count = sum(value)
+            if not count:
+                continue
+            slot = key.value % NR_LAT_SLOTS
+            order = (key.value // NR_LAT_SLOTS) % NR_ORDERS
+            zidx = key.value // (NR_LAT_SLOTS * NR_ORDERS)
+            counts = latency.setdefault((names.get(zidx, str(zidx)), order), [0] * NR_LAT_SLOTS)
+            counts[slot] += count
+
+        stats = {order: dict.fromkeys(STALL_ITEMS, 0) for order in range(NR_ORDERS)}
+        for key, value in read_table(self.b["stat_map"]):
+            item = key.value // NR_ORDERS
+            if item < len(STALL_ITEMS):
+                stats[key.value % NR_ORDERS][STALL_ITEMS[item]] = sum(value)
+
+        compaction = dict.fromkeys(COMPACT_RESULTS, 0)
+        for key, value in read_table(self.b["compact_map"]):
+            if key.value < len(COMPACT_RESULTS):
+                compaction[COMPACT_RESULTS[key.value]] = sum(value)
+
+        compact_latency = [0] * NR_LAT_SLOTS
+        for key, value in read_table(self.b["compact_hist"]):
+            compact_latency[key.value] = sum(value)
+
+        return {'latency': dict(sorted(latency.items())), 'stats': stats,
+                'compaction': compaction, 'compact_latency': compact_latency}
+
+    def sample(self):
+        """采集一次当前模式的数据：-s 为 (进程事件, 事件分布)，-a 为 get_stall_data()，其余为快照"""
+        if self.output_count:
+            with self.profile.stage('collect.read'):
+                return (self.get_count_data(), self.get_hist_data())
+        if self.output_stall:
+            with self.profile.stage('collect.read'):
+                return self.get_stall_data()
+        return self.snapshot()
+
+    def start(self, wake_fd=None):
+        """
+        启动后台采集线程。第一次采集在返回前完成，之后每个周期的结果整体替换 self.latest
+        （引用赋值是原子的，结果本身不再修改），UI、导出与录制只读取最新结果，不加锁。
+        wake_fd 不为 None 时每次发布后向其写入一个字节，通知在 select 中等待的读者。
+        """
+        self._wake_fd = wake_fd
+        self._stop.clear()
+        self.trigger()
+        self._publish()
+        self._thread = threading.Thread(target=self._collect_loop, name="mfd-collector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._poke.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poke(self):
+        """让采集线程立即额外采集一次（例如回放跳转后），不改变原有节拍"""
+        self._poke.set()
+
+    def collector_stats(self):
+        return {'ticks': self.ticks, 'missed': self.missed, 'late': self.late,
+                'collect_seconds': self.collect_seconds}
+
+    def status(self):
+        text = f"collector: interval {self.interval:g}s{' (adaptive)' if self.adaptive else ''}, " \
+               f"{self.ticks} ticks, {self.missed} missed, {self.late} late, " \
+               f"last {self.collect_seconds * 1000:.1f} ms"
+        if self.error is not None:
+            text += f", error: {self.error}"
+        return text
+
+    def _publish(self):
+        with self._lock:
+            start = time.monotonic()
+            try:
+                result = self.sample()
+            except Exception as e:
+                self.error = e
+                return
+            self.collect_seconds = time.monotonic() - start
+            self.latest = result
+            self.seq += 1
+        if self._wake_fd is not None:
             try:
-                time.sleep(self.interval)
-            except KeyboardInterrupt:
-                exit()
+                os.write(self._wake_fd, b'\0')
+            except OSError:
+                # 管道已满说明读者还没处理上一次通知，丢弃即可
+                pass
+
+    def _collect_loop(self):
+        """
+        按绝对时间表采集：第 k 个节拍在 起点 + k * interval，不随采集或读者的耗时漂移。
+        醒来时已经错过整个周期的节拍记为 missed 并跳过，晚于 LATE_TOLERANCE 的记为 late。
+        """
+        next_tick = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            timeout = next_tick - time.monotonic()
+            if timeout > 0 and self._poke.wait(timeout):
+                self._poke.clear()
+                if not self._stop.is_set():
+                    self._publish()
+                continue
+            lag = time.monotonic() - next_tick
+            if lag >= self.interval:
+                skipped = int(lag // self.interval)
+                self.missed += skipped
+                next_tick += skipped * self.interval
+                lag -= skipped * self.interval
+            if lag > LATE_TOLERANCE:
+                self.late += 1
+            self.ticks += 1
+            self._publish()
+            next_tick += self.interval
+
+    def wait(self):
+        """阻塞到 Ctrl+C，然后停止采集、关闭录制文件并等待触发转储写完"""
+        try:
+            while self._thread is not None and self._thread.is_alive():
+                self._thread.join(1)
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.triggers is not None:
+            self.triggers.close()
+
+    def run(self):
+        """无界面模式：后台线程按 interval 采集，配合 recorder/listeners 持续记录或导出"""
+        self.start()
+        self.wait()
@@ -2,75 +2,679 @@
 import traceback 
 import time
 import curses
+import os
+import select
+import signal
 import sys
-from extfrag import ExtFrag
+import numpy as np
+from extfrag import COMPACT_RESULTS, ExtFrag, MIGRATETYPE_NAMES, hist_percentile
+from kpageflags import CELL_CLEAN, CELL_FREE, CELL_HOLE, CELL_RAMP, Heatmap, heatmap_cells, zone_summary
+from fragindex import nr_free_from_suitable
+from exporter import Exporter
+from recorder import Recorder
+from render import BarPanel, Frame, Viewport, generate_fragmentation_bar
+from selfprof import Profiler
+from replay import format_query, parse_time, query
+from snapshot import NR_ORDERS
+from stats import STATIC_ORDER, STATIC_SCORE
+from trigger import FAST_INTERVAL, MIN_FAST_INTERVAL, POST_SECONDS, PRE_SECONDS, TriggerEngine, \
+    format_capture, parse_condition, read_capture
 from datetime import datetime
 
+# -s 视图中显示的进程数
+TOP_TASKS = 20
+# 最小窗口：表头、至少一行数据与状态栏。更小的窗口只显示提示
+MIN_ROWS = 6
+MIN_COLS = 40
+# o 键依次切换的排序：zone 顺序、当前值从高到低、偏离基线的标准差数从高到低
+SORT_MODES = ('zone', 'worst', 'dev')
+# 各视图过滤与排序时使用的 Snapshot 列
+METRIC_COLUMNS = {'scoreA': 'score_a', 'scoreB': 'score_b'}
+# 数字键切换的视图与对应的命令行参数（1 为默认视图），切换时不重新加载 eBPF 程序
+VIEW_KEYS = {ord('1'): None, ord('2'): 'zone_info', ord('3'): 'view', ord('4'): 'node_info',
+             ord('5'): 'heatmap', ord('6'): 'output_count', ord('7'): 'alloc_stall'}
 
-def generate_fragmentation_bar(score, max_length=20):
-    """生成用于显示碎片化程度的条形图"""
-    proportion = min(max(score, 0), 1)
-    bar_length = int(proportion * max_length)
-    return '#' * bar_length + '-' * (max_length - bar_length)
-def createBar(height,width,y,x,title:str):
-        winbar = curses.newwin(height,width,y,x)
-        winbar.border(0)
-        winbar.addstr(0,1,title)
-        winbar.refresh()
-        return winbar
-
-def setProgress(win,progress):
-        h,w = win.getmaxyx()
-        char_max_w= w-3
-        displayclear = "█"*char_max_w 
-        win.addstr(1, 1, "{}".format(displayclear),curses.color_pair(1))
-        rangex = (char_max_w / float(100)) * progress
-        pos = int(rangex)
-        res = 0
-        if pos==0:
-            res = 1
-            pos+=1
-        display = "█"*pos
-        numstr=str(format(progress,'.1f'))
-        win.addstr(0,w-9,"{}%".format(numstr)+" "*1)
-        if  res==0:
-            win.addstr(1, 1, "{}".format(display),curses.color_pair(2))
-            win.refresh()
-        else:
-            win.refresh()
 
-def screenEnough(screen):
+def screen_enough(screen, frame):
+    """窗口不足 MIN_COLS x MIN_ROWS 时显示提示并返回 False，尺寸变化后由主循环整屏重画"""
     height, width = screen.getmaxyx()
-    if height < 50 or width < 250:
-        _boo = True
-        screen.clear()
-        errmsg = "[ERROR] Screen size is not enough!"
-        screen.addstr(height // 2, abs(width - len(errmsg)) // 2, errmsg, curses.color_pair(2) | curses.A_BOLD)
-        notemsg = "Resize your window and check the font size, or [Ctrl+C] to quit."
-        screen.addstr(height // 2 + 1, abs(width - len(notemsg)) // 2, notemsg, curses.A_REVERSE)
-
-        key = 0  
+    if height >= MIN_ROWS and width >= MIN_COLS:
+        return True
+    frame.invalidate()
+    errmsg = "[ERROR] Screen size is not enough!"
+    screen.addstr(height // 2, abs(width - len(errmsg)) // 2, errmsg[:width - 1], curses.color_pair(2) | curses.A_BOLD)
+    notemsg = "Resize your window and check the font size, or [Ctrl+C] to quit."
+    screen.addstr(height // 2 + 1, abs(width - len(notemsg)) // 2, notemsg[:width - 1], curses.A_REVERSE)
+    return False
+
+
+def draw_node_info(frame, extfrag, args, snap):
+    with extfrag.profile.stage('ui.transform'):
+        node_data = extfrag.get_node_data(snap)
+    if not node_data:
+        return 0
+    header = f"{'NODE_ID':>45} {'Number of Zones':>65} {'NODE_START_PFN':>70}\n"
+    frame.draw(0, header, lambda: header, curses.color_pair(4))
+    row = 1
+    for node_id, node in node_data.items():
+        key = (node_id, node['nr_zones'], node['pgdat_ptr'])
+        line = lambda: f"{node_id:>40} {node['nr_zones']:>60} {node['pgdat_ptr']:>77}\n"
+        if frame.draw(row, key, line):
+            row += 1
+    return row
+
+
+def draw_count(frame, event_data, hist_data):
+    header = f"{'COMM':>25} {'PID':>30} {'LAST_PFN':>45}" \
+            f"{'LAST_ALLOC_ORDER':>45} {'LAST_FALLBACK_ORDER':>45} {'COUNT':>35} \n"
+    frame.draw(0, header, lambda: header, curses.color_pair(4))
+    row = 1
+    for event in event_data:
+        key = tuple(event.values())
+        line = lambda: f"{event['pcomm']:>25} {event['pid']:>30} {event['last_pfn']:>45}{event['last_alloc_order']:>45} {event['last_fallback_order']:>45} {event['count']:>35} \n"
+        if frame.draw(row, key, line):
+            row += 1
+    # 按 (alloc_order, fallback_order, migratetype, change_ownership) 的事件分布
+    row += 1
+    header = f"{'ALLOC_ORDER':>25} {'FALLBACK_ORDER':>30} {'MIGRATETYPE':>45}" \
+            f"{'CHANGE_OWNERSHIP':>45} {'COUNT':>45} {'SHARE':>35} \n"
+    if not frame.draw(row, header, lambda: header, curses.color_pair(4)):
+        return row
+    row += 1
+    total = sum(hist_data.values()) or 1
+    for (alloc_order, fallback_order, migratetype, change), count in \
+            sorted(hist_data.items(), key=lambda x: x[1], reverse=True):
+        name = MIGRATETYPE_NAMES[migratetype] if migratetype < len(MIGRATETYPE_NAMES) else str(migratetype)
+        key = (alloc_order, fallback_order, migratetype, change, count, total)
+        line = lambda: f"{alloc_order:>25} {fallback_order:>30} {name:>45}" \
+            f"{'yes' if change else 'no':>45} {count:>45} {count * 100 / total:>34.1f}% \n"
+        if not frame.draw(row, key, line):
+            break
+        row += 1
+    return row
+
+
+def format_latency(us):
+    return f"<{us}us" if us < 1000 else f"<{us / 1000:g}ms" if us < 1000000 else f"<{us / 1000000:g}s"
+
+
+def latency_shape(counts):
+    """把 log2 直方图压缩成一行字符，每个桶一个字符，高度按最大桶归一化"""
+    levels = " .:-=+*#%@"
+    top = max(counts) or 1
+    last = max((i for i, c in enumerate(counts) if c), default=0)
+    return ''.join(levels[(c * (len(levels) - 1) + top - 1) // top] for c in counts[:last + 1])
+
+
+def draw_stall(frame, stall_data):
+    header = f"{'ZONE_COMM':>15} {'ORDER':>10} {'SLOWPATH':>15} {'P50':>15} {'P90':>15} {'P99':>15} " \
+             f"{'MAX':>15}    {'LATENCY (log2 us)':<40}\n"
+    frame.draw(0, header, lambda: header, curses.color_pair(4))
+    row = 1
+    for (comm, order), counts in stall_data['latency'].items():
+        key = (comm, order, tuple(counts))
+        line = lambda: f"{comm:>15} {order:>10} {sum(counts):>15} " \
+            + ''.join(f"{format_latency(hist_percentile(counts, q)):>16}" for q in (50, 90, 99, 100)) \
+            + f"    {latency_shape(counts):<40}\n"
+        # 有请求落到最后几个桶（>= 1ms）时标红
+        color = curses.color_pair(2) if any(counts[11:]) else curses.color_pair(3)
+        if frame.draw(row, key, line, color):
+            row += 1
+
+    # 按 order 的事件计数
+    row += 1
+    header = f"{'ORDER':>15} {'SLOWPATH':>20} {'SLOWPATH_FAIL':>20} {'ALLOC_FAIL':>20} {'KCOMPACTD_WAKE':>20}\n"
+    if not frame.draw(row, header, lambda: header, curses.color_pair(4)):
+        return row
+    row += 1
+    for order, stats in stall_data['stats'].items():
+        key = (order,) + tuple(stats.values())
+        line = lambda: f"{order:>15} {stats['slowpath']:>20} {stats['slowpath_fail']:>20} " \
+            f"{stats['alloc_fail']:>20} {stats['kcompactd_wake']:>20}\n"
+        if not frame.draw(row, key, line):
+            return row
+        row += 1
+
+    # 内存规整结果与耗时
+    row += 1
+    header = ''.join(f"{'COMPACT_' + name.upper():>20}" for name in COMPACT_RESULTS) \
+        + f"{'P50':>16}{'P99':>16}    {'LATENCY (log2 us)':<40}\n"
+    if not frame.draw(row, header, lambda: header, curses.color_pair(4)):
+        return row
+    row += 1
+    compaction, counts = stall_data['compaction'], stall_data['compact_latency']
+    key = tuple(compaction.values()) + tuple(counts)
+    line = lambda: ''.join(f"{compaction[name]:>20}" for name in COMPACT_RESULTS) \
+        + ''.join(f"{format_latency(hist_percentile(counts, q)):>16}" for q in (50, 99)) \
+        + f"    {latency_shape(counts):<40}\n"
+    if frame.draw(row, key, line):
+        row += 1
+    return row
+
+
+def zone_metric(args):
+    return "scoreA" if args['extfrag_index'] else "scoreB"
+
+
+def zone_color(zone, args):
+    """当前值明显高于该 (zone, order) 自身历史时标红，规则见 stats.py"""
+    color = curses.color_pair(3)
+    stats = zone['stats']
+    if stats is None:
+        alert = zone['order'] > 5 and zone['scoreB'] > 0.5
+    else:
+        alert = stats[zone_metric(args)]['alert']
+    if alert:
+        color = curses.color_pair(2)  # 红色，表示高风险
+    return color
+
+
+def format_baseline(zone, args):
+    """当前值对应的基线（EWMA）、窗口 p99 与偏离基线的标准差数"""
+    stats = zone['stats']
+    if stats is None:
+        return f"{'-':^10}{'-':^8}{'-':^7}"
+    st = stats[zone_metric(args)]
+    return f"{st['baseline']:^10.3f}{st['p99']:^8.3f}{st['dev']:^+7.1f}"
+
+
+def format_bar(zone, args, width=40):
+    """进度条中 '|' 标出基线所在位置"""
+    stats = zone['stats']
+    baseline = None if stats is None else stats[zone_metric(args)]['baseline']
+    frag_bar = generate_fragmentation_bar(zone[zone_metric(args)], baseline=baseline)
+    return f" {frag_bar:^{width}}"
+
+
+def format_zone_info(zone, args):
+    if args['extfrag_index'] :
+        line = f"{zone['comm']:^9} {zone['zone_pfn']:^20} {zone['spanned_pages']:^22} " \
+        f"{zone['present_pages']:^18} {zone['order']:^15} {zone['free_blocks_total']:^25} " \
+        f"{zone['free_blocks_suitable']:^15} {zone['free_pages']:^25} {zone['node_id']:^15} {zone['scoreA']:^20.3f} "
+    elif  args['unusable_index']:
+        line = f"{zone['comm']:^9} {zone['zone_pfn']:^20} {zone['spanned_pages']:^22} " \
+        f"{zone['present_pages']:^18} {zone['order']:^15} {zone['free_blocks_total']:^25} " \
+        f"{zone['free_blocks_suitable']:^15} {zone['free_pages']:^25} {zone['node_id']:^15} {zone['scoreB']:^20.3f} "
+    else:
+        line = f"{zone['comm']:^9} {zone['zone_pfn']:^20} {zone['spanned_pages']:^22} " \
+        f"{zone['present_pages']:^18} {zone['order']:^15} {zone['free_blocks_total']:^25} " \
+        f"{zone['free_blocks_suitable']:^15} {zone['free_pages']:^25} {zone['node_id']:^15} {zone['scoreA']:^20.3f} {zone['scoreB']:^25.3f} "
+    if args['bar']:
+        line += format_bar(zone, args)
+    return line + format_baseline(zone, args) + "\n"
+
+
+def format_zone_summary(zone, args):
+    if args['extfrag_index'] :
+        line = f"{zone['comm']:^7}  {zone['node_id']:^55}  {zone['order']:^55} {zone['scoreA']:^35.3f} "
+    elif  args['unusable_index']:
+        line = f"{zone['comm']:^7}  {zone['node_id']:^55}  {zone['order']:^55} {zone['scoreB']:^35.3f} "
+    else:
+        line = f"{zone['comm']:^7}  {zone['node_id']:^55}  {zone['order']:^55} {zone['scoreA']:^35.3f}  {zone['scoreB']:^25.3f} "
+    if args['bar']:
+        line += format_bar(zone, args)
+    return line + format_baseline(zone, args) + "\n"
+
+
+def format_zone_compact(zone, args):
+    """窗口放不下完整表格时每行只保留必要的列"""
+    line = f"{zone['comm']:<9}{zone['node_id']:>5}{zone['order']:>6}"
+    if args['zone_info']:
+        line += f"{zone['free_pages']:>10}{zone['free_blocks_suitable']:>10}"
+    if args['extfrag_index']:
+        line += f"{zone['scoreA']:>10.3f}"
+    elif args['unusable_index']:
+        line += f"{zone['scoreB']:>10.3f}"
+    else:
+        line += f"{zone['scoreA']:>10.3f}{zone['scoreB']:>10.3f}"
+    line += "  "
+    if args['bar']:
+        line += format_bar(zone, args, 21)
+    return line + format_baseline(zone, args) + "\n"
+
+
+def compact_header(args):
+    header = f"{'COMM':<9}{'NODE':>5}{'ORDER':>6}"
+    if args['zone_info']:
+        header += f"{'FREE':>10}{'SUITABLE':>10}"
+    if args['extfrag_index']:
+        header += f"{'extfrag':>10}"
+    elif args['unusable_index']:
+        header += f"{'unusable':>10}"
+    else:
+        header += f"{'extfrag':>10}{'unusable':>10}"
+    header += "  "
+    if args['bar']:
+        header += f"{'BAR':^22}"
+    return header + f"{'BASELINE':^10}{'P99':^8}{'DEV':^7}\n"
+
+
+def filtered_zones(args, snap):
+    """按节点与 zone 名过滤后的 zone 下标，保持 snap.zones 的顺序"""
+    return [z for z, (node_id, comm, _, _, _) in enumerate(snap.zones)
+            if (args['node_id'] is None or node_id == args['node_id'])
+            and (not args['comm'] or comm == args['comm'])]
+
+
+def rank_cells(extfrag, args, snap, zones, metric):
+    """
+    zones 中每个 zone 的每个 order 按 args['sort'] 排序（稳定排序，相同时保持原顺序），
+    args['alerts'] 时只保留异常的 (zone, order)，返回 [(zone 下标, order)]
+    """
+    if not zones:
+        return []
+    m = 0 if metric == 'score_a' else 1
+    z = np.repeat(np.array(zones), NR_ORDERS)
+    order = np.tile(np.arange(NR_ORDERS), len(zones))
+    values = np.array(getattr(snap, metric))[z, order]
+    summary = extfrag.summary_for(snap)
+    if args['alerts']:
+        if summary is None:
+            keep = (order > STATIC_ORDER) & (values > STATIC_SCORE)
+        else:
+            keep = np.array(summary.alert[m])[z, order]
+        z, order, values = z[keep], order[keep], values[keep]
+    if args['sort'] == 'worst':
+        idx = np.argsort(-values, kind='stable')
+    elif args['sort'] == 'dev' and summary is not None:
+        idx = np.argsort(-np.array(summary.dev[m])[z, order], kind='stable')
+    else:
+        idx = np.arange(len(z))
+    return list(zip(z[idx].tolist(), order[idx].tolist()))
+
+
+def zone_cells(extfrag, args, snap):
+    """表格视图的行：默认按 zone 名分组（按首次出现的顺序），组内按节点与 order 排列"""
+    zones = filtered_zones(args, snap)
+    group = {}
+    for _, comm, _, _, _ in snap.zones:
+        group.setdefault(comm, len(group))
+    zones.sort(key=lambda z: group[snap.zones[z][1]])
+    return rank_cells(extfrag, args, snap, zones, METRIC_COLUMNS[zone_metric(args)])
+
+
+def view_key(args, snap, kind):
+    """视口缓存排序结果所依据的设置，同一快照下滚动时不重新排序"""
+    return (kind, snap, args['sort'], args['alerts'], args['node_id'], args['comm'],
+            args['extfrag_index'])
+
+
+def draw_zones(frame, extfrag, args, snap, viewport, formatter, header, bar_width):
+    """
+    只为视口中可见的行取数据并格式化，每帧的开销取决于窗口高度，与 zone 数无关。
+    窗口放不下完整表格时换用紧凑格式
+    """
+    max_rows, max_cols = frame.screen.getmaxyx()
+    if args['bar']:
+        header += f"{'BAR':>{bar_width}}{' ' * (41 - bar_width)}"
+    # 基线列放在进度条之后，窗口较窄时进度条优先显示
+    header += f"{'BASELINE':^10}{'P99':^8}{'DEV':^7}\n"
+    if len(header) > max_cols:
+        formatter, header = format_zone_compact, compact_header(args)
+    frame.draw(0, header, lambda: header, curses.color_pair(4))
+    with extfrag.profile.stage('ui.transform'):
+        cells = viewport.cached(view_key(args, snap, 'zones'), lambda: zone_cells(extfrag, args, snap))
+        # 第 0 行为表头，最后一行是状态栏
+        viewport.layout(len(cells), max_rows - 2)
+        zone_data = extfrag.get_zone_rows(snap, [cells[i] for i in viewport.visible()])
+    row = 1
+    for zone in zone_data:
+        key = (formatter, tuple(zone.values()))
+        if frame.draw(row, key, lambda: formatter(zone, args), zone_color(zone, args)):
+            row += 1
+    return row
+
+
+def draw_zone_info(frame, extfrag, args, snap, viewport):
+    if args['extfrag_index']:
+        header =f"{'ZONE_COMM':>5} {'ZONE_PFN':>15} {'SUM_PAGES':>20} {'FACT_PAGES':>20} " \
+            f"{'ORDER':>15} {'TOTAL':>20} {'SUITABLE':>20} {'FREE':>20} {'NODE_ID':>20} {'extfrag_index':>25}"
+    elif args['unusable_index']:
+        header =  f"{'ZONE_COMM':>5} {'ZONE_PFN':>15} {'SUM_PAGES':>20} {'FACT_PAGES':>20} " \
+            f"{'ORDER':>15} {'TOTAL':>20} {'SUITABLE':>20} {'FREE':>20} {'NODE_ID':>20} {'unusable_index':>25} "
+    else:
+        header = f"{'ZONE_COMM':>5} {'ZONE_PFN':>15} {'SUM_PAGES':>20} {'FACT_PAGES':>20} " \
+            f"{'ORDER':>15} {'TOTAL':>20} {'SUITABLE':>20} {'FREE':>20} {'NODE_ID':>20} {'extfrag_index':>25} {'unusable_index':>20}"
+    return draw_zones(frame, extfrag, args, snap, viewport, format_zone_info, header, 25)
+
+
+def draw_migratetypes(frame, extfrag, args, snap, viewport):
+    """
+    -z 的子视图：每个 (zone, order) 一行，每个 migratetype 两列，为该 order 的空闲块数与
+    只看该 migratetype 空闲链表时的指标（-e 为 extfrag_index，否则为 unusable_index）。
+    高阶空闲块在 Movable 还是 Unmovable 链表上，决定了内存规整能否起作用
+    """
+    if not snap.migratetypes:
+        pagetypes = extfrag.pagetypes
+        msg = pagetypes.error if pagetypes is not None and pagetypes.error else "reading /proc/pagetypeinfo ..."
+        frame.draw(0, msg, lambda: msg, curses.color_pair(2))
+        return 1
+    max_rows, max_cols = frame.screen.getmaxyx()
+    metric = zone_metric(args)
+    label = 'extfrag' if args['extfrag_index'] else 'unusable'
+    header = f"{'COMM':<9}{'NODE':>5}{'ORDER':>6}" + \
+             ''.join(f"{name[:11]:>12}{label:>9}" for name in snap.migratetypes)
+    frame.draw(0, header, lambda: header, curses.color_pair(4))
+    with extfrag.profile.stage('ui.transform'):
+        cells = viewport.cached(view_key(args, snap, 'zones'), lambda: zone_cells(extfrag, args, snap))
+        viewport.layout(len(cells), max_rows - 2)
+        rows = extfrag.get_migratetype_rows(snap, [cells[i] for i in viewport.visible()])
+    row = 1
+    for mt_row in rows:
+        key = tuple(mt_row.values()) + (metric,)
+        line = lambda: f"{mt_row['comm']:<9}{mt_row['node_id']:>5}{mt_row['order']:>6}" + \
+            ''.join(f"{free:>12}{score:>9.3f}" for free, score in zip(mt_row['free'], mt_row[metric]))
+        if frame.draw(row, key, line, curses.color_pair(3)):
+            row += 1
+    return row
+
+
+def draw_summary(frame, extfrag, args, snap, viewport):
+    if args['extfrag_index']:
+        header =f"{'ZONE_COMM':<30}  {'NODE_ID':<23} {'ORDER':>40} {'extfrag_index':>50} "
+    elif args['unusable_index']:
+        header = f"{'ZONE_COMM':<30}  {'NODE_ID':<23} {'ORDER':>40}  {'unusable_index':>50} "
+    else:
+        header = f"{'ZONE_COMM':<30}  {'NODE_ID':<23} {'ORDER':>40} {'extfrag_index':>50} {'unusable_index':>30} "
+    return draw_zones(frame, extfrag, args, snap, viewport, format_zone_summary, header, 30)
+
+
+def view_zones(extfrag, args, snap):
+    """-v 视图的 zone 顺序：按 unusable_index 排序时取各 zone 中最高的 order"""
+    cells = rank_cells(extfrag, args, snap, filtered_zones(args, snap), 'score_b')
+    return list(dict.fromkeys(z for z, _ in cells))
+
+
+def draw_view(frame, extfrag, args, snap, viewport):
+    """只为视口中的 zone 画标签，返回交给 BarPanel 的可见 zone"""
+    current_time = datetime.now().strftime('%Y--%m-%d：%H:%M:%S')
+    frame.draw(0, current_time, lambda: current_time)
+    max_rows, max_cols = frame.screen.getmaxyx()
+    slots = BarPanel.capacity(max_rows)
+    with extfrag.profile.stage('ui.transform'):
+        order = viewport.cached(view_key(args, snap, 'view'), lambda: view_zones(extfrag, args, snap))
+        viewport.layout(len(order), slots)
+    zones = []
+    for i in viewport.visible():
+        z = order[i]
+        node_id, comm = snap.zones[z][:2]
+        scores = [v / 1000 for v in snap.score_b[z]]
+        label = f"Node {node_id}, zone {comm}   "
+        frame.draw(3 + 3 * len(zones), label, lambda: label)
+        zones.append((node_id, comm, scores))
+    # 过滤后 zone 变少时擦掉多出的标签
+    for slot in range(len(zones), slots):
+        frame.draw(3 + 3 * slot, '', lambda: '')
+    return zones
+
+
+def draw_heatmap(frame, heatmap, args, snap):
+    """
+    每个 zone 一行摘要加若干行热力图，按物理地址从左到右、从上到下排列，
+    每个字符覆盖相邻的若干 pageblock，字符含义见图例
+    """
+    zones = [zone for zone in snap.zones
+             if (args['node_id'] is None or zone[0] == args['node_id'])
+             and (not args['comm'] or zone[1] == args['comm'])]
+    # 快照的 nr_free 用来确定 kpageflags 中各空闲块的 order
+    nr_free = nr_free_from_suitable(snap.free_blocks_suitable)
+    heatmap.refresh(zones, {zone[:2]: nr_free[z] for z, zone in enumerate(snap.zones)})
+    legend = f"'{CELL_HOLE}' hole  '{CELL_FREE}' all free  '{CELL_CLEAN}' movable/free only  " \
+             f"'{CELL_RAMP}' more pageblocks with unmovable pages"
+    frame.draw(0, legend, lambda: legend, curses.color_pair(4))
+    if heatmap.result is None:
+        return 1
+    max_rows, max_cols = frame.screen.getmaxyx()
+    width = max_cols - 1
+    block_pages = heatmap.scanner.block_pages
+    # 最后一行是状态栏，剩下的行在 zone 之间平分
+    rows_per_zone = max((max_rows - 2) // max(len(zones), 1) - 1, 1)
+    row = 1
+    for node_id, comm, zone_pfn, spanned, present in zones:
+        if (node_id, comm) not in heatmap.result:
+            continue
+        first_pfn, counts = heatmap.result[(node_id, comm)]
+        blocks, pinned, free, unmovable = zone_summary(counts, block_pages)
+        label = f"Node {node_id}, zone {comm:<8} pfn {zone_pfn:#x}-{zone_pfn + spanned:#x}  " \
+                f"pageblocks {blocks}  with unmovable {pinned} ({pinned / max(blocks, 1):.1%})  " \
+                f"free pages {free:.1%}  unmovable pages {unmovable:.1%}"
+        if not frame.draw(row, label, lambda: label, curses.color_pair(6)):
+            break
+        row += 1
+        rows = min(rows_per_zone, -(-len(counts) // width))
+        cells = heatmap_cells(counts, block_pages, width * rows)
+        for i in range(0, len(cells), width):
+            line = cells[i:i + width]
+            if not frame.draw(row, line, lambda: line):
+                return row
+            row += 1
+    return row
+
+
+def read_keys(screen):
+    keys = []
+    key = screen.getch()
+    while key != -1:
+        keys.append(key)
+        key = screen.getch()
+    return keys
+
+
+def handle_view_key(key, args, snap, viewport):
+    """
+    滚动与排序、过滤按键，处理了返回 True：方向键/PgUp/PgDn/Home/End 滚动，
+    o 切换排序，a 只看异常，n/c 依次切换节点/zone 过滤，x 清除过滤
+    """
+    if viewport.handle_key(key):
+        return True
+    if key == ord('o'):
+        args['sort'] = SORT_MODES[(SORT_MODES.index(args['sort']) + 1) % len(SORT_MODES)]
+    elif key == ord('a'):
+        args['alerts'] = not args['alerts']
+    elif key in (ord('n'), ord('c')):
+        zones = getattr(snap, 'zones', None)
+        if not zones:
+            return False
+        field, col = ('node_id', 0) if key == ord('n') else ('comm', 1)
+        # 依次为每个取值，之后回到不过滤
+        values = [None] + sorted({zone[col] for zone in zones})
+        current = args[field] if args[field] in values else None
+        args[field] = values[(values.index(current) + 1) % len(values)]
+    elif key == ord('x'):
+        args['node_id'] = None
+        args['comm'] = None
+        args['alerts'] = False
+    else:
+        return False
+    viewport.top = 0
+    return True
+
+
+def switch_view(key, args, extfrag):
+    """
+    数字键切换视图，返回是否切换。-s/-a 的数据源由 extfrag.switch_source() 在同一个程序中开启，
+    只有 eBPF 后端支持
+    """
+    view = VIEW_KEYS[key]
+    if view in ('output_count', 'alloc_stall') and extfrag.backend != 'bpf':
+        return False
+    for flag in VIEW_KEYS.values():
+        if flag is not None:
+            args[flag] = flag == view
+    if (args['output_count'], args['alloc_stall']) != (extfrag.output_count, extfrag.output_stall):
+        extfrag.switch_source(output_count=args['output_count'], output_stall=args['alloc_stall'])
+    show_migratetypes(args, extfrag)
+    return True
+
+
+def show_migratetypes(args, extfrag):
+    """只在显示 -z -m 子视图时读取 /proc/pagetypeinfo，读取时内核要持 zone->lock 遍历空闲链表"""
+    wanted = args['zone_info'] and args['migratetype'] and extfrag.backend != 'replay'
+    if wanted != (extfrag.pagetypes is not None):
+        extfrag.set_migratetypes(wanted)
+        # 不必等下一个周期
+        extfrag.poke()
+
+
+def view_status(args, viewport):
+    status = f"{viewport.status()}  sort {args['sort']}"
+    if args['node_id'] is not None:
+        status += f"  node {args['node_id']}"
+    if args['comm']:
+        status += f"  zone {args['comm']}"
+    if args['alerts']:
+        status += "  alerts only"
+    return status
+
+
+def draw_waiting(frame, extfrag):
+    """还没有任何采集结果时只画一行：第一次采集失败的原因（采集线程按节拍继续重试）或等待提示"""
+    if extfrag.error is not None:
+        text = f"collection failed: {extfrag.error}, retrying every {extfrag.interval:g}s\n"
+        attr = curses.color_pair(2)
+    else:
+        text = "waiting for the first sample...\n"
+        attr = curses.color_pair(4)
+    frame.draw(0, text, lambda: text, attr)
+    return 1
+
+
+def draw_frame(screen, frame, panel, viewport, extfrag, args, data, heatmap=None, replay=None):
+    """
+    按 args 选择的视图画一帧 data（extfrag.latest）并刷新到终端，bench.py 也通过它测量绘制开销。
+    data 为 None（第一次采集失败或还没完成）时各视图都只显示 draw_waiting() 的一行。
+    zone 表格与 -v 视图只画 viewport 中可见的部分，状态栏开头为可见范围与排序、过滤设置；
+    开启 --profile 时状态栏附加各阶段每秒耗费的毫秒数
+    """
+    profile = extfrag.profile
+    view_zones = None
+    if screen_enough(screen, frame):
+        if data is None:
+            row = draw_waiting(frame, extfrag)
+        elif args['node_info']:
+            row = draw_node_info(frame, extfrag, args, data)
+        elif args['output_count']:
+            event_data, hist_data = data
+            row = draw_count(frame, event_data[:TOP_TASKS], hist_data)
+        elif args['alloc_stall']:
+            row = draw_stall(frame, data)
+        elif heatmap is not None:
+            row = draw_heatmap(frame, heatmap, args, data)
+        elif args['zone_info'] and args['migratetype']:
+            row = draw_migratetypes(frame, extfrag, args, data, viewport)
+        elif args['zone_info']:
+            row = draw_zone_info(frame, extfrag, args, data, viewport)
+        elif args['view']:
+            view_zones = draw_view(frame, extfrag, args, data, viewport)
+        else:
+            row = draw_summary(frame, extfrag, args, data, viewport)
+        if view_zones is None:
+            frame.clear_below(row)
+        status = replay.status() if replay is not None else extfrag.status()
+        if not (args['node_info'] or args['output_count'] or args['alloc_stall'] or heatmap is not None):
+            status = view_status(args, viewport) + "  |  " + status
+        if heatmap is not None:
+            status += "  |  " + heatmap.status()
+        elif extfrag.pagetypes is not None and args['zone_info'] and args['migratetype']:
+            status += "  |  " + extfrag.pagetypes.status()
+        if profile.enabled:
+            status += "  |  " + profile.status()
+        frame.status(status, curses.A_REVERSE)
+    with profile.stage('ui.refresh'):
+        screen.noutrefresh()
+        if args['view'] and view_zones is not None:
+            panel.update(screen, view_zones)
+        curses.doupdate()
+
+
+def run_loop(screen, extfrag, args, replay):
+    """
+    事件驱动主循环：采集在 ExtFrag 的后台线程中按固定节拍进行，每发布一次结果通过管道唤醒界面；
+    select 同时等待该通知、键盘输入和窗口尺寸变化，没有事件时不占用 CPU。
+    界面只读取 extfrag.latest，绘制再慢也不会推迟采集；每帧只重画发生变化的行与进度条窗口。
+    """
+    frame = Frame(screen, extfrag.profile)
+    panel = BarPanel(NR_ORDERS)
+    viewport = Viewport()
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
+    resized = []
+
+    def on_winch(signum, stack):
+        resized.append(signum)
+
+    old_winch = signal.signal(signal.SIGWINCH, on_winch)
+    old_wakeup = signal.set_wakeup_fd(wake_w)
+    # 第一次切换到 -k 视图时才创建
+    heatmap = None
+    extfrag.start(wake_fd=wake_w)
+    try:
         while True:
-            screen.refresh()
-            height, width = screen.getmaxyx()
-            if height >= 50 and width >= 250:
-                _boo = False
-                screen.clear()
-                break
+            data = extfrag.latest
+            if resized:
+                del resized[:]
+                height, width = os.get_terminal_size(sys.__stdout__.fileno())
+                curses.resizeterm(height, width)
+                frame.invalidate()
+                panel.reset()
+            # -n、-s、-a 优先于 -k
+            active = None
+            if args['heatmap'] and not (args['node_info'] or args['output_count'] or args['alloc_stall']):
+                if heatmap is None:
+                    heatmap = Heatmap(wake_fd=wake_w)
+                active = heatmap
+            draw_frame(screen, frame, panel, viewport, extfrag, args, data, active, replay)
+
             try:
-                key = screen.getch() 
-                if key == curses.KEY_RESIZE: 
-                    continue
-            except KeyboardInterrupt:  # 捕获Ctrl+C
-                curses.endwin()
-                exit(0)
-
-def main(screen):
-    _boo = False
-    _show=False
-    last_update_time = time.time()
+                ready, _, _ = select.select([sys.stdin, wake_r], [], [])
+            except InterruptedError:
+                ready = []
+            if wake_r in ready:
+                os.read(wake_r, 512)
+            if sys.stdin in ready:
+                for key in read_keys(screen):
+                    if key in (ord('q'), ord('Q')):
+                        return
+                    if key == ord('m') and args['zone_info']:
+                        args['migratetype'] = not args['migratetype']
+                        show_migratetypes(args, extfrag)
+                        frame.invalidate()
+                        continue
+                    if key in VIEW_KEYS:
+                        if switch_view(key, args, extfrag):
+                            frame.invalidate()
+                            panel.reset()
+                            viewport.top = 0
+                            data = extfrag.latest
+                        continue
+                    if handle_view_key(key, args, data, viewport):
+                        continue
+                    if replay is None:
+                        continue
+                    if key == ord(' '):
+                        replay.toggle_pause()
+                    elif key in (ord('+'), ord('f')):
+                        replay.faster()
+                    elif key == ord('-'):
+                        replay.slower()
+                    elif key in (ord('>'), curses.KEY_RIGHT):
+                        replay.seek(10)
+                    elif key in (ord('<'), curses.KEY_LEFT):
+                        replay.seek(-10)
+                    # 回放控制立即生效，不必等下一个周期
+                    extfrag.poke()
+    finally:
+        extfrag.stop()
+        signal.set_wakeup_fd(old_wakeup)
+        signal.signal(signal.SIGWINCH, old_winch)
+        os.close(wake_r)
+        os.close(wake_w)
+
+
+def main(screen, profile=None):
     curses.curs_set(0)  # 隐藏光标 
-    screen.nodelay(True) 
+    screen.nodelay(True)  # 只在 select 报告可读后读取按键，不会忙等
+    screen.keypad(True)
     curses.noecho()
     curses.cbreak()
     screen.clear()
@@ -93,7 +697,7 @@ def main(screen):
             i=0
             while i<arg_count:
                 arg=args[i]
-                if arg.startswith('-') and  arg not in ["-d", "-n", "-i", "-c", "-h", "--help", "-e", "-u", "-b", "-s", "-z","-v"]:
+                if arg.startswith('-') and  arg not in ["-d", "-n", "-i", "-c", "-h", "--help", "-e", "-u", "-b", "-s", "-z","-v","-p","-r","-a","-A","-k","-W","-m","--profile"]:
                     screen.clear()
                     height, width = screen.getmaxyx()
                     errmsg = f'[ERROR] Unrecognized argument: {arg}\n'
@@ -113,8 +717,8 @@ def main(screen):
                         screen.refresh()
                         time.sleep(100)
                     i+=1
-                elif arg=='-i':
-                    if i + 1 >= arg_count or not args[i + 1].isdigit():
+                elif arg in ('-i', '-W'):
+                    if i + 1 >= arg_count or not args[i + 1].isdigit() or (arg == '-W' and int(args[i + 1]) == 0):
                         screen.clear()
                         height, width = screen.getmaxyx()
                         errmsg = f'[ERROR] Unrecognized argument: {arg}\n'
@@ -124,6 +728,33 @@ def main(screen):
                         screen.refresh()
                         time.sleep(100)
                     i+=1 
+                elif arg=='-r':
+                    if i + 1 >= arg_count:
+                        screen.clear()
+                        height, width = screen.getmaxyx()
+                        errmsg = f'[ERROR] Unrecognized argument: {arg}\n'
+                        screen.addstr(height // 2, abs(width - len(errmsg)) // 2, errmsg, curses.color_pair(2) | curses.A_BOLD)
+                        notemsg = "Use argument -h or --help for help"
+                        screen.addstr(height // 2 + 1, abs(width - len(notemsg)) // 2, notemsg, curses.A_REVERSE)
+                        screen.refresh()
+                        time.sleep(100)
+                    i+=1
+                elif arg=='-A':
+                    try:
+                        parse_adaptive(args[i + 1])
+                        valid = True
+                    except (IndexError, ValueError):
+                        valid = False
+                    if not valid:
+                        screen.clear()
+                        height, width = screen.getmaxyx()
+                        errmsg = f'[ERROR] Unrecognized argument: {arg}\n'
+                        screen.addstr(height // 2, abs(width - len(errmsg)) // 2, errmsg, curses.color_pair(2) | curses.A_BOLD)
+                        notemsg = "Use argument -h or --help for help"
+                        screen.addstr(height // 2 + 1, abs(width - len(notemsg)) // 2, notemsg, curses.A_REVERSE)
+                        screen.refresh()
+                        time.sleep(100)
+                    i+=1
                 elif arg=='-c':
                     valid_options = ["Moveable", "DMA", "Normal","DMA32","Device"]
                     if i + 1 >= arg_count or args[i + 1] not in valid_options:
@@ -141,27 +772,44 @@ def main(screen):
 
                 
         if "-h" in sys.argv or "--help" in sys.argv:
-            screenEnough(screen)
-            if not _boo:
-                screen.clear()
-                header1 =f"Usage: {sys.argv[0]} [argument]\n\n"\
-                f'Arguments:\n'\
-                f'    -d, --delay           Delay between updates in seconds (default: 2)\n'\
-                f'    -n, --node_info       Output node informations\n'\
-                f'    -i, --node_id         Specify Node ID to get zone information\n'\
-                f'    -c, --comm            Filter by zone_comm name\n'\
-                f'    -e, --extfrag_index   Only output extfrag_index\n'\
-                f'    -u, --unusable_index  Only output unusable_index\n'\
-                f'    -s, --output_count    Output fragmentation count\n'\
-                f'    -b, --bar             Display fragmentation bar\n'\
-                f'    -z, --zone_info       Display detailed zone information\n'\
-                f'    -v, --view            Display fragmentation figure\n'\
-                f'    -h, --help            Show this help message and exit\n'
-                msg = f"Please Crtl + C  exiting......\n\n"
-                screen.addstr(0, 0, header1)
-                screen.addstr(15, 0, msg)
-                screen.refresh()
-                time.sleep(100)
+            screen.clear()
+            header1 =f"Usage: {sys.argv[0]} [argument]\n\n"\
+            f'Arguments:\n'\
+            f'    -d, --delay           Delay between updates in seconds (default: 2)\n'\
+            f'    -A, --adaptive MIN:MAX Adapt the delay within [MIN, MAX] seconds to the order-9/10 trend\n'\
+            f'    -W, --window          Window in seconds of the baseline min/max/percentiles (default: 600)\n'\
+            f'    -n, --node_info       Output node informations\n'\
+            f'    -i, --node_id         Specify Node ID to get zone information\n'\
+            f'    -c, --comm            Filter by zone_comm name\n'\
+            f'    -e, --extfrag_index   Only output extfrag_index\n'\
+            f'    -u, --unusable_index  Only output unusable_index\n'\
+            f'    -s, --output_count    Output fragmentation count\n'\
+            f'    -a, --alloc_stall     Output slow-path allocation latency and compaction results\n'\
+            f'    -b, --bar             Display fragmentation bar\n'\
+            f'    -z, --zone_info       Display detailed zone information\n'\
+            f'    -m, --migratetype     With -z, break free blocks down by migratetype (/proc/pagetypeinfo, root)\n'\
+            f'    -v, --view            Display fragmentation figure\n'\
+            f'    -k, --kpageflags      Display a pageblock heatmap of each zone from /proc/kpageflags\n'\
+            f'    -p, --procfs          Read /proc/buddyinfo instead of loading eBPF (no root needed)\n'\
+            f'    -w, --write FILE      Record snapshots to FILE without a screen (headless)\n'\
+            f'    -r, --replay FILE     Replay a recording instead of the live kernel\n'\
+            f'    --profile             Time each stage and the eBPF programs, print a summary at exit\n'\
+            f'    -q, --query FILE...   Print per-order min/max/percentiles of recordings\n'\
+            f'                          (optional --from TIME --to TIME)\n'\
+            f'    -h, --help            Show this help message and exit\n\n'\
+            f'Keys:\n'\
+            f'    Up/Down, PgUp/PgDn, Home/End  Scroll the zone table or figure\n'\
+            f'    o                     Sort by zone, worst score first, or deviation from baseline\n'\
+            f'    a                     Show only orders above their baseline (alerts)\n'\
+            f'    n / c                 Cycle the node / zone filter, x clears all filters\n'\
+            f'    1-7                   Switch view: default, -z, -v, -n, -k, -s, -a (-s/-a need eBPF)\n'\
+            f'    m                     Toggle the migratetype breakdown of -z\n'\
+            f'    q                     Quit\n'
+            msg = f"Please Crtl + C  exiting......\n\n"
+            screen.addstr(0, 0, header1)
+            screen.addstr(header1.count('\n') + 1, 0, msg)
+            screen.refresh()
+            time.sleep(100)
         else:
             # 解析参数
             args = {
@@ -172,9 +820,18 @@ def main(screen):
                 'extfrag_index': False,
                 'unusable_index': False,
                 'output_count': False,
+                'alloc_stall': False,
                 'bar': False,
                 'zone_info': False,
-                'view':False
+                'view':False,
+                'procfs': False,
+                'replay': None,
+                'adaptive': None,
+                'heatmap': False,
+                'window': 600,
+                'migratetype': False,
+                'sort': SORT_MODES[0],
+                'alerts': False
             }
             for i in range(1, len(sys.argv)):
                 arg = sys.argv[i]
@@ -192,231 +849,209 @@ def main(screen):
                     args['unusable_index'] = True
                 elif arg in ['-s', '--output_count']:
                     args['output_count'] = True
+                elif arg in ['-a', '--alloc_stall']:
+                    args['alloc_stall'] = True
                 elif arg in ['-b', '--bar']:
                     args['bar'] = True
                 elif arg in ['-z', '--zone_info']:
                     args['zone_info'] = True
                 elif arg in ['-v', '--view']:
                     args['view'] = True
+                elif arg in ['-m', '--migratetype']:
+                    # -m 是 -z 的子视图
+                    args['migratetype'] = True
+                    args['zone_info'] = True
+                elif arg in ['-k', '--kpageflags']:
+                    args['heatmap'] = True
+                elif arg in ['-W', '--window']:
+                    args['window'] = int(sys.argv[i + 1])
+                elif arg in ['-p', '--procfs']:
+                    args['procfs'] = True
+                elif arg in ['-r', '--replay']:
+                    args['replay'] = sys.argv[i + 1]
+                elif arg in ['-A', '--adaptive']:
+                    args['adaptive'] = parse_adaptive(sys.argv[i + 1])
 
             extfrag = ExtFrag(
             interval=args['delay'],
             output_count=args['output_count'],
+            output_stall=args['alloc_stall'],
             output_extfrag_index=args['extfrag_index'],
             output_unusable_index=args['unusable_index'],
-            zone_info=args['zone_info'])
+            zone_info=args['zone_info'],
+            backend='replay' if args['replay'] else 'buddyinfo' if args['procfs'] else 'bpf',
+            path=args['replay'],
+            adaptive=args['adaptive'],
+            stats_window=args['window'],
+            profile=profile,
+            migratetypes=args['migratetype'] and not args['replay'])
+            replay = extfrag.source if args['replay'] else None
             screen.clear()
-            while True:
-                    # screen.clear()
-                    row = 0
-                    max_rows, max_cols = screen.getmaxyx()
-
-                    if args['node_info']:
-                        screenEnough(screen)
-                        if not _boo:
-                            # 获取并打印节点信息
-                            node_data = extfrag.get_node_data()
-                            if  node_data:
-                                header = f"{'NODE_ID':>45} {'Number of Zones':>65} {'NODE_START_PFN':>70}\n"
-                                screen.addstr(row, 0, header,curses.color_pair(4))
-                                row += 1
-                                for node_id, node in node_data.items():
-                                    line = f"{node_id:>40} {node['nr_zones']:>60} {node['pgdat_ptr']:>77}\n"
-                                    if row < max_rows - 1:  # 确保不超出屏幕行数
-                                        if len(line) < max_cols - 1:  # 确保行内字符数不超出屏幕宽度
-                                            screen.addstr(row, 0, line)
-                                            row += 1
-                                        else:
-                                            screen.addstr(row, 0, line[:max_cols - 1])
-                                            row += 1
-                    elif args['output_count']:
-                        screenEnough(screen)
-                        if not _boo:
-                            event_data = extfrag.get_count_data()
-                            header = f"{'COMM':>25} {'PID':>30} {'PFN':>45}" \
-                                    f"{'ALLOC_ORDER':>45} {'FALLBACK_ORDER':>45} {'COUNT':>35} \n"
-                            screen.addstr(0, 0, header,curses.color_pair(4))
-                            row =1
-                            for event in event_data:
-                                line = f"{event['pcomm']:>25} {event['pid']:>30} {event['pfn']:>45}{event['alloc_order']:>45} {event['fallback_order']:>45} {event['count']:>35} \n"
-                                if row < max_rows - 1:  # 确保不超出屏幕行数
-                                    if len(line) < max_cols - 1:  # 确保行内字符数不超出屏幕宽度
-                                        screen.addstr(row, 0, line)
-                                        row += 1
-                                    else:
-                                        screen.addstr(row, 0, line[:max_cols - 1])
-                                        row += 1
-
-                    elif args['zone_info']:
-                        screenEnough(screen)
-                        if not _boo:
-                            # 获取并打印区域信息
-                            if  args['node_id'] is not None:
-                                zone_data = extfrag.get_zone_data(args['node_id'])
-                            else:
-                                zone_data = extfrag.get_zone_data()
-                            if args['extfrag_index']:
-                                header =f"{'ZONE_COMM':>5} {'ZONE_PFN':>15} {'SUM_PAGES':>20} {'FACT_PAGES':>20} " \
-                                    f"{'ORDER':>15} {'TOTAL':>20} {'SUITABLE':>20} {'FREE':>20} {'NODE_ID':>20} {'extfrag_index':>25}"
-                            elif args['unusable_index']:
-                                header =  f"{'ZONE_COMM':>5} {'ZONE_PFN':>15} {'SUM_PAGES':>20} {'FACT_PAGES':>20} " \
-                                    f"{'ORDER':>15} {'TOTAL':>20} {'SUITABLE':>20} {'FREE':>20} {'NODE_ID':>20} {'unusable_index':>25} "
-                            else:
-                                header = f"{'ZONE_COMM':>5} {'ZONE_PFN':>15} {'SUM_PAGES':>20} {'FACT_PAGES':>20} " \
-                                    f"{'ORDER':>15} {'TOTAL':>20} {'SUITABLE':>20} {'FREE':>20} {'NODE_ID':>20} {'extfrag_index':>25} {'unusable_index':>20}"
-                            if  args['bar']:
-                                header+=f"{'BAR':>25}\n"
-                            else:
-                                header+="\n"
-                            screen.addstr(0, 0, header,curses.color_pair(4))
-                            row = 1
-                            for comm, zones in zone_data.items():
-                                if  args['comm'] and comm !=  args['comm']:
-                                    continue   
-                    
-                                for zone in zones:
-                                    color = curses.color_pair(3)
-                                    if zone['order'] > 5 and float(zone['scoreB']) > 0.5:
-                                        color = curses.color_pair(2)  # 红色，表示高风险
-                                    if args['extfrag_index'] :
-                                        line = f"{zone['comm']:^9} {zone['zone_pfn']:^20} {zone['spanned_pages']:^22} " \
-                                        f"{zone['present_pages']:^18} {zone['order']:^15} {zone['free_blocks_total']:^25} " \
-                                        f"{zone['free_blocks_suitable']:^15} {zone['free_pages']:^25} {zone['node_id']:^15} {zone['scoreA']:^20} "
-                                    elif  args['unusable_index']:
-                                        line = f"{zone['comm']:^9} {zone['zone_pfn']:^20} {zone['spanned_pages']:^22} " \
-                                        f"{zone['present_pages']:^18} {zone['order']:^15} {zone['free_blocks_total']:^25} " \
-                                        f"{zone['free_blocks_suitable']:^15} {zone['free_pages']:^25} {zone['node_id']:^15} {zone['scoreB']:^20} "
-                                    else:
-                                        line = f"{zone['comm']:^9} {zone['zone_pfn']:^20} {zone['spanned_pages']:^22} " \
-                                        f"{zone['present_pages']:^18} {zone['order']:^15} {zone['free_blocks_total']:^25} " \
-                                        f"{zone['free_blocks_suitable']:^15} {zone['free_pages']:^25} {zone['node_id']:^15} {zone['scoreA']:^20} {zone['scoreB']:^25}"
-                                    if args['bar']:
-                                        score = float(zone.get("scoreA" if args['extfrag_index'] else "scoreB", 0))
-                                        frag_bar = generate_fragmentation_bar(score)
-                                        line += f" {frag_bar:^40}\n" 
-                                    else:
-                                        line+="\n"
-                                    if row < max_rows - 1:  # 确保不超出屏幕行数
-                                        if len(line) < max_cols - 1:  # 确保行内字符数不超出屏幕宽度
-                                            screen.addstr(row, 0, line,color)
-                                            row += 1
-                                        else:
-                                            screen.addstr(row, 0, line[:max_cols - 1],color)
-                                            row += 1
-                            
-                    elif args['view']:
-                            # curses.initscr()
-                            screenEnough(screen)
-                            current_time = datetime.now().strftime('%Y--%m-%d：%H:%M:%S')
-                            screen.addstr(0, 0, current_time)
-                            screen.refresh()
-                            current_time = time.time()
-                            if current_time - last_update_time >= args['delay']:
-                                _show = True
-                                last_update_time=current_time
-                            if not _boo and _show:
-                                _show = False
-                                # 获取并打印关键信息
-                                if args['node_id'] is not None:
-                                    view_data = extfrag.get_view_data(args['node_id'])
-                                    zone_data = extfrag.get_zone_data(args['node_id'])
-                                else:
-                                    view_data = extfrag.get_view_data()
-                                    zone_data = extfrag.get_zone_data()
-                            
-
-                                y_pos =2
-                                row=3
-                                bars = {}
-                                current_progress = {}
-                                for (node_id, comm), zones in view_data.items():
-                                        if args['comm'] and comm != args['comm']:
-                                            continue
-                                        _str = f"Node {node_id}, zone {comm}   "
-                                        screen.addstr(row, 0, _str)
-                                        for i in range(11):  
-                                            pbar = createBar(3, 21, y_pos, 24 + (i * 21), str(i))
-                                            setProgress(pbar, 0) 
-                                            bars[(node_id, comm, i)] = pbar   # 保存小窗口
-                                            current_progress[(node_id, comm, i)] = 0  # 初始化为0
-                                        y_pos+=3
-                                        row+=3
-                                for comm, zones in zone_data.items():
-                                    if args['comm'] and comm != args['comm']:
-                                            continue
-                                    for zone in zones:
-                                        node_id = zone['node_id']
-                                        comm = zone['comm']
-                                        order = zone['order']
-                                        progress = zone['scoreB'].strip().split()[0]
-                                        progress = float(progress) 
-                                        key = (node_id, comm, order)
-                                        if key in bars:
-                                            if progress != current_progress[key]:
-                                                current_progress[key] = progress  
-                                                progress*=100
-                                                setProgress(bars[key], progress)
-                                                
-                    else:
-                        screenEnough(screen)
-                        if not _boo:
-                            # 获取并打印关键信息
-                            if args['node_id'] is not None:
-                                zone_data = extfrag.get_zone_data(args['node_id'])
-                            else:
-                                zone_data = extfrag.get_zone_data()
-                            if args['extfrag_index']:
-                                header =f"{'ZONE_COMM':<30}  {'NODE_ID':<23} {'ORDER':>40} {'extfrag_index':>50} "
-                            elif args['unusable_index']:
-                                header = f"{'ZONE_COMM':<30}  {'NODE_ID':<23} {'ORDER':>40}  {'unusable_index':>50} "
-                            else:
-                                header = f"{'ZONE_COMM':<30}  {'NODE_ID':<23} {'ORDER':>40} {'extfrag_index':>50} {'unusable_index':>30} "
-                            if  args['bar']:
-                                header+=f"{'BAR':>30}\n"
-                            else:
-                                header+="\n"
-                            screen.addstr(row, 0, header,curses.color_pair(4))
-                            row = 1
-                            for comm, zones in zone_data.items():
-                                if  args['comm'] and comm !=  args['comm']:
-                                    continue  
-                                for zone in zones:
-                                    color = curses.color_pair(3)
-                                    if zone['order'] > 5 and float(zone['scoreB']) > 0.5:
-                                        color = curses.color_pair(2)  # 红色，表示高风险
-                                    if args['extfrag_index'] :
-                                        line = f"{zone['comm']:^7}  {zone['node_id']:^55}  {zone['order']:^55} {zone['scoreA']:^35} "
-                                    elif  args['unusable_index']:
-                                        line = f"{zone['comm']:^7}  {zone['node_id']:^55}  {zone['order']:^55} {zone['scoreB']:^35} "
-                                    else:
-                                        line = f"{zone['comm']:^7}  {zone['node_id']:^55}  {zone['order']:^55} {zone['scoreA']:^35}  {zone['scoreB']:^25} "
-                                    if  args['bar']:
-                                        score = float(zone.get("scoreA" if args['extfrag_index'] else "scoreB", 0))
-                                        frag_bar = generate_fragmentation_bar(score)
-                                        line += f" {frag_bar:^40}\n"  
-                                    else:
-                                        line+="\n"
-                                    if row < max_rows - 1:  # 确保不超出屏幕行数
-                                        if len(line) < max_cols - 1:  # 确保行内字符数不超出屏幕宽度
-                                            screen.addstr(row, 0, line,color)
-                                            row += 1
-                                        else:
-                                            screen.addstr(row, 0, line[:max_cols - 1],color)
-                                            row += 1
-
-                    if args['view']:
-                        screen.refresh()
-                    else:
-                        screen.refresh()
-                        time.sleep(args['delay'])
-               
+            run_loop(screen, extfrag, args, replay)
 
- 
     except KeyboardInterrupt:
         pass
 
+def query_main(argv):
+    """非交互查询模式：-q FILE [FILE...] [--from TIME] [--to TIME]"""
+    paths = []
+    start = end = None
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ['--from', '--to'] and i + 1 < len(argv):
+            try:
+                value = parse_time(argv[i + 1])
+            except ValueError:
+                print(f"[ERROR] Bad time: {argv[i + 1]}", file=sys.stderr)
+                sys.exit(1)
+            if arg == '--from':
+                start = value
+            else:
+                end = value
+            i += 1
+        elif arg in ['-q', '--query']:
+            pass
+        elif arg.startswith('-'):
+            print(f"[ERROR] Unrecognized argument: {arg}", file=sys.stderr)
+            print("Usage: extfrag_user.py -q FILE [FILE...] [--from TIME] [--to TIME]", file=sys.stderr)
+            sys.exit(1)
+        else:
+            paths.append(arg)
+        i += 1
+    if not paths:
+        print("[ERROR] -q requires at least one recording", file=sys.stderr)
+        sys.exit(1)
+    format_query(query(paths, start, end), sys.stdout)
+    # 触发转储附带触发原因与捕获窗口内的进程表
+    for path in paths:
+        capture = read_capture(path)
+        if capture is not None:
+            print(file=sys.stdout)
+            format_capture(path, *capture, sys.stdout)
+
+
+def parse_listen(text):
+    """PORT 或 HOST:PORT，默认只监听本机"""
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def parse_adaptive(text):
+    """MIN:MAX 秒，MIN 不小于 timer 模式的触发周期 0.1 秒"""
+    floor, _, ceiling = text.partition(':')
+    floor, ceiling = float(floor), float(ceiling)
+    if not 0.1 <= floor <= ceiling:
+        raise ValueError(text)
+    return floor, ceiling
+
+
+def headless_main(argv):
+    """无界面模式：-w FILE 录制、-x [HOST:]PORT 导出指标、-T COND 触发捕获，可同时使用"""
+    delay = 2
+    path = None
+    listen = None
+    procfs = False
+    adaptive = None
+    profile = Profiler(enabled=False)
+    conditions = []
+    dump = 'mfd-trigger'
+    windows = {'--fast': FAST_INTERVAL, '--pre': PRE_SECONDS, '--post': POST_SECONDS}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ['-T', '--trigger'] and i + 1 < len(argv):
+            try:
+                conditions.append(parse_condition(argv[i + 1]))
+            except ValueError:
+                print(f"[ERROR] Bad trigger condition: {argv[i + 1]}", file=sys.stderr)
+                sys.exit(1)
+            i += 1
+        elif arg in ['-D', '--dump'] and i + 1 < len(argv):
+            dump = argv[i + 1]
+            i += 1
+        elif arg in windows and i + 1 < len(argv):
+            try:
+                windows[arg] = float(argv[i + 1])
+            except ValueError:
+                windows[arg] = -1
+            if windows[arg] < (MIN_FAST_INTERVAL if arg == '--fast' else 0):
+                print(f"[ERROR] Bad {arg} seconds: {argv[i + 1]}", file=sys.stderr)
+                sys.exit(1)
+            i += 1
+        elif arg in ['-w', '--write'] and i + 1 < len(argv):
+            path = argv[i + 1]
+            i += 1
+        elif arg in ['-x', '--export'] and i + 1 < len(argv):
+            try:
+                listen = parse_listen(argv[i + 1])
+            except ValueError:
+                print(f"[ERROR] Bad listen address: {argv[i + 1]}", file=sys.stderr)
+                sys.exit(1)
+            i += 1
+        elif arg in ['-d', '--delay'] and i + 1 < len(argv) and argv[i + 1].isdigit():
+            delay = int(argv[i + 1])
+            i += 1
+        elif arg in ['-p', '--procfs']:
+            procfs = True
+        elif arg == '--profile':
+            profile = Profiler()
+        elif arg in ['-A', '--adaptive'] and i + 1 < len(argv):
+            try:
+                adaptive = parse_adaptive(argv[i + 1])
+            except ValueError:
+                print(f"[ERROR] Bad adaptive range: {argv[i + 1]}", file=sys.stderr)
+                sys.exit(1)
+            i += 1
+        else:
+            print(f"[ERROR] Unrecognized argument: {arg}", file=sys.stderr)
+            print("Usage: extfrag_user.py [-w FILE] [-x [HOST:]PORT] [-T COND [-D PREFIX] [--fast S] [--pre S] [--post S]] "
+                  "[-d DELAY] [-A MIN:MAX] [-p] [--profile]", file=sys.stderr)
+            sys.exit(1)
+        i += 1
+    if path is None and listen is None and not conditions:
+        print("[ERROR] -w requires a file name, -x requires a port, -T requires a condition", file=sys.stderr)
+        sys.exit(1)
+    triggers = None
+    if conditions:
+        triggers = TriggerEngine(conditions, prefix=dump, fast=windows['--fast'], pre=windows['--pre'],
+                                 post=windows['--post'], min_interval=adaptive[0] if adaptive else delay)
+        triggers.listeners.append(lambda dump_path, reason: print(f"[TRIGGER] {dump_path}: {reason}", file=sys.stderr))
+        triggers.error_listeners.append(lambda error: print(f"[ERROR] trigger: {error}", file=sys.stderr))
+    try:
+        extfrag = ExtFrag(interval=delay, backend='buddyinfo' if procfs else 'bpf', adaptive=adaptive,
+                          profile=profile, triggers=triggers)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+    if path is not None:
+        extfrag.recorder = Recorder(path)
+    exporter = None
+    if listen is not None:
+        exporter = Exporter(*listen, stats=extfrag.collector_stats,
+                            profile=profile if profile.enabled else None)
+        extfrag.listeners.append(exporter.update)
+    # start() 返回前已完成第一次采集，服务启动后立即有数据可抓取
+    extfrag.start()
+    if exporter is not None:
+        exporter.start()
+    extfrag.wait()
+    if profile.enabled:
+        print(profile.report(), file=sys.stderr)
+        profile.close()
+
+
 if __name__ == "__main__":
-    curses.wrapper(main)
+    if "-q" in sys.argv or "--query" in sys.argv:
+        query_main(sys.argv[1:])
+    elif any(arg in sys.argv for arg in ["-w", "--write", "-x", "--export", "-T", "--trigger"]):
+        headless_main(sys.argv[1:])
+    else:
+        profile = Profiler(enabled="--profile" in sys.argv)
+        curses.wrapper(main, profile)
+        if profile.enabled:
+            print(profile.report(), file=sys.stderr)
+            profile.close()
 
 
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import numpy as np
+
+from snapshot import NR_ORDERS
+
+ORDERS = np.arange(NR_ORDERS, dtype=np.int64)
+REQUESTED = np.int64(1) << ORDERS
+# SHIFT[o][a] = 2^(o-a) (o >= a)，nr_free @ SHIFT 即每个 order 的 free_blocks_suitable
+SHIFT = np.where(ORDERS[:, None] >= ORDERS[None, :],
+                 np.int64(1) << np.clip(ORDERS[:, None] - ORDERS[None, :], 0, None),
+                 0).astype(np.int64)
+
+
+def fragmentation_columns(nr_free):
+    """
+    由 [zone][order] 的 nr_free 一次性计算所有 zone、所有 order 的指标，
+    与内核 mm/vmstat.c 中 fill_contig_page_info / unusable_free_index /
+    __fragmentation_index 的整数运算逐位一致。
+    返回 (free_pages, free_blocks_total, free_blocks_suitable, score_a, score_b)，
+    均为 [zone][order] 的 int64 数组。
+    """
+    nr_free = np.asarray(nr_free, dtype=np.int64).reshape(-1, NR_ORDERS)
+    nr_zones = nr_free.shape[0]
+
+    free_pages = (nr_free << ORDERS).sum(axis=1, keepdims=True)
+    free_blocks_total = nr_free.sum(axis=1, keepdims=True)
+    free_blocks_suitable = nr_free @ SHIFT
+
+    # unusable_free_index
+    safe_pages = np.where(free_pages == 0, 1, free_pages)
+    score_b = np.where(free_pages == 0, 1000,
+                       (free_pages - (free_blocks_suitable << ORDERS)) * 1000 // safe_pages)
+
+    # __fragmentation_index
+    safe_total = np.where(free_blocks_total == 0, 1, free_blocks_total)
+    score_a = 1000 - (1000 + free_pages * 1000 // REQUESTED) // safe_total
+    score_a = np.where(free_blocks_suitable != 0, -1000, score_a)
+    score_a = np.where(free_blocks_total == 0, 0, score_a)
+
+    shape = (nr_zones, NR_ORDERS)
+    return (np.broadcast_to(free_pages, shape), np.broadcast_to(free_blocks_total, shape),
+            free_blocks_suitable, score_a, score_b)
+
+
+def nr_free_from_suitable(free_blocks_suitable):
+    """
+    fragmentation_columns 的逆运算：suitable[o] = nr_free[o] + 2 * suitable[o + 1]，
+    由快照的 free_blocks_suitable 还原 [zone][order] 的 nr_free
+    """
+    suitable = np.asarray(free_blocks_suitable, dtype=np.int64).reshape(-1, NR_ORDERS)
+    nr_free = suitable.copy()
+    nr_free[:, :-1] -= suitable[:, 1:] << 1
+    return nr_free
+
+
+class IndexCache:
+    """
+    按 zone 缓存上一周期的 nr_free 与计算结果，columns() 只重新计算 nr_free
+    发生变化的 zone，其余 zone 直接复用上一次的结果（Snapshot 的列本身不可变）。
+    zone 集合变化时全部重新计算。
+    """
+    def __init__(self):
+        self.keys = None
+        self.nr_free = None
+        self.rows = []
+
+    def columns(self, keys, nr_free):
+        """keys 为每行 zone 的标识，返回 Snapshot 的五列"""
+        nr_free = np.asarray(nr_free, dtype=np.int64).reshape(-1, NR_ORDERS)
+        keys = list(keys)
+        if keys != self.keys:
+            changed = np.arange(len(keys))
+            self.rows = [None] * len(keys)
+        else:
+            changed = np.flatnonzero((nr_free != self.nr_free).any(axis=1))
+        if len(changed):
+            values = [c.tolist() for c in fragmentation_columns(nr_free[changed])]
+            for i, z in enumerate(changed.tolist()):
+                self.rows[z] = tuple(tuple(column[i]) for column in values)
+        self.keys = keys
+        self.nr_free = nr_free
+        return tuple(tuple(row[c] for row in self.rows) for c in range(5))
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+import os
+import threading
+import time
+
+import numpy as np
+
+from snapshot import NR_ORDERS
+
+# include/uapi/linux/kernel-page-flags.h
+KPF_LRU = 5
+KPF_SLAB = 7
+KPF_BUDDY = 10
+KPF_MMAP = 11
+KPF_ANON = 12
+KPF_SWAPBACKED = 14
+KPF_HUGE = 17
+KPF_UNEVICTABLE = 18
+KPF_NOPAGE = 20
+KPF_KSM = 21
+KPF_OFFLINE = 23
+KPF_RESERVED = 32
+
+# 没有 struct page、已下线或保留（不归伙伴系统管理，如固件占用的区域）的页按空洞计
+HOLE_FLAGS = np.uint64((1 << KPF_NOPAGE) | (1 << KPF_OFFLINE) | (1 << KPF_RESERVED))
+BUDDY_FLAGS = np.uint64(1 << KPF_BUDDY)
+# 可以被内存规整迁移走的页：用户态映射与 LRU 上的页
+MOVABLE_FLAGS = np.uint64((1 << KPF_LRU) | (1 << KPF_MMAP) | (1 << KPF_ANON) |
+                          (1 << KPF_SWAPBACKED) | (1 << KPF_UNEVICTABLE) |
+                          (1 << KPF_KSM) | (1 << KPF_HUGE))
+
+# 每个 pageblock 按页数统计的类别，剩下的已分配页都算不可移动
+BLOCK_FREE, BLOCK_MOVABLE, BLOCK_UNMOVABLE, BLOCK_HOLE = range(4)
+NR_BLOCK_CLASSES = 4
+
+# 伙伴系统最大块为 2^MAX_ORDER 页
+MAX_BLOCK_PAGES = 1 << 10
+# 每次 preadv 读取的页数（256 KB 缓冲区）。分块足够小，分类时的临时数组都留在 CPU 缓存中，
+# 比一次读入数 MB 更快
+CHUNK_PAGES = 1 << 15
+
+# 单元格字符：空洞、全部空闲、只有可移动/空闲页，之后按含不可移动页的 pageblock 占比递增
+CELL_HOLE = ' '
+CELL_FREE = '_'
+CELL_CLEAN = '.'
+CELL_RAMP = ':-=+*#%@'
+
+
+def pageblock_order(page_size=None):
+    """
+    pageblock_order 通常等于 PMD 大页的 order（x86_64 上为 9），
+    读不到 THP 的 hpage_pmd_size 时按 9 处理
+    """
+    page_size = page_size or os.sysconf('SC_PAGE_SIZE')
+    try:
+        with open("/sys/kernel/mm/transparent_hugepage/hpage_pmd_size") as f:
+            return (int(f.read()) // page_size).bit_length() - 1
+    except (OSError, ValueError):
+        return 9
+
+
+class KpageflagsScanner:
+    """
+    按 pageblock 统计 /proc/kpageflags 中每个 zone 的页类别。
+    文件按分块 preadv 读入预先分配的 NumPy 缓冲区，分类全部是向量化的位运算，
+    扫描 1 TB 内存（256M 个页，2 GB 的 kpageflags）只需要数秒。
+    path 可以指向任意按同样格式（每页一个小端 u64）生成的文件。
+
+    kpageflags 只在空闲块的首页上标记 KPF_BUDDY，尾页没有任何标志，看不到空闲块的 order。
+    每个首页的 order 不超过 block_bounds() 给出的上限；扫描时传入该 zone 的 nr_free 时
+    由 assign_orders() 按各 order 的空闲块数分配，否则按上限计（紧接空闲块之后、
+    没有标志的内核页可能被误计为空闲）
+    """
+    def __init__(self, path="/proc/kpageflags", block_order=None, chunk_pages=CHUNK_PAGES):
+        self.path = path
+        self.block_order = pageblock_order() if block_order is None else block_order
+        self.block_pages = 1 << self.block_order
+        chunk = max(chunk_pages // self.block_pages, 1) * self.block_pages
+        self.flags = np.empty(chunk, dtype=np.uint64)
+        self.raw = self.flags.view(np.uint8)
+        # 上一次扫描读取的页数与耗时（秒）
+        self.pages = 0
+        self.seconds = 0.0
+
+    def scan(self, zones, nr_free=None):
+        """
+        zones 为 Snapshot.zones，nr_free 为 {(node_id, comm): 各 order 的空闲块数}（可以缺少部分 zone），
+        返回 {(node_id, comm): (first_pfn, counts)}，
+        counts 为 [pageblock][BLOCK_*] 的页数，first_pfn 按 pageblock 向下对齐
+        """
+        start = time.perf_counter()
+        result = {}
+        pages = 0
+        nr_free = nr_free or {}
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            for node_id, comm, zone_pfn, spanned, present in zones:
+                if spanned:
+                    key = (node_id, comm)
+                    result[key] = self._scan_range(fd, zone_pfn, zone_pfn + spanned, nr_free.get(key))
+                    pages += len(result[key][1]) * self.block_pages
+        finally:
+            os.close(fd)
+        self.pages = pages
+        self.seconds = time.perf_counter() - start
+        return result
+
+    def _read(self, fd, pfn, n):
+        """读取 [pfn, pfn+n) 的标志，超出 max_pfn 的部分按空洞处理"""
+        view = memoryview(self.raw[:n * 8])
+        got = 0
+        while got < len(view):
+            size = os.preadv(fd, [view[got:]], pfn * 8 + got)
+            if size <= 0:
+                break
+            got += size
+        flags = self.flags[:n]
+        flags[got // 8:] = HOLE_FLAGS
+        return flags
+
+    def _scan_range(self, fd, start, end, nr_free=None):
+        bp = self.block_pages
+        first = start - start % bp
+        last = -(-end // bp) * bp
+        counts = np.zeros(((last - first) // bp, NR_BLOCK_CLASSES), dtype=np.int32)
+        # 上限大于 0 的空闲块首页及其上限，上限为 0 的首页只能是 order 0，只计数
+        heads, bounds, singles = [], [], 0
+        # 上一个分块中最后一个有标志的页是空闲块首页时为其 pfn，空闲块可能跨越读取的分块
+        pending = -1
+        chunk = len(self.flags)
+        for pfn in range(first, last, chunk):
+            n = min(chunk, last - pfn)
+            flags = self._read(fd, pfn, n)
+            # 与 zone 共用首尾 pageblock、但不属于该 zone 的页按空洞计
+            if pfn < start:
+                flags[:start - pfn] = HOLE_FLAGS
+            if pfn + n > end:
+                flags[max(end - pfn, 0):] = HOLE_FLAGS
+            block = (pfn - first) // bp
+            marked, is_head = self._classify(flags, pfn, counts[block:block + n // bp])
+            if not len(marked):
+                continue
+            # 每个首页的下一个有标志的页，本分块中最后一个首页留到下一个分块
+            if pending >= 0:
+                marked = np.concatenate(([pending], marked))
+                is_head = np.concatenate(([True], is_head))
+            idx = np.flatnonzero(is_head[:-1])
+            pending = int(marked[-1]) if is_head[-1] else -1
+            bound = block_bounds(marked[idx], marked[idx + 1])
+            singles += int(np.count_nonzero(bound == 0))
+            heads.append(marked[idx][bound > 0])
+            bounds.append(bound[bound > 0])
+        if pending >= 0:
+            bound = block_bounds(np.array([pending]), np.array([last]))
+            singles += int(np.count_nonzero(bound == 0))
+            heads.append(np.array([pending])[bound > 0])
+            bounds.append(bound[bound > 0])
+        if heads:
+            heads = np.concatenate(heads)
+            self._add_tails(counts, first, heads, assign_orders(np.concatenate(bounds), nr_free, singles))
+        counts[:, BLOCK_UNMOVABLE] = bp - counts[:, BLOCK_FREE] - counts[:, BLOCK_MOVABLE] - counts[:, BLOCK_HOLE]
+        return first, counts
+
+    def _classify(self, flags, pfn, out):
+        """
+        统计每个 pageblock 的空洞、可移动页与空闲块首页（尾页在分配 order 后由 _add_tails 补上），
+        返回 (有标志页的 pfn, 其中哪些是空闲块首页)
+        """
+        bp = self.block_pages
+        buddy = (flags & BUDDY_FLAGS) != 0
+        hole = (flags & HOLE_FLAGS) != 0
+        movable = ((flags & MOVABLE_FLAGS) != 0) & ~buddy & ~hole
+        out[:, BLOCK_FREE] = np.count_nonzero(buddy.reshape(-1, bp), axis=1)
+        out[:, BLOCK_MOVABLE] = np.count_nonzero(movable.reshape(-1, bp), axis=1)
+        out[:, BLOCK_HOLE] = np.count_nonzero(hole.reshape(-1, bp), axis=1)
+        marked = np.flatnonzero(flags)
+        return marked + pfn, buddy[marked]
+
+    def _add_tails(self, counts, first, heads, orders):
+        """把 order 为 orders 的空闲块除首页外的页计入所在的 pageblock"""
+        bp = self.block_pages
+        blocks = (heads - first) // bp
+        small = orders <= self.block_order
+        tails = (np.int64(1) << orders[small]) - 1
+        counts[:, BLOCK_FREE] += np.bincount(blocks[small], weights=tails,
+                                             minlength=len(counts)).astype(np.int32)
+        # 大于 pageblock 的空闲块按 2^order 对齐，正好覆盖若干个完整的 pageblock
+        for order in range(self.block_order + 1, NR_ORDERS):
+            first_block = blocks[orders == order]
+            for i in range(1 << (order - self.block_order)):
+                counts[first_block + i, BLOCK_FREE] += bp - (i == 0)
+
+
+def block_bounds(heads, nexts):
+    """
+    空闲块首页 heads 的最大可能 order：块按 2^order 对齐，尾页都没有标志，
+    所以块大小不超过首页 pfn 的对齐、到下一个有标志的页 nexts 的距离与 MAX_BLOCK_PAGES
+    """
+    limit = np.minimum(nexts - heads, MAX_BLOCK_PAGES)
+    align = heads & -heads
+    align[align == 0] = MAX_BLOCK_PAGES
+    return np.log2(np.minimum(limit, align)).astype(np.int64)
+
+
+def assign_orders(bounds, nr_free, singles=0):
+    """
+    为上限为 bounds 的空闲块首页分配 order。nr_free 为该 zone 各 order 的空闲块数，
+    其中 singles 个 order 0 的块已经由上限为 0 的首页占用；其余空闲块按 order 从大到小
+    分给上限从大到小的首页，超过上限的按上限计，分不到的首页按 order 0 计，
+    计入的空闲页不超过 nr_free。nr_free 是采集时的数据，与扫描时的 kpageflags 不完全一致。
+    nr_free 为 None 时按上限计
+    """
+    if nr_free is None:
+        return bounds
+    available = np.asarray(nr_free, dtype=np.int64)[:NR_ORDERS].copy()
+    available[0] = max(available[0] - singles, 0)
+    # 从大到小第 i 个空闲块的 order
+    cum = np.cumsum(available[::-1])
+    k = min(len(bounds), int(cum[-1]))
+    ranked = np.argsort(-bounds, kind='stable')[:k]
+    orders = np.zeros(len(bounds), dtype=np.int64)
+    orders[ranked] = np.minimum(NR_ORDERS - 1 - np.searchsorted(cum, np.arange(k), side='right'),
+                                bounds[ranked])
+    return orders
+
+
+def zone_summary(counts, block_pages):
+    """返回 (pageblock 数, 含不可移动页的 pageblock 数, 空闲页占比, 不可移动页占比)"""
+    real = counts[:, BLOCK_HOLE] < block_pages
+    pinned = real & (counts[:, BLOCK_UNMOVABLE] > 0)
+    pages = max(int(counts.sum()) - int(counts[:, BLOCK_HOLE].sum()), 1)
+    return (int(real.sum()), int(pinned.sum()),
+            float(counts[:, BLOCK_FREE].sum() / pages), float(counts[:, BLOCK_UNMOVABLE].sum() / pages))
+
+
+def heatmap_cells(counts, block_pages, cells):
+    """
+    把 [pageblock][BLOCK_*] 按地址顺序合并成至多 cells 个字符，
+    每个字符覆盖相邻的若干 pageblock，字符含义见 CELL_*
+    """
+    nr_blocks = len(counts)
+    if not nr_blocks or cells <= 0:
+        return ''
+    cells = min(cells, nr_blocks)
+    edges = np.arange(cells, dtype=np.int64) * nr_blocks // cells
+    real = counts[:, BLOCK_HOLE] < block_pages
+    pinned = real & (counts[:, BLOCK_UNMOVABLE] > 0)
+    all_free = real & (counts[:, BLOCK_FREE] + counts[:, BLOCK_HOLE] == block_pages)
+    n_real = np.add.reduceat(real.astype(np.int64), edges)
+    n_pinned = np.add.reduceat(pinned.astype(np.int64), edges)
+    n_free = np.add.reduceat(all_free.astype(np.int64), edges)
+
+    level = np.ceil(n_pinned * len(CELL_RAMP) / np.maximum(n_real, 1)).astype(np.int64)
+    chars = np.array(list(CELL_RAMP), dtype='<U1')[np.clip(level - 1, 0, len(CELL_RAMP) - 1)]
+    chars[n_pinned == 0] = CELL_CLEAN
+    chars[(n_pinned == 0) & (n_free == n_real)] = CELL_FREE
+    chars[n_real == 0] = CELL_HOLE
+    return ''.join(chars)
+
+
+class Heatmap:
+    """
+    界面使用的扫描结果缓存。扫描在后台线程中进行，界面只读取上一次的结果（整体替换），
+    大内存机器上数秒的扫描不会卡住界面；扫描完成后向 wake_fd 写入一个字节，唤醒在 select 中等待的界面。
+    zone 布局变化时立即重新扫描，否则至少间隔 min_interval 秒，
+    并保证扫描时间不超过墙钟时间的 1/(1+RESCAN_FACTOR)，大内存机器上不会一直在扫描
+    """
+    RESCAN_FACTOR = 9
+
+    def __init__(self, scanner=None, min_interval=10, wake_fd=None):
+        self.scanner = scanner or KpageflagsScanner()
+        self.min_interval = min_interval
+        self.wake_fd = wake_fd
+        self.layout = None
+        self.result = None
+        self.error = None
+        self.next_scan = 0.0
+        self._thread = None
+
+    @property
+    def scanning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def refresh(self, zones, nr_free=None):
+        """需要时在后台开始一次扫描（参数同 KpageflagsScanner.scan），返回是否开始了新的扫描"""
+        layout = tuple((node_id, comm, zone_pfn, spanned)
+                       for node_id, comm, zone_pfn, spanned, present in zones)
+        if self.scanning or (layout == self.layout and time.monotonic() < self.next_scan):
+            return False
+        self.layout = layout
+        self._thread = threading.Thread(target=self._scan, args=(zones, nr_free),
+                                        name="mfd-kpageflags", daemon=True)
+        self._thread.start()
+        return True
+
+    def _scan(self, zones, nr_free):
+        try:
+            result, error = self.scanner.scan(zones, nr_free), None
+        except OSError as e:
+            result, error = None, f"{self.scanner.path}: {e.strerror}"
+        except Exception as e:
+            # 读到残缺或格式不符的数据等；线程不能悄悄退出，否则面板一直显示 scanning...
+            result, error = None, f"{self.scanner.path}: {type(e).__name__}: {e}"
+        self.result = result
+        self.error = error
+        self.next_scan = time.monotonic() + max(self.min_interval,
+                                                self.RESCAN_FACTOR * self.scanner.seconds)
+        if self.wake_fd is not None:
+            try:
+                os.write(self.wake_fd, b'\0')
+            except OSError:
+                pass
+
+    def wait(self):
+        """等待正在进行的扫描完成"""
+        if self._thread is not None:
+            self._thread.join()
+
+    def status(self):
+        if self.error:
+            return self.error
+        if self.result is None:
+            return f"scanning {self.scanner.path}..."
+        return (f"pageblock {self.scanner.block_pages} pages, "
+                f"scanned {self.scanner.pages} pages in {self.scanner.seconds:.2f}s")
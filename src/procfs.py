@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import os
+import time
+
+import numpy as np
+
+from fragindex import IndexCache, fragmentation_columns
+from snapshot import NR_ORDERS, Snapshot
+
+
+def parse_buddyinfo(text):
+    """
+    解析 /proc/buddyinfo，返回 ([(node_id, comm)], nr_free)，nr_free 为 [zone][order]
+    的 int64 数组；列数多于 NR_ORDERS 时截断，少于时补零。
+    """
+    keys = []
+    rows = []
+    for line in text.splitlines():
+        parts = line.split()
+        # Node 0, zone   Normal    2  70 ...
+        if len(parts) < 5 or parts[0] != 'Node':
+            continue
+        keys.append((int(parts[1].rstrip(',')), parts[3]))
+        counts = parts[4:4 + NR_ORDERS]
+        rows.append(counts + ['0'] * (NR_ORDERS - len(counts)))
+    nr_free = np.array(rows, dtype=np.int64).reshape(-1, NR_ORDERS)
+    return keys, nr_free
+
+
+def parse_zoneinfo(text):
+    """解析 /proc/zoneinfo，返回 {(node_id, comm): (zone_pfn, spanned_pages, present_pages)}"""
+    zones = {}
+    key = None
+    info = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == 'Node' and len(parts) >= 4 and parts[2] == 'zone':
+            if key is not None:
+                zones[key] = (info.get('start_pfn:', 0), info.get('spanned', 0),
+                              info.get('present', 0))
+            key = (int(parts[1].rstrip(',')), parts[3])
+            info = {}
+        elif key is not None and len(parts) == 2 and parts[0] in ('spanned', 'present', 'start_pfn:'):
+            info[parts[0]] = int(parts[1])
+    if key is not None:
+        zones[key] = (info.get('start_pfn:', 0), info.get('spanned', 0), info.get('present', 0))
+    return zones
+
+
+def parse_pagetypeinfo(text):
+    """
+    解析 /proc/pagetypeinfo 的空闲页部分，返回 ([(node_id, comm)], migratetypes, nr_free)，
+    nr_free 为 [zone][migratetype][order] 的 int64 数组，migratetype 按文件中的顺序。
+    所有数据行拼接后一次切分，数字部分用一次 np.fromstring 整体转换，不逐行解析；
+    列数多于 NR_ORDERS 时截断，少于时补零。
+    内核（5.9 起）每项最多数到 100000，超出时显示为 ">100000"，按 100000 计
+    """
+    start = text.find("Free pages count per migrate type")
+    end = text.find("Number of blocks type", start)
+    section = text[start:end] if end >= 0 else text[start:]
+    # Node    0, zone   Normal, type      Movable   2225   1177 ...
+    rows = [line for line in section.splitlines() if line.startswith('Node')]
+    if start < 0 or not rows:
+        return [], (), np.zeros((0, 0, NR_ORDERS), dtype=np.int64)
+    words = ' '.join(rows).replace(',', ' ').replace('>', '').split()
+    width = len(words) // len(rows)
+    # 每行为 Node <id> zone <名称> type <migratetype> <各 order 的计数>，只有 id 与计数是数字
+    numbers = np.fromstring(' '.join(w for w in words if w.isdigit()), dtype=np.int64, sep=' ')
+    if len(words) != width * len(rows) or len(numbers) != (width - 5) * len(rows):
+        raise ValueError("unexpected /proc/pagetypeinfo layout")
+    numbers = numbers.reshape(len(rows), -1)
+    orders = min(width - 6, NR_ORDERS)
+    nr_free = np.zeros((len(rows), NR_ORDERS), dtype=np.int64)
+    nr_free[:, :orders] = numbers[:, 1:1 + orders]
+
+    migratetypes = tuple(dict.fromkeys(words[5::width]))
+    keys = list(dict.fromkeys(zip(numbers[:, 0].tolist(), words[3::width])))
+    # 内核对每个 zone 按同样的顺序输出全部 migratetype
+    if len(rows) != len(keys) * len(migratetypes):
+        raise ValueError("unexpected /proc/pagetypeinfo layout")
+    return keys, migratetypes, nr_free.reshape(len(keys), len(migratetypes), NR_ORDERS)
+
+
+def parse_iomem(text):
+    """/proc/iomem 中顶层 System RAM 的 [(起始地址, 结束地址)]（闭区间）；非 root 读到的地址全为 0"""
+    ranges = []
+    for line in text.splitlines():
+        span, _, name = line.partition(' : ')
+        if span[:1] != ' ' and name.strip() == 'System RAM':
+            lo, _, hi = span.partition('-')
+            ranges.append((int(lo, 16), int(hi, 16)))
+    return ranges
+
+
+def node_start_pfns(node_ids, iomem_path="/proc/iomem", node_dir="/sys/devices/system/node",
+                    memory_dir="/sys/devices/system/memory", page_size=None):
+    """
+    各节点真实的 node_start_pfn：节点的内存块（sysfs 中的 memoryN）范围内最低的 System RAM 页，
+    与内核由 memblock 得到的值一致（x86 上第 0 页被 e820 保留，节点 0 通常从第 1 页开始）。
+    没有 NUMA 目录时把全部内存算作节点 0。读不到时（非 root 读到的 /proc/iomem 地址全为 0、
+    内核不支持内存热插拔等）该节点为 0
+    """
+    page_size = page_size or os.sysconf('SC_PAGE_SIZE')
+    starts = dict.fromkeys(node_ids, 0)
+    try:
+        ram = [r for r in parse_iomem(read_text(iomem_path)) if r[1]]
+    except OSError:
+        return starts
+    if not ram:
+        return starts
+    if not os.path.isdir(node_dir):
+        if 0 in starts:
+            starts[0] = min(lo for lo, hi in ram) // page_size
+        return starts
+    try:
+        with open(os.path.join(memory_dir, "block_size_bytes")) as f:
+            block_size = int(f.read(), 16)
+    except (OSError, ValueError):
+        return starts
+    for node_id in node_ids:
+        try:
+            blocks = [int(name[6:]) for name in os.listdir(os.path.join(node_dir, f"node{node_id}"))
+                      if name.startswith('memory') and name[6:].isdigit()]
+        except OSError:
+            continue
+        lowest = None
+        for block in blocks:
+            block_lo, block_hi = block * block_size, (block + 1) * block_size - 1
+            for lo, hi in ram:
+                if lo <= block_hi and hi >= block_lo:
+                    start = max(lo, block_lo)
+                    lowest = start if lowest is None else min(lowest, start)
+        if lowest is not None:
+            starts[node_id] = -(-lowest // page_size)
+    return starts
+
+
+def read_text(path):
+    """一次缓冲读取整个 proc 文件"""
+    with open(path, 'rb') as f:
+        return f.read().decode('ascii', 'replace')
+
+
+class BuddyinfoSource:
+    """
+    纯用户态数据源：每个周期读取一次 /proc/buddyinfo，用 NumPy 批量计算指标，
+    不需要 root、内核头文件或 BCC。zone 的 pfn/spanned/present 来自 /proc/zoneinfo，
+    只在 zone 集合变化时重新读取；指标只对 nr_free 变化的 zone 重新计算。
+    """
+    def __init__(self, buddyinfo_path="/proc/buddyinfo", zoneinfo_path="/proc/zoneinfo"):
+        self.buddyinfo_path = buddyinfo_path
+        self.zoneinfo_path = zoneinfo_path
+        self.keys = None
+        self.zones = ()
+        self.nodes = {}
+        self.index = IndexCache()
+
+    def _load_zoneinfo(self, keys):
+        try:
+            meta = parse_zoneinfo(read_text(self.zoneinfo_path))
+        except OSError:
+            meta = {}
+        self.zones = tuple((node_id, comm) + tuple(meta.get((node_id, comm), (0, 0, 0)))
+                           for node_id, comm in keys)
+        # 最低 zone 的起始 pfn 不一定是节点起始，读取真实的 node_start_pfn
+        self.nodes = node_start_pfns(sorted({node_id for node_id, comm in keys}))
+        self.keys = keys
+
+    def snapshot(self, interval=0.0):
+        keys, nr_free = parse_buddyinfo(read_text(self.buddyinfo_path))
+        order = sorted(range(len(keys)), key=lambda i: keys[i])
+        keys = [keys[i] for i in order]
+        nr_free = nr_free[order]
+        if keys != self.keys:
+            self._load_zoneinfo(keys)
+        columns = self.index.columns(keys, nr_free)
+        return Snapshot(time.time(), self.zones, self.nodes, *columns, interval=interval)
+
+
+class PagetypeinfoReader:
+    """
+    读取 /proc/pagetypeinfo，为快照附加每个 (zone, migratetype, order) 的 nr_free 与指标，
+    所有 zone 与 migratetype 的指标用一次向量化计算得到。
+    内核输出该文件时对每个 zone 持 zone->lock 遍历空闲链表，大内存机器上开销明显，
+    因此只在显示对应视图时读取；文件只有 root 可读，读不到时 error 记录原因、快照保持不变
+    """
+    def __init__(self, path="/proc/pagetypeinfo"):
+        self.path = path
+        self.error = None
+        self.seconds = 0.0
+
+    def extend(self, snap):
+        start = time.perf_counter()
+        try:
+            keys, migratetypes, nr_free = parse_pagetypeinfo(read_text(self.path))
+        except (OSError, ValueError) as e:
+            self.error = f"{self.path}: {getattr(e, 'strerror', None) or e}"
+            return snap
+        self.error = None
+        # 按 snap.zones 的顺序排列，文件中没有的 zone 按全 0 计
+        index = {key: i for i, key in enumerate(keys)}
+        rows = np.array([index.get(zone[:2], -1) for zone in snap.zones], dtype=np.int64)
+        aligned = np.zeros((len(rows), len(migratetypes), NR_ORDERS), dtype=np.int64)
+        aligned[rows >= 0] = nr_free[rows[rows >= 0]]
+        _, _, _, score_a, score_b = fragmentation_columns(aligned.reshape(-1, NR_ORDERS))
+        shape = aligned.shape
+        snap = snap.with_migratetypes(
+            migratetypes,
+            *(tuple(tuple(map(tuple, zone)) for zone in column.reshape(shape).tolist())
+              for column in (aligned, score_a, score_b)))
+        self.seconds = time.perf_counter() - start
+        return snap
+
+    def status(self):
+        if self.error:
+            return self.error
+        return f"pagetypeinfo {self.seconds * 1000:.1f} ms"
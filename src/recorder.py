@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import os
+import struct
+
+import numpy as np
+
+from fragindex import fragmentation_columns, nr_free_from_suitable
+from snapshot import NR_ORDERS, Snapshot
+
+MAGIC = b'MFDR'
+VERSION = 3
+# magic, version, nr_orders, nr_zones, nr_nodes, capacity, count, record_size
+HEADER = struct.Struct('<4sHHHHIII')
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+ZONE_DTYPE = np.dtype([('node_id', '<u2'), ('name', 'S14'), ('zone_pfn', '<u8'),
+                       ('spanned_pages', '<u8'), ('present_pages', '<u8')])
+# Snapshot.nodes：节点的起始 pfn 不一定是其最低 zone 的起始 pfn（见 procfs.node_start_pfns），需要单独保存
+NODE_DTYPE = np.dtype([('node_id', '<u8'), ('start_pfn', '<u8')])
+U32_MAX = 0xffffffff
+# Snapshot 中由 nr_free 计算出的五列
+COLUMNS = ('free_pages', 'free_blocks_total', 'free_blocks_suitable', 'score_a', 'score_b')
+
+
+def record_dtype(nr_zones):
+    """
+    单条记录：采样间隔(ms) + 每个 zone 各 order 的 nr_free；时间戳单独存放在时间索引中，
+    其余各列读取时由 record_columns() 计算
+    """
+    return np.dtype([('interval_ms', '<u4'),
+                     ('nr_free', '<u4', (nr_zones, NR_ORDERS))])
+
+
+def fill_record(records, i, snap, interval):
+    """把快照写入 records[i]（录制文件与 exporter 的二进制快照共用同一布局）"""
+    records['interval_ms'][i] = int(interval * 1000)
+    records['nr_free'][i] = np.minimum(nr_free_from_suitable(snap.free_blocks_suitable), U32_MAX)
+
+
+def record_columns(records):
+    """
+    由一条或一组记录的 nr_free 计算 Snapshot 的五列，
+    返回 {列名: 形状为 nr_free.shape 的 int64 数组}
+    """
+    nr_free = records['nr_free']
+    columns = fragmentation_columns(nr_free.reshape(-1, NR_ORDERS))
+    return {name: np.asarray(column).reshape(nr_free.shape) for name, column in zip(COLUMNS, columns)}
+
+
+def zone_table(zones):
+    """Snapshot.zones 转为 ZONE_DTYPE 数组"""
+    table = np.zeros(len(zones), dtype=ZONE_DTYPE)
+    for i, (node_id, comm, zone_pfn, spanned, present) in enumerate(zones):
+        table[i] = (node_id, comm.encode()[:14], zone_pfn, spanned, present)
+    return table
+
+
+def zone_tuples(table):
+    """ZONE_DTYPE 数组转回 Snapshot.zones"""
+    return tuple((int(z['node_id']), z['name'].decode('utf-8', 'replace'),
+                  int(z['zone_pfn']), int(z['spanned_pages']), int(z['present_pages']))
+                 for z in table)
+
+
+def node_table(nodes):
+    """Snapshot.nodes 转为 NODE_DTYPE 数组"""
+    return np.array(sorted(nodes.items()), dtype=NODE_DTYPE)
+
+
+def node_dict(table):
+    """NODE_DTYPE 数组转回 Snapshot.nodes"""
+    return {int(n['node_id']): int(n['start_pfn']) for n in table}
+
+
+def layout(nr_zones, nr_nodes, capacity):
+    """返回 (节点表偏移, 时间索引偏移, 记录区偏移, 文件大小)"""
+    nodes_offset = HEADER_SIZE + nr_zones * ZONE_DTYPE.itemsize
+    index_offset = nodes_offset + nr_nodes * NODE_DTYPE.itemsize
+    records_offset = index_offset + capacity * 8
+    # 记录区按 8 字节对齐
+    records_offset = (records_offset + 7) & ~7
+    return nodes_offset, index_offset, records_offset, records_offset + capacity * record_dtype(nr_zones).itemsize
+
+
+def rotate(path, max_files):
+    """path -> path.1 -> ... -> path.(max_files-1)，最旧的文件被删除"""
+    if max_files <= 1:
+        if os.path.exists(path):
+            os.unlink(path)
+        return
+    oldest = f"{path}.{max_files - 1}"
+    if os.path.exists(oldest):
+        os.unlink(oldest)
+    for i in range(max_files - 2, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    if os.path.exists(path):
+        os.replace(path, f"{path}.1")
+
+
+def write_recording(f, zones, nodes, timestamps, records):
+    """
+    把一段已有的记录一次写成完整的录制文件（容量等于条数），f 为以二进制写打开的文件，
+    timestamps 为纳秒时间戳。写完后文件位置在记录区末尾，调用者可以在其后附加数据
+    """
+    nr_zones = len(zones)
+    count = len(records)
+    dtype = record_dtype(nr_zones)
+    nodes_offset, index_offset, records_offset, size = layout(nr_zones, len(nodes), count)
+    buf = np.zeros(size, dtype=np.uint8)
+    buf[:HEADER.size] = np.frombuffer(
+        HEADER.pack(MAGIC, VERSION, NR_ORDERS, nr_zones, len(nodes), count, count, dtype.itemsize),
+        dtype=np.uint8)
+    buf[HEADER_SIZE:nodes_offset].view(ZONE_DTYPE)[:] = zone_table(zones)
+    buf[nodes_offset:index_offset].view(NODE_DTYPE)[:] = node_table(nodes)
+    buf[index_offset:index_offset + count * 8].view('<u8')[:] = timestamps
+    buf[records_offset:size].view(dtype)[:] = records
+    f.write(buf.data)
+
+
+class Recorder:
+    """
+    把每个采样周期的快照追加到定长二进制文件中。文件预分配并通过 mmap 写入，
+    每条记录每个 zone 只有 44 字节；写满 max_bytes 或 zone 布局、节点起始 pfn 变化时轮转，
+    最多保留 max_files 个文件，磁盘占用不超过 max_bytes * max_files。
+    """
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_files=4):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.zones = None
+        self.nodes = None
+        self.count = 0
+        self.capacity = 0
+        self._mm = None
+
+    def _open(self, zones, nodes):
+        self.close()
+        rotate(self.path, self.max_files)
+        nr_zones = len(zones)
+        per_record = 8 + record_dtype(nr_zones).itemsize
+        fixed = layout(nr_zones, len(nodes), 0)[2]
+        capacity = max(1, (self.max_bytes - fixed) // per_record)
+        nodes_offset, index_offset, records_offset, size = layout(nr_zones, len(nodes), capacity)
+
+        with open(self.path, 'wb') as f:
+            f.truncate(size)
+        mm = np.memmap(self.path, dtype=np.uint8, mode='r+', shape=(size,))
+        mm[:HEADER.size] = np.frombuffer(
+            HEADER.pack(MAGIC, VERSION, NR_ORDERS, nr_zones, len(nodes), capacity, 0,
+                        record_dtype(nr_zones).itemsize), dtype=np.uint8)
+        mm[HEADER_SIZE:nodes_offset].view(ZONE_DTYPE)[:] = zone_table(zones)
+        mm[nodes_offset:index_offset].view(NODE_DTYPE)[:] = node_table(nodes)
+
+        self._mm = mm
+        self._count = mm[COUNT_OFFSET:COUNT_OFFSET + 4].view('<u4')
+        self._index = mm[index_offset:index_offset + capacity * 8].view('<u8')
+        self._records = mm[records_offset:size].view(record_dtype(nr_zones))
+        self.zones = zones
+        self.nodes = nodes
+        self.count = 0
+        self.capacity = capacity
+
+    def append(self, snap, interval=None):
+        """interval 缺省时使用快照自身记录的采样间隔"""
+        if interval is None:
+            interval = snap.interval
+        if not snap.zones:
+            return
+        if snap.zones != self.zones or snap.nodes != self.nodes or self.count >= self.capacity:
+            self._open(snap.zones, dict(snap.nodes))
+        i = self.count
+        fill_record(self._records, i, snap, interval)
+        self._index[i] = int(snap.timestamp * 1e9)
+        # 最后更新计数，读者看到的记录总是完整的
+        self.count += 1
+        self._count[0] = self.count
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm = None
+
+
+class Recording:
+    """只读打开一个录制文件，按时间索引做 O(log n) 定位"""
+    def __init__(self, path):
+        self.path = path
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, nr_orders, nr_zones, nr_nodes, capacity, count, record_size = \
+            HEADER.unpack(raw[:HEADER.size].tobytes())
+        if magic != MAGIC or nr_orders != NR_ORDERS:
+            raise ValueError(f"{path}: not a fragmentation recording")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported recording version {version}")
+        nodes_offset, index_offset, records_offset, size = layout(nr_zones, nr_nodes, capacity)
+        self.zones = zone_tuples(raw[HEADER_SIZE:nodes_offset].view(ZONE_DTYPE))
+        self.nodes = node_dict(raw[nodes_offset:index_offset].view(NODE_DTYPE))
+        self.count = count
+        self.dtype = record_dtype(nr_zones)
+        self.records_offset = records_offset
+        self.timestamps = raw[index_offset:index_offset + count * 8].view('<u8')
+        self.records = raw[records_offset:size].view(self.dtype)[:count]
+        # 文件中录制数据的结尾，之后可能附加其它数据（见 trigger.py 的进程表）
+        self.size = size
+
+    def __len__(self):
+        return self.count
+
+    def find(self, timestamp):
+        """返回时间戳 >= timestamp 的第一条记录下标"""
+        return int(np.searchsorted(self.timestamps, int(timestamp * 1e9), side='left'))
+
+    def at(self, timestamp):
+        """返回 timestamp 时刻生效的记录下标（时间戳 <= timestamp 的最后一条）"""
+        i = int(np.searchsorted(self.timestamps, int(timestamp * 1e9), side='right')) - 1
+        return min(max(i, 0), self.count - 1)
+
+    def iter_chunks(self, start, stop, chunk=65536):
+        """
+        顺序读取 [start, stop) 的记录，每次最多 chunk 条；读入同一块预分配缓冲区，
+        不经过 mmap，常驻内存不随文件大小增长
+        """
+        buf = np.empty(chunk, dtype=self.dtype)
+        with open(self.path, 'rb', buffering=0) as f:
+            f.seek(self.records_offset + start * self.dtype.itemsize)
+            while start < stop:
+                n = min(chunk, stop - start)
+                view = buf[:n]
+                got = f.readinto(memoryview(view).cast('B')) // self.dtype.itemsize
+                if got <= 0:
+                    break
+                yield view[:got]
+                start += got
+
+    def interval(self, i):
+        return int(self.records[i]['interval_ms']) / 1000.0
+
+    def snapshot(self, i):
+        columns = record_columns(self.records[i])
+        columns = [tuple(map(tuple, columns[name].tolist())) for name in COLUMNS]
+        return Snapshot(self.timestamps[i] / 1e9, self.zones, self.nodes, *columns,
+                        interval=self.interval(i))
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import curses
+
+
+def generate_fragmentation_bar(score, max_length=20, baseline=None):
+    """生成用于显示碎片化程度的条形图，给出 baseline 时在其位置画 '|'"""
+    proportion = min(max(score, 0), 1)
+    bar_length = int(proportion * max_length)
+    bar = '#' * bar_length + '-' * (max_length - bar_length)
+    if baseline is not None:
+        pos = min(int(min(max(baseline, 0), 1) * max_length), max_length - 1)
+        bar = bar[:pos] + '|' + bar[pos + 1:]
+    return bar
+
+
+def createBar(height,width,y,x,title:str):
+        winbar = curses.newwin(height,width,y,x)
+        winbar.border(0)
+        winbar.addstr(0,1,title)
+        winbar.noutrefresh()
+        return winbar
+
+
+def setProgress(win,progress):
+        h,w = win.getmaxyx()
+        char_max_w= w-3
+        displayclear = "█"*char_max_w
+        win.addstr(1, 1, "{}".format(displayclear),curses.color_pair(1))
+        rangex = (char_max_w / float(100)) * progress
+        pos = int(rangex)
+        res = 0
+        if pos==0:
+            res = 1
+            pos+=1
+        display = "█"*pos
+        numstr=str(format(progress,'.1f'))
+        win.addstr(0,w-9,"{}%".format(numstr)+" "*1)
+        if  res==0:
+            win.addstr(1, 1, "{}".format(display),curses.color_pair(2))
+        win.noutrefresh()
+
+
+class Frame:
+    """
+    按行缓存上一帧。draw() 传入决定该行内容的数据 key，key 与属性都没变时
+    既不重新格式化也不写屏；变化时只覆盖该行上一帧占用的宽度。
+    """
+    def __init__(self, screen, profile=None):
+        self.screen = screen
+        self.rows = {}
+        # 开启剖析时换成分别计时格式化（ui.format）与 addstr（ui.addstr）的版本，关闭时没有额外开销
+        if profile is not None and profile.enabled:
+            self._format = profile.stage('ui.format')
+            self._addstr = profile.stage('ui.addstr')
+            self._draw = self._draw_profiled
+
+    def draw(self, row, key, render, attr=0):
+        """画在最后一行之前的内容行，超出屏幕时返回 False"""
+        max_rows, max_cols = self.screen.getmaxyx()
+        if row >= max_rows - 1:
+            return False
+        return self._draw(row, key, render, attr)
+
+    def status(self, text, attr=0):
+        """最后一行留给状态栏"""
+        max_rows, max_cols = self.screen.getmaxyx()
+        return self._draw(max_rows - 1, text, lambda: text, attr)
+
+    def _draw(self, row, key, render, attr):
+        max_rows, max_cols = self.screen.getmaxyx()
+        cached = self.rows.get(row)
+        if cached is not None and cached[0] == key and cached[1] == attr:
+            return True
+        line = render().rstrip('\n')[:max_cols - 1]
+        width = len(line)
+        if cached is not None and cached[2] > width:
+            line = line.ljust(cached[2])
+        self.screen.addstr(row, 0, line, attr)
+        self.rows[row] = (key, attr, width)
+        return True
+
+    def _draw_profiled(self, row, key, render, attr):
+        max_rows, max_cols = self.screen.getmaxyx()
+        cached = self.rows.get(row)
+        if cached is not None and cached[0] == key and cached[1] == attr:
+            return True
+        with self._format:
+            line = render().rstrip('\n')[:max_cols - 1]
+        width = len(line)
+        if cached is not None and cached[2] > width:
+            line = line.ljust(cached[2])
+        with self._addstr:
+            self.screen.addstr(row, 0, line, attr)
+        self.rows[row] = (key, attr, width)
+        return True
+
+    def clear_below(self, row):
+        """擦除上一帧中 row 及以下、本帧没有再画的行"""
+        for r in sorted(r for r in self.rows if r >= row):
+            self.screen.addstr(r, 0, ' ' * self.rows[r][2])
+            del self.rows[r]
+
+    def invalidate(self):
+        """窗口尺寸变化等情况下丢弃缓存，下一帧整屏重画"""
+        self.rows.clear()
+        self.screen.erase()
+
+
+class Viewport:
+    """
+    可滚动视口：记录第一行的位置与可见行数，调用方只为可见的行取数据并格式化，
+    每帧的开销取决于屏幕大小而不是行数。cached() 缓存按当前排序与过滤得到的行列表，
+    同一快照与设置下翻页、重画都不再重新排序
+    """
+    def __init__(self):
+        self.top = 0
+        self.height = 0
+        self.total = 0
+        self._key = None
+        self._rows = None
+
+    def layout(self, total, height):
+        self.total = total
+        self.height = max(height, 0)
+        self.top = max(min(self.top, total - self.height), 0)
+
+    def visible(self):
+        return range(self.top, min(self.top + self.height, self.total))
+
+    def scroll(self, delta):
+        self.top = max(min(self.top + delta, self.total - self.height), 0)
+
+    def handle_key(self, key):
+        """上下方向键/j/k 滚动一行，PgUp/PgDn 翻页，Home/End/g/G 到首尾；不是滚动键时返回 False"""
+        if key in (curses.KEY_DOWN, ord('j')):
+            self.scroll(1)
+        elif key in (curses.KEY_UP, ord('k')):
+            self.scroll(-1)
+        elif key == curses.KEY_NPAGE:
+            self.scroll(max(self.height - 1, 1))
+        elif key == curses.KEY_PPAGE:
+            self.scroll(-max(self.height - 1, 1))
+        elif key in (curses.KEY_HOME, ord('g')):
+            self.top = 0
+        elif key in (curses.KEY_END, ord('G')):
+            self.scroll(self.total)
+        else:
+            return False
+        return True
+
+    def cached(self, key, compute):
+        if self._key != key:
+            self._rows = compute()
+            self._key = key
+        return self._rows
+
+    def status(self):
+        if not self.total:
+            return "no rows"
+        return f"rows {self.top + 1}-{min(self.top + self.height, self.total)}/{self.total}"
+
+
+def clearBar(win):
+        win.erase()
+        win.noutrefresh()
+
+
+class BarPanel:
+    """
+    -v 视图的进度条：每个可见的 zone 槽位一行 order 窗口，窗口只在终端尺寸变化时重建，
+    之后只重画 zone 或数值发生变化的窗口，与机器上的 zone 总数无关。
+    终端较窄时缩小窗口宽度，仍放不下时只显示最高的几个 order。
+    """
+    LABEL_WIDTH = 24
+    BAR_WIDTH = 21
+    # setProgress 在标题栏 w-9 处写百分比，窗口至少要这么宽才不会盖住 order 标题
+    MIN_BAR_WIDTH = 13
+
+    def __init__(self, nr_orders):
+        self.nr_orders = nr_orders
+        self.geometry = None
+        self.orders = []
+        self.slots = 0
+        self.bars = {}
+        self.progress = {}
+
+    def reset(self):
+        self.geometry = None
+        self.orders = []
+        self.slots = 0
+        self.bars = {}
+        self.progress = {}
+
+    @staticmethod
+    def capacity(max_rows):
+        """可以容纳的 zone 槽位数：第 0 行为时间，每个 zone 占 3 行，最后一行是状态栏"""
+        return max((max_rows - 3) // 3, 0)
+
+    def _layout(self, max_rows, max_cols):
+        self.reset()
+        self.geometry = (max_rows, max_cols)
+        space = max(max_cols - self.LABEL_WIDTH, 0)
+        shown = min(self.nr_orders, space // self.MIN_BAR_WIDTH)
+        if not shown:
+            return
+        width = min(self.BAR_WIDTH, space // shown)
+        self.orders = list(range(self.nr_orders - shown, self.nr_orders))
+        self.slots = self.capacity(max_rows)
+        for slot in range(self.slots):
+            for i, order in enumerate(self.orders):
+                self.bars[(slot, order)] = createBar(3, width, 2 + slot * 3,
+                                                     self.LABEL_WIDTH + i * width, str(order))
+                self.progress[(slot, order)] = None
+
+    def update(self, screen, zones):
+        """
+        zones 为可见槽位依次对应的 [(node_id, comm, [每个 order 的 unusable_index])]。
+        需要在 stdscr.noutrefresh() 之后调用，保证进度条窗口叠在标准屏幕之上。
+        """
+        max_rows, max_cols = screen.getmaxyx()
+        if (max_rows, max_cols) != self.geometry:
+            self._layout(max_rows, max_cols)
+        for slot in range(self.slots):
+            scores = zones[slot][2] if slot < len(zones) else None
+            for order in self.orders:
+                key = (slot, order)
+                progress = None if scores is None else scores[order]
+                if progress == self.progress[key]:
+                    continue
+                win = self.bars[key]
+                if progress is None:
+                    # 过滤后没有 zone 的槽位
+                    clearBar(win)
+                elif self.progress[key] is None:
+                    win.border(0)
+                    win.addstr(0, 1, str(order))
+                    setProgress(win, progress * 100)
+                else:
+                    setProgress(win, progress * 100)
+                self.progress[key] = progress
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import time
+from datetime import datetime
+
+import numpy as np
+
+from recorder import Recording, record_columns
+from snapshot import NR_ORDERS
+
+# 指标是放大 1000 倍的整数，取值 [-1000, 1000]，直方图可以精确求分位数
+SCORE_BINS = 2001
+SCORE_FIELDS = ('score_a', 'score_b')
+QUANTILES = (50, 90, 99)
+
+
+def parse_time(text):
+    """接受 unix 秒或 'YYYY-mm-dd HH:MM:SS'"""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp()
+
+
+class ReplaySource:
+    """
+    回放录制文件的数据源，接口与 BuddyinfoSource 相同。
+    回放时钟每次 snapshot() 前进 (距上次调用的时间 * speed)，暂停时不动。
+    """
+    def __init__(self, path):
+        self.recording = Recording(path)
+        if not len(self.recording):
+            raise ValueError(f"{path}: empty recording")
+        self.index = 0
+        self.clock = self.recording.timestamps[0] / 1e9
+        self.speed = 1.0
+        self.paused = False
+        self._last = None
+
+    def snapshot(self, interval=0.0):
+        """interval 只为与其它数据源一致，回放快照使用录制时的间隔"""
+        now = time.monotonic()
+        if self._last is not None and not self.paused:
+            self.clock += (now - self._last) * self.speed
+            self.index = self.recording.at(self.clock)
+        self._last = now
+        return self.recording.snapshot(self.index)
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+
+    def faster(self):
+        self.speed = min(self.speed * 2, 1024)
+
+    def slower(self):
+        self.speed = max(self.speed / 2, 1 / 8)
+
+    def seek(self, records):
+        """前后跳过若干条记录"""
+        self.index = min(max(self.index + records, 0), len(self.recording) - 1)
+        self.clock = self.recording.timestamps[self.index] / 1e9
+
+    def status(self):
+        ts = datetime.fromtimestamp(self.recording.timestamps[self.index] / 1e9)
+        state = 'paused' if self.paused else f'x{self.speed:g}'
+        return (f"REPLAY {ts:%Y-%m-%d %H:%M:%S} [{self.index + 1}/{len(self.recording)}] {state}"
+                f"   [space] pause  [</>] seek  [+/-] speed")
+
+
+class QueryStats:
+    """按 (node_id, comm) 流式累积每个 order 的 min/max 与指标直方图，内存与文件大小无关"""
+    def __init__(self):
+        self.samples = {}
+        self.minimum = {}
+        self.maximum = {}
+        self.hist = {}
+
+    def add(self, zones, chunk):
+        n = len(chunk)
+        if not n:
+            return
+        cells = np.arange(NR_ORDERS) * SCORE_BINS
+        columns = record_columns(chunk)
+        for z, (node_id, comm, _, _, _) in enumerate(zones):
+            key = (node_id, comm)
+            if key not in self.samples:
+                self.samples[key] = 0
+                self.minimum[key] = {}
+                self.maximum[key] = {}
+                self.hist[key] = {f: np.zeros(NR_ORDERS * SCORE_BINS, dtype=np.int64)
+                                  for f in SCORE_FIELDS}
+            self.samples[key] += n
+            for field in ('free_pages',) + SCORE_FIELDS:
+                column = columns[field][:, z, :]
+                lo, hi = column.min(axis=0), column.max(axis=0)
+                if field in self.minimum[key]:
+                    lo = np.minimum(lo, self.minimum[key][field])
+                    hi = np.maximum(hi, self.maximum[key][field])
+                self.minimum[key][field] = lo
+                self.maximum[key][field] = hi
+            for field in SCORE_FIELDS:
+                offsets = (columns[field][:, z, :] + 1000) + cells
+                self.hist[key][field] += np.bincount(offsets.ravel(),
+                                                     minlength=NR_ORDERS * SCORE_BINS)
+
+    def percentiles(self, key, field):
+        """返回 {q: [order] 数组}，单位与快照一致（放大 1000 倍）"""
+        hist = self.hist[key][field].reshape(NR_ORDERS, SCORE_BINS)
+        cum = hist.cumsum(axis=1)
+        total = cum[:, -1]
+        ret = {}
+        for q in QUANTILES:
+            rank = np.ceil(total * q / 100.0).clip(1)
+            ret[q] = np.array([np.searchsorted(cum[o], rank[o]) for o in range(NR_ORDERS)]) - 1000
+        return ret
+
+
+def query(paths, start=None, end=None, chunk=65536):
+    """流式扫描一个或多个录制文件中 [start, end) 时间窗口内的记录"""
+    stats = QueryStats()
+    for path in paths:
+        rec = Recording(path)
+        lo = rec.find(start) if start is not None else 0
+        hi = rec.find(end) if end is not None else len(rec)
+        for block in rec.iter_chunks(lo, hi, chunk):
+            stats.add(rec.zones, block)
+    return stats
+
+
+def format_query(stats, out):
+    header = f"{'NODE_ID':>7} {'ZONE_COMM':>9} {'ORDER':>5} {'SAMPLES':>9} {'FREE_MIN':>10} {'FREE_MAX':>10}"
+    for name in ('extfrag', 'unusable'):
+        header += f" {name + '_min':>13}" + ''.join(f" {f'{name}_p{q}':>13}" for q in QUANTILES) \
+            + f" {name + '_max':>13}"
+    print(header, file=out)
+    for key in sorted(stats.samples):
+        node_id, comm = key
+        pct = {f: stats.percentiles(key, f) for f in SCORE_FIELDS}
+        for order in range(NR_ORDERS):
+            line = f"{node_id:>7} {comm:>9} {order:>5} {stats.samples[key]:>9} " \
+                   f"{int(stats.minimum[key]['free_pages'][order]):>10} " \
+                   f"{int(stats.maximum[key]['free_pages'][order]):>10}"
+            for field in SCORE_FIELDS:
+                values = [stats.minimum[key][field][order]] \
+                    + [pct[field][q][order] for q in QUANTILES] + [stats.maximum[key][field][order]]
+                line += ''.join(f" {v / 1000:>13.3f}" for v in values)
+            print(line, file=out)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+import ctypes
+import os
+import platform
+import time
+
+# bpf(2) 的系统调用号与 BPF_ENABLE_STATS 命令（内核 5.8 起），BPF_STATS_RUN_TIME 为 0
+BPF_SYSCALLS = {'x86_64': 321, 'aarch64': 280, 'riscv64': 280, 'loongarch64': 280}
+BPF_ENABLE_STATS = 32
+BPF_STATS_SYSCTL = "/proc/sys/kernel/bpf_stats_enabled"
+# 状态栏中每秒开销的统计窗口（秒）
+RATE_WINDOW = 1.0
+
+
+class Stage:
+    """一个阶段的累计耗时，用作 with 语句；不可重入，同一阶段只在一个线程中计时"""
+    __slots__ = ('name', 'calls', 'total_ns', 'max_ns', '_start')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.add(time.perf_counter_ns() - self._start)
+
+    def add(self, ns):
+        self.calls += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+
+class NullStage:
+    """关闭剖析时所有阶段共用的空计时器"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def add(self, ns):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+def enable_bpf_stats():
+    """
+    打开内核对 BPF 程序运行时间与次数的统计，返回保持开启的 fd（关闭即恢复），
+    内核不支持或没有权限时返回 None。统计开启时每次运行 BPF 程序多两次取时间
+    """
+    nr = BPF_SYSCALLS.get(platform.machine())
+    if nr is None:
+        return None
+    libc = ctypes.CDLL(None, use_errno=True)
+    # union bpf_attr 中的 enable_stats.type，其余字节必须为 0
+    attr = (ctypes.c_uint32 * 4)(0)
+    fd = libc.syscall(ctypes.c_long(nr), ctypes.c_int(BPF_ENABLE_STATS),
+                      ctypes.byref(attr), ctypes.c_uint(ctypes.sizeof(attr)))
+    return fd if fd >= 0 else None
+
+
+def bpf_stats_sysctl():
+    try:
+        with open(BPF_STATS_SYSCTL) as f:
+            return f.read().strip() == '1'
+    except OSError:
+        return False
+
+
+def read_fdinfo(fd):
+    """解析 /proc/self/fdinfo/<fd> 中 BPF 程序的 prog_id、run_time_ns、run_cnt 等整数字段"""
+    info = {}
+    with open(f"/proc/self/fdinfo/{fd}") as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            value = value.strip()
+            if value.isdigit():
+                info[key] = int(value)
+    return info
+
+
+def prog_fds(b):
+    """BCC 的 BPF 对象（funcs）或 bpfcache.CachedBPF（progs）中已加载程序的 {名称: fd}"""
+    progs = getattr(b, 'progs', None)
+    if progs is not None:
+        return dict(progs)
+    return {(name.decode() if isinstance(name, bytes) else name): fn.fd
+            for name, fn in getattr(b, 'funcs', {}).items()}
+
+
+class Profiler:
+    """
+    采集、数据整理与绘制各阶段的计时，以及 BPF 程序自身的运行时间与次数。
+    enabled 为 False 时 stage() 返回空计时器，除一次方法调用外没有额外开销。
+    阶段名用 '.' 分组：collect.* 在采集线程中，ui.* 在界面线程中
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.progs = {}
+        self.stats_fd = None
+        self._prog_base = {}
+        self.started = time.monotonic()
+        self.cpu_started = time.process_time()
+        self._rates = {}
+        self._last = None
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name)
+        return stage
+
+    def attach_bpf(self, b):
+        """记录 b 中已加载程序的 fd，并尽量打开内核的 BPF 运行统计"""
+        if not self.enabled or b is None:
+            return
+        self.progs.update(prog_fds(b))
+        if self.stats_fd is None and not bpf_stats_sysctl():
+            self.stats_fd = enable_bpf_stats()
+        # 固定在 bpffs 上复用的程序带着之前运行的累计值，只统计本次运行的部分
+        self._prog_base = {}
+        self._prog_base = self.prog_stats()
+
+    def bpf_stats_enabled(self):
+        return self.stats_fd is not None or bpf_stats_sysctl()
+
+    def prog_stats(self):
+        """{程序名: {'id', 'run_time_ns', 'run_cnt'}}，读不到 fdinfo 的程序跳过"""
+        ret = {}
+        for name, fd in self.progs.items():
+            try:
+                info = read_fdinfo(fd)
+            except OSError:
+                continue
+            base = self._prog_base.get(name, {})
+            ret[name] = {'id': info.get('prog_id', 0),
+                         'run_time_ns': info.get('run_time_ns', 0) - base.get('run_time_ns', 0),
+                         'run_cnt': info.get('run_cnt', 0) - base.get('run_cnt', 0)}
+        return ret
+
+    def totals(self):
+        """各阶段与 BPF 程序（bpf.<名称>）的累计 (耗时 ns, 次数)"""
+        ret = {name: (stage.total_ns, stage.calls) for name, stage in list(self.stages.items())}
+        for name, prog in self.prog_stats().items():
+            ret['bpf.' + name] = (prog['run_time_ns'], prog['run_cnt'])
+        return ret
+
+    def export(self):
+        """
+        导出用的累计值：{'stages': {阶段: {'seconds', 'calls', 'max_seconds'}},
+        'bpf': {程序名: {'seconds', 'calls'}}}，没有开启内核统计时 bpf 为空
+        """
+        stages = {name: {'seconds': stage.total_ns / 1e9, 'calls': stage.calls,
+                         'max_seconds': stage.max_ns / 1e9}
+                  for name, stage in sorted(list(self.stages.items()))}
+        bpf = {}
+        if self.bpf_stats_enabled():
+            bpf = {name: {'seconds': prog['run_time_ns'] / 1e9, 'calls': prog['run_cnt']}
+                   for name, prog in sorted(self.prog_stats().items())}
+        return {'stages': stages, 'bpf': bpf}
+
+    def rates(self):
+        """最近至少 RATE_WINDOW 秒内每个阶段每秒耗费的毫秒数"""
+        now = time.monotonic()
+        if self._last is None or now - self._last[0] >= RATE_WINDOW:
+            totals = self.totals()
+            if self._last is not None:
+                elapsed = now - self._last[0]
+                self._rates = {name: (ns - self._last[1].get(name, (0, 0))[0]) / 1e6 / elapsed
+                               for name, (ns, calls) in totals.items()}
+            self._last = (now, totals)
+        return self._rates
+
+    def status(self):
+        """状态栏：每个阶段每秒耗费的毫秒数，BPF 程序合计为 bpf"""
+        rates = self.rates()
+        if not rates:
+            return "profile: collecting"
+        parts = [f"{name} {value:.2f}" for name, value in sorted(rates.items())
+                 if not name.startswith('bpf.')]
+        if self.progs:
+            if self.bpf_stats_enabled():
+                bpf = sum(value for name, value in rates.items() if name.startswith('bpf.'))
+                parts.append(f"bpf {bpf:.2f}")
+            else:
+                parts.append("bpf n/a")
+        return "profile ms/s: " + "  ".join(parts)
+
+    def report(self):
+        """退出时打印的汇总"""
+        elapsed = time.monotonic() - self.started
+        cpu = time.process_time() - self.cpu_started
+        lines = [f"profile: {elapsed:.1f}s wall, {cpu:.2f}s process CPU ({cpu * 100 / max(elapsed, 1e-9):.1f}%)",
+                 f"{'STAGE':<20} {'CALLS':>9} {'TOTAL(s)':>9} {'MEAN(us)':>10} {'MAX(us)':>10} {'WALL%':>6}"]
+        for name, stage in sorted(self.stages.items()):
+            lines.append(f"{name:<20} {stage.calls:>9} {stage.total_ns / 1e9:>9.3f} "
+                         f"{stage.total_ns / 1000 / max(stage.calls, 1):>10.1f} {stage.max_ns / 1000:>10.1f} "
+                         f"{stage.total_ns / 1e7 / max(elapsed, 1e-9):>5.2f}%")
+        if self.progs:
+            if not self.bpf_stats_enabled():
+                lines.append("BPF run-time stats are disabled, enable them with "
+                             "'sysctl kernel.bpf_stats_enabled=1'")
+            lines.append(f"{'BPF PROGRAM':<28} {'ID':>6} {'RUNS':>12} {'TOTAL(s)':>9} {'MEAN(ns)':>9} {'CPU%':>6}")
+            for name, prog in sorted(self.prog_stats().items()):
+                lines.append(f"{name:<28} {prog['id']:>6} {prog['run_cnt']:>12} "
+                             f"{prog['run_time_ns'] / 1e9:>9.3f} "
+                             f"{prog['run_time_ns'] / max(prog['run_cnt'], 1):>9.0f} "
+                             f"{prog['run_time_ns'] / 1e7 / max(elapsed, 1e-9):>5.2f}%")
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.stats_fd is not None:
+            os.close(self.stats_fd)
+            self.stats_fd = None
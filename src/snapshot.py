@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import types
+
+# order 0..MAX_ORDER(10)
+NR_ORDERS = 11
+
+
+class Snapshot:
+    """
+    一次采样的只读快照。zones 按 (node_id, comm) 排序，每个元素为
+    (node_id, comm, zone_pfn, spanned_pages, present_pages)；
+    free_pages 等列为 [zone][order] 的二维元组，nodes 为 {node_id: node_start_pfn}，
+    interval 为采集这份快照时生效的采样间隔（秒）。
+    读取了 /proc/pagetypeinfo 时 migratetypes 为 migratetype 名称，mt_nr_free、mt_score_a、
+    mt_score_b 为 [zone][migratetype][order] 的三维元组，否则均为空元组。
+    """
+    __slots__ = ('timestamp', 'zones', 'nodes', 'free_pages', 'free_blocks_total',
+                 'free_blocks_suitable', 'score_a', 'score_b', 'interval',
+                 'migratetypes', 'mt_nr_free', 'mt_score_a', 'mt_score_b')
+
+    def __init__(self, timestamp, zones, nodes, free_pages, free_blocks_total,
+                 free_blocks_suitable, score_a, score_b, interval=0.0,
+                 migratetypes=(), mt_nr_free=(), mt_score_a=(), mt_score_b=()):
+        object.__setattr__(self, 'timestamp', timestamp)
+        object.__setattr__(self, 'zones', tuple(zones))
+        object.__setattr__(self, 'nodes', types.MappingProxyType(dict(nodes)))
+        object.__setattr__(self, 'free_pages', tuple(free_pages))
+        object.__setattr__(self, 'free_blocks_total', tuple(free_blocks_total))
+        object.__setattr__(self, 'free_blocks_suitable', tuple(free_blocks_suitable))
+        object.__setattr__(self, 'score_a', tuple(score_a))
+        object.__setattr__(self, 'score_b', tuple(score_b))
+        object.__setattr__(self, 'interval', interval)
+        object.__setattr__(self, 'migratetypes', tuple(migratetypes))
+        object.__setattr__(self, 'mt_nr_free', tuple(mt_nr_free))
+        object.__setattr__(self, 'mt_score_a', tuple(mt_score_a))
+        object.__setattr__(self, 'mt_score_b', tuple(mt_score_b))
+
+    def with_migratetypes(self, migratetypes, mt_nr_free, mt_score_a, mt_score_b):
+        """返回附带各 migratetype 列的新快照，其余字段不变"""
+        return Snapshot(self.timestamp, self.zones, self.nodes, self.free_pages,
+                        self.free_blocks_total, self.free_blocks_suitable, self.score_a,
+                        self.score_b, interval=self.interval, migratetypes=migratetypes,
+                        mt_nr_free=mt_nr_free, mt_score_a=mt_score_a, mt_score_b=mt_score_b)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is read-only")
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import numpy as np
+
+# 统计的指标，与 Snapshot 的列名一致
+METRICS = ('score_a', 'score_b')
+# 指标放大 1000 倍后的取值范围为 [-1000, 1000]，按 BIN_WIDTH 分桶做百分位草图
+SCORE_MIN = -1000
+BIN_WIDTH = 10
+NR_BINS = 2000 // BIN_WIDTH + 1
+# 样本数不足 MIN_SAMPLES 时还没有可信的基线，沿用固定规则：order > 5 且指标 > 0.5
+MIN_SAMPLES = 5
+STATIC_ORDER = 5
+STATIC_SCORE = 500
+# 高于基线 DEV_THRESHOLD 个标准差、且高于窗口 p99 时标红；
+# 标准差小于 DEV_FLOOR（0.02）时按 DEV_FLOOR 算，长期不变的指标不会因微小波动标红
+DEV_THRESHOLD = 3
+DEV_FLOOR = 20
+# 时间桶直方图的计数类型：先用 uint8，某个桶的样本数将超出当前类型时整体升级
+HIST_DTYPES = (np.uint8, np.uint16, np.int32)
+
+_INT_MAX = np.iinfo(np.int64).max
+_INT_MIN = np.iinfo(np.int64).min
+
+
+class StatsSummary:
+    """
+    某一时刻的统计结果，各字段为 [metric][zone][order] 的嵌套列表（指标放大 1000 倍）：
+    mean/std 为指数加权的基线与标准差，min/max/p50/p99 为最近 window 秒内的值，
+    dev 为当前值偏离基线的标准差数，alert 为当前值是否异常偏高。
+    """
+    __slots__ = ('timestamp', 'zones', 'samples', 'mean', 'std', 'min', 'max',
+                 'p50', 'p99', 'dev', 'alert')
+
+    def __init__(self, timestamp, zones, samples, **columns):
+        self.timestamp = timestamp
+        self.zones = zones
+        self.samples = samples
+        for name, value in columns.items():
+            setattr(self, name, value.tolist())
+
+    def cell(self, metric, z, order):
+        """一个 (zone, order) 的统计，数值已换算回 [-1, 1]"""
+        m = METRICS.index(metric)
+        return {
+            'baseline': self.mean[m][z][order] / 1000,
+            'std': self.std[m][z][order] / 1000,
+            'min': self.min[m][z][order] / 1000,
+            'max': self.max[m][z][order] / 1000,
+            'p50': self.p50[m][z][order] / 1000,
+            'p99': self.p99[m][z][order] / 1000,
+            'dev': self.dev[m][z][order],
+            'alert': self.alert[m][z][order],
+        }
+
+
+class StreamStats:
+    """
+    每个 (指标, zone, order) 的在线统计，每次更新的开销与内存都与运行时长无关：
+      - 按时间衰减的 EWMA 与方差（半衰期 halflife 秒）作为基线
+      - 最近 window 秒的最小/最大值与百分位：窗口切成 buckets 个时间桶，每个桶保存
+        最小值、最大值与定长直方图，时间前进时整桶清零复用。窗口内的总直方图单独维护，
+        加入样本时累加、清空时间桶时减去该桶，每次更新不必把所有桶重新求和；
+        桶的直方图按样本数选用最小的计数类型（默认 30 秒一个桶、2 秒采样时为 uint8）
+    zone 集合变化或时间倒退（回放跳转）时清空重新开始。
+    """
+    def __init__(self, window=600, buckets=20, halflife=None):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_seconds = window / buckets
+        self.halflife = window / 4 if halflife is None else halflife
+        self.layout = None
+        self.summary = None
+
+    def _reset(self, layout, shape):
+        self.layout = layout
+        self.samples = 0
+        self.timestamp = None
+        self.bucket = None
+        self.mean = np.zeros(shape)
+        self.var = np.zeros(shape)
+        self.hist = np.zeros((self.buckets,) + shape + (NR_BINS,), dtype=HIST_DTYPES[0])
+        self.total = np.zeros(shape + (NR_BINS,), dtype=np.int32)
+        self.bucket_samples = np.zeros(self.buckets, dtype=np.int64)
+        self.bucket_min = np.full((self.buckets,) + shape, _INT_MAX, dtype=np.int64)
+        self.bucket_max = np.full((self.buckets,) + shape, _INT_MIN, dtype=np.int64)
+        self.summary = None
+
+    def _clear_bucket(self, slot):
+        if self.bucket_samples[slot]:
+            self.total -= self.hist[slot]
+            self.hist[slot] = 0
+            self.bucket_samples[slot] = 0
+        self.bucket_min[slot] = _INT_MAX
+        self.bucket_max[slot] = _INT_MIN
+
+    def _clear_all(self):
+        self.hist[:] = 0
+        self.total[:] = 0
+        self.bucket_samples[:] = 0
+        self.bucket_min[:] = _INT_MAX
+        self.bucket_max[:] = _INT_MIN
+
+    def _percentile(self, cum, total, q):
+        rank = np.maximum(np.ceil(total * q / 100.0), 1)[..., None]
+        bins = np.argmax(cum >= rank, axis=-1)
+        return SCORE_MIN + bins * BIN_WIDTH + BIN_WIDTH // 2
+
+    def update(self, snap):
+        """加入一个快照，返回新的 StatsSummary（同一时间戳的重复快照直接返回上一次结果）"""
+        if not snap.zones:
+            return self.summary
+        x = np.array([getattr(snap, name) for name in METRICS], dtype=np.int64)
+        layout = tuple(zone[:2] for zone in snap.zones)
+        if layout != self.layout or (self.timestamp is not None and snap.timestamp < self.timestamp):
+            self._reset(layout, x.shape)
+        elif snap.timestamp == self.timestamp:
+            return self.summary
+
+        # 先用加入本样本之前的历史判断是否异常
+        std = np.sqrt(self.var)
+        dev = (x - self.mean) / np.maximum(std, DEV_FLOOR)
+        if self.samples >= MIN_SAMPLES:
+            alert = (dev >= DEV_THRESHOLD) & (x > np.array(self.summary.p99))
+        else:
+            orders = np.arange(x.shape[-1])
+            alert = (orders > STATIC_ORDER) & (x > STATIC_SCORE)
+            dev = np.zeros(x.shape)
+
+        if self.samples == 0:
+            self.mean[:] = x
+        else:
+            alpha = 1 - 0.5 ** ((snap.timestamp - self.timestamp) / self.halflife)
+            diff = x - self.mean
+            incr = alpha * diff
+            self.mean += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.samples += 1
+        self.timestamp = snap.timestamp
+
+        bucket = int(snap.timestamp // self.bucket_seconds)
+        if self.bucket is None or bucket - self.bucket >= self.buckets:
+            self._clear_all()
+        else:
+            for b in range(self.bucket + 1, bucket + 1):
+                self._clear_bucket(b % self.buckets)
+        self.bucket = bucket
+        slot = bucket % self.buckets
+        if self.bucket_samples[slot] >= np.iinfo(self.hist.dtype).max:
+            self.hist = self.hist.astype(HIST_DTYPES[HIST_DTYPES.index(self.hist.dtype.type) + 1])
+        self.bucket_samples[slot] += 1
+        bins = np.clip((x - SCORE_MIN) // BIN_WIDTH, 0, NR_BINS - 1).ravel()
+        cells = np.arange(len(bins))
+        self.hist[slot].reshape(-1, NR_BINS)[cells, bins] += 1
+        self.total.reshape(-1, NR_BINS)[cells, bins] += 1
+        np.minimum(self.bucket_min[slot], x, out=self.bucket_min[slot])
+        np.maximum(self.bucket_max[slot], x, out=self.bucket_max[slot])
+
+        cum = self.total.cumsum(axis=-1)
+        total = cum[..., -1]
+        self.summary = StatsSummary(
+            snap.timestamp, layout, self.samples,
+            mean=self.mean, std=np.sqrt(self.var),
+            min=self.bucket_min.min(axis=0), max=self.bucket_max.max(axis=0),
+            p50=self._percentile(cum, total, 50), p99=self._percentile(cum, total, 99),
+            dev=dev, alert=alert)
+        return self.summary
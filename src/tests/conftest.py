@@ -0,0 +1,5 @@
+import os
+import sys
+
+# src/ 下的模块按顶层模块导入（与直接运行 extfrag_user.py 时一致）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
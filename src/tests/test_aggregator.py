@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import numpy as np
+
+from adaptive import WATCH_ORDERS
+from aggregator import DOWN_FACTOR, STALE_FACTOR, Aggregator, StandInAgents, parse_address, synthetic_snapshots
+from snapshot import Snapshot
+
+# 替身 agent 的回放周期足够长，测试期间 ETag 不变
+FROZEN = 10 ** 6
+
+
+def with_interval(snapshots, interval):
+    return [Snapshot(snap.timestamp, snap.zones, snap.nodes, snap.free_pages, snap.free_blocks_total,
+                     snap.free_blocks_suitable, snap.score_a, snap.score_b, interval=interval)
+            for snap in snapshots]
+
+
+def worst(snap):
+    return max(snap.score_b[z][order] for z in range(len(snap.zones)) for order in WATCH_ORDERS)
+
+
+async def close(agents):
+    """断开连接后让替身 agent 的连接处理协程退出"""
+    agents.close()
+    await asyncio.sleep(0.01)
+
+
+def aggregator_for(agents, **kwargs):
+    return Aggregator([(text,) + parse_address(text) for text in agents.addresses()], **kwargs)
+
+
+def test_fleet_ranked_by_worst_high_order_index():
+    async def run():
+        # 每个 agent 只回放一个快照，最差指标各不相同
+        snapshots = synthetic_snapshots(40, nodes=1)
+        chosen = sorted(snapshots, key=worst)[::13][:3]
+        agents = [StandInAgents(1, 0, FROZEN, [snap]) for snap in chosen]
+        for agent in agents:
+            await agent.start()
+        addresses = [agent.addresses()[0] for agent in agents]
+        aggregator = Aggregator([(text,) + parse_address(text) for text in addresses], interval=0.1)
+        await aggregator.run(0.35)
+        for agent in agents:
+            await close(agent)
+        return addresses, chosen, aggregator.fleet()
+
+    addresses, chosen, rows = asyncio.run(run())
+    expected = sorted(zip(addresses, chosen), key=lambda pair: -worst(pair[1]))
+    assert [row['host'] for row in rows] == [host for host, _ in expected]
+    assert [row['worst'] for row in rows] == [worst(snap) / 1000 for _, snap in expected]
+    assert all(row['state'] == 'ok' and row['order'] in WATCH_ORDERS for row in rows)
+
+
+def test_unchanged_snapshot_reuses_etag():
+    async def run():
+        agents = StandInAgents(2, 0, FROZEN)
+        await agents.start()
+        aggregator = aggregator_for(agents, interval=0.05)
+        await aggregator.run(0.5)
+        await close(agents)
+        return agents, aggregator
+
+    agents, aggregator = asyncio.run(run())
+    for agent in aggregator.agents:
+        assert agent.polls >= 5
+        # 只有第一次返回快照，之后都是 304
+        assert agent.not_modified == agent.polls - 1
+        assert agent.etag is not None
+        # 一条长连接
+        assert agent.conn.connects == 1
+    # 运行结束时被取消的请求 agent 已经计数
+    polls = sum(agent.polls for agent in aggregator.agents)
+    assert polls <= agents.requests <= polls + len(aggregator.agents)
+
+
+def test_ok_stale_down_with_backoff():
+    interval = 0.1
+
+    async def run():
+        # 快照不再更新但 agent 仍然应答（304）时为 stale，之后断开
+        agents = StandInAgents(1, 0, FROZEN, with_interval(synthetic_snapshots(1), 0.05))
+        await agents.start()
+        aggregator = aggregator_for(agents, interval=interval)
+        task = asyncio.create_task(aggregator.run())
+        states = []
+
+        async def state_after(delay):
+            await asyncio.sleep(delay)
+            states.append(aggregator.fleet()[0]['state'])
+
+        await state_after(0.15)
+        await state_after(STALE_FACTOR * interval + 0.15)
+        await close(agents)
+        await state_after(0.5)
+        failures = aggregator.agents[0].failures
+        await state_after(DOWN_FACTOR * interval)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return states, failures, aggregator.agents[0]
+
+    states, failures, agent = asyncio.run(run())
+    assert states[:2] == ['ok', 'stale']
+    assert states[-1] == 'down'
+    assert failures >= 1 and agent.error
+    # 连续失败按 interval * 2^n 退避：1.5 秒内只重试几次，而不是每个周期一次
+    assert agent.errors <= 6
+    assert agent.retry_at - time.monotonic() <= interval * 2 ** (agent.failures - 1)
+
+
+def test_ticks_skipped_when_inflight_saturated():
+    async def hang(reader, writer):
+        await reader.read()
+        writer.close()
+
+    async def run():
+        servers = [await asyncio.start_server(hang, '127.0.0.1', 0) for _ in range(4)]
+        ports = [server.sockets[0].getsockname()[1] for server in servers]
+        aggregator = Aggregator([(f"h{i}", '127.0.0.1', port) for i, port in enumerate(ports)],
+                                interval=0.1, max_inflight=1, timeout=0.25)
+        await aggregator.run(1.0)
+        for server in servers:
+            server.close()
+        return aggregator
+
+    aggregator = asyncio.run(run())
+    assert aggregator.peak_inflight == 1
+    assert aggregator.throttled > 0
+    assert sum(agent.skipped for agent in aggregator.agents) >= aggregator.throttled
+    # 请求都超时，没有任何数据
+    assert all(row['state'] == 'down' for row in aggregator.fleet())
+    assert all(isinstance(agent.error, str) for agent in aggregator.agents if agent.errors)
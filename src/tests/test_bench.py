@@ -0,0 +1,12 @@
+import pytest
+
+from bench import TICK_VIEWS, run_ticks_view
+
+CONFIG = {'nodes': 1, 'zones': 2, 'tasks': 16, 'ticks': 1, 'geometry': (120, 40), 'profile': False}
+
+
+@pytest.mark.parametrize('view', TICK_VIEWS)
+def test_draw_frame_accepts_view_args(view):
+    # 子进程在伪终端上用 view_args(view) 调用 draw_frame；界面参数增加键时 view_args 要跟着补上
+    result = run_ticks_view(view, dict(CONFIG, views=[view]))
+    assert result['terminal_bytes_per_tick'] > 0
@@ -0,0 +1,37 @@
+import gzip
+import http.client
+
+from aggregator import synthetic_snapshots
+from exporter import Exporter, render_prometheus
+
+
+def test_every_series_has_help():
+    stats = {'ticks': 3, 'missed': 0, 'late': 1, 'collect_seconds': 0.001}
+    profile = {'stages': {'collect.read': {'seconds': 0.1, 'calls': 3}},
+               'bpf': {'sample_zones': {'seconds': 0.01, 'calls': 30}}}
+    lines = render_prometheus(synthetic_snapshots(1)[0], stats, profile).decode().splitlines()
+    typed = [line.split()[2] for line in lines if line.startswith('# TYPE ')]
+    helped = [line.split()[2] for line in lines if line.startswith('# HELP ')]
+    assert typed == helped
+
+
+def test_compressible_responses_vary_on_accept_encoding():
+    exporter = Exporter(port=0)
+    exporter.update(synthetic_snapshots(1)[0])
+    exporter.start()
+    try:
+        conn = http.client.HTTPConnection(*exporter.server.server_address)
+        for path in ('/metrics', '/json'):
+            for encoding in ('gzip', 'identity'):
+                conn.request('GET', path, headers={'Accept-Encoding': encoding})
+                response = conn.getresponse()
+                body = response.read()
+                assert response.getheader('Vary') == 'Accept-Encoding'
+                if encoding == 'gzip':
+                    assert response.getheader('Content-Encoding') == 'gzip'
+                    gzip.decompress(body)
+                else:
+                    assert response.getheader('Content-Encoding') is None
+        conn.close()
+    finally:
+        exporter.close()
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+
+from kpageflags import (BLOCK_FREE, BLOCK_HOLE, BLOCK_MOVABLE, BLOCK_UNMOVABLE, BUDDY_FLAGS, HOLE_FLAGS,
+                        KPF_LRU, KPF_SLAB, Heatmap, KpageflagsScanner, assign_orders)
+
+LRU = np.uint64(1 << KPF_LRU)
+SLAB = np.uint64(1 << KPF_SLAB)
+ZONES = [(0, 'Normal', 0, 4096, 4000)]
+# 与下面的 kpageflags 一致：两个 order 0、一个 order 3、一个 order 10 的空闲块
+NR_FREE = {(0, 'Normal'): [2, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1]}
+
+
+def kpageflags(tmp_path):
+    """
+    pageblock 为 512 页的 4096 页合成 kpageflags：
+    pfn 0 为 order 3 的空闲块，8-15 是没有标志的内核页，之后是 LRU 页；
+    1024 为跨两个 pageblock 的 order 10 空闲块；2048 为 order 0 空闲块；
+    2050 为 order 0 空闲块，后面的 2051 是没有标志的内核页；3000-3009 为 slab；4000 起为空洞
+    """
+    flags = np.full(4096, LRU, dtype='<u8')
+    flags[0:16] = 0
+    flags[0] = BUDDY_FLAGS
+    flags[1024:2048] = 0
+    flags[1024] = BUDDY_FLAGS
+    flags[2048] = BUDDY_FLAGS
+    flags[2050] = BUDDY_FLAGS
+    flags[2051] = 0
+    flags[3000:3010] = SLAB
+    flags[4000:] = HOLE_FLAGS
+    path = tmp_path / "kpageflags"
+    flags.tofile(path)
+    return str(path)
+
+
+def expected(free0, free4):
+    counts = np.zeros((8, 4), dtype=np.int32)
+    counts[:, BLOCK_MOVABLE] = 512
+    counts[0] = (free0, 496, 16 - free0, 0)
+    counts[2] = counts[3] = (512, 0, 0, 0)
+    counts[4] = (free4, 509, 3 - free4, 0)
+    counts[5] = (0, 502, 10, 0)
+    counts[7] = (0, 416, 0, 96)
+    return counts
+
+
+def test_scan_uses_nr_free_orders(tmp_path):
+    scanner = KpageflagsScanner(kpageflags(tmp_path), block_order=9)
+    first, counts = scanner.scan(ZONES, NR_FREE)[(0, 'Normal')]
+    assert first == 0
+    assert counts.tolist() == expected(8, 2).tolist()
+    assert (counts.sum(axis=1) == 512).all()
+
+
+def test_scan_without_nr_free_uses_bounds(tmp_path):
+    # 只凭对齐与到下一个有标志页的距离，pfn 0 的块最多为 order 4，2050 最多为 order 1
+    scanner = KpageflagsScanner(kpageflags(tmp_path), block_order=9)
+    first, counts = scanner.scan(ZONES)[(0, 'Normal')]
+    assert counts.tolist() == expected(16, 3).tolist()
+    assert counts[:, BLOCK_UNMOVABLE].sum() == 10
+    assert counts[:, BLOCK_HOLE].sum() == 96
+
+
+def test_free_blocks_across_read_chunks(tmp_path):
+    path = kpageflags(tmp_path)
+    whole = KpageflagsScanner(path, block_order=9).scan(ZONES, NR_FREE)
+    # 每次只读一个 pageblock，order 10 的空闲块跨越两次读取
+    chunked = KpageflagsScanner(path, block_order=9, chunk_pages=512).scan(ZONES, NR_FREE)
+    assert chunked[(0, 'Normal')][1].tolist() == whole[(0, 'Normal')][1].tolist()
+
+
+def test_zone_edges_are_holes(tmp_path):
+    scanner = KpageflagsScanner(kpageflags(tmp_path), block_order=9)
+    first, counts = scanner.scan([(0, 'Normal', 100, 3000, 3000)])[(0, 'Normal')]
+    assert first == 0
+    assert counts[0, BLOCK_HOLE] == 100
+    assert counts[-1, BLOCK_HOLE] == 3584 - 3100
+
+
+def test_assign_orders_largest_first():
+    bounds = np.array([1, 4, 10, 2])
+    assert assign_orders(bounds, None).tolist() == [1, 4, 10, 2]
+    assert assign_orders(bounds, [1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1]).tolist() == [0, 3, 10, 0]
+    # 上限为 0 的首页先占用 order 0 的块，超过上限的按上限计
+    assert assign_orders(bounds, [2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2], singles=1).tolist() == [0, 4, 10, 0]
+
+
+def test_heatmap_scans_in_background(tmp_path):
+    r, w = os.pipe()
+    heatmap = Heatmap(KpageflagsScanner(kpageflags(tmp_path), block_order=9), wake_fd=w)
+    assert heatmap.refresh(ZONES, NR_FREE)
+    heatmap.wait()
+    assert os.read(r, 1) == b'\0'
+    assert heatmap.result[(0, 'Normal')][1][:, BLOCK_FREE].tolist() == expected(8, 2)[:, BLOCK_FREE].tolist()
+    # 布局不变且没到间隔时不重新扫描
+    assert not heatmap.refresh(ZONES, NR_FREE)
+
+
+class FailingScanner(KpageflagsScanner):
+    def _read(self, fd, pfn, n):
+        raise ValueError("short read")
+
+
+def test_heatmap_reports_scan_failure(tmp_path):
+    heatmap = Heatmap(FailingScanner(kpageflags(tmp_path), block_order=9))
+    assert heatmap.refresh(ZONES, NR_FREE)
+    heatmap.wait()
+    assert not heatmap.scanning
+    assert heatmap.result is None
+    assert "ValueError: short read" in heatmap.status()
@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+
+from procfs import (BuddyinfoSource, PagetypeinfoReader, node_start_pfns, parse_buddyinfo,
+                    parse_iomem, parse_pagetypeinfo, parse_zoneinfo)
+from snapshot import NR_ORDERS
+
+BUDDYINFO = """\
+Node 0, zone      DMA      0      0      0      0      0      0      0      0      1      1      3 
+Node 0, zone    DMA32      2      2      2      2      2      2      5      2      2      2    754 
+Node 0, zone   Normal      2    270    326    869     19     10     13      8      6      0    262 
+Node 1, zone   Normal      7      6      5      4      3      2      1 
+"""
+
+ZONEINFO = """\
+Node 0, zone      DMA
+  per-node stats
+      nr_inactive_anon 40322
+  pages free     3840
+        spanned  4095
+        present  3998
+        managed  3840
+  start_pfn:           1
+Node 0, zone    DMA32
+  pages free     774334
+        spanned  1044480
+        present  782336
+  start_pfn:           4096
+Node 0, zone   Normal
+  pages free     250000
+        spanned  786432
+        present  786432
+  start_pfn:           1048576
+Node 0, zone  Movable
+  pages free     0
+        spanned  0
+        present  0
+Node 1, zone   Normal
+  pages free     1000
+        spanned  524288
+        present  524288
+  start_pfn:           1835008
+"""
+
+PAGETYPEINFO = """\
+Page block order: 9
+Pages per block:  512
+
+Free pages count per migrate type at order       0      1      2      3      4      5      6      7      8      9     10 
+Node    0, zone      DMA, type    Unmovable      0      0      0      0      0      0      0      0      1      0      0 
+Node    0, zone      DMA, type      Movable      0      0      0      0      0      0      0      0      0      1      3 
+Node    0, zone      DMA, type  Reclaimable      0      0      0      0      0      0      0      0      0      0      0 
+Node    0, zone      DMA, type   HighAtomic      0      0      0      0      0      0      0      0      0      0      0 
+Node    0, zone      DMA, type      Isolate      0      0      0      0      0      0      0      0      0      0      0 
+Node    0, zone   Normal, type    Unmovable      1      0      1     26     19      7      6      5      4      0      0 
+Node    0, zone   Normal, type      Movable >100000    304    323    842      0      0      1      0      1      0    262 
+Node    0, zone   Normal, type  Reclaimable      1      0      2      1      0      3      6      3      1      0      0 
+Node    0, zone   Normal, type   HighAtomic      0      0      0      0      0      0      0      0      0      0      0 
+Node    0, zone   Normal, type      Isolate      0      0      0      0      0      0      0      0      0      0      0 
+
+Number of blocks type     Unmovable      Movable  Reclaimable   HighAtomic      Isolate 
+Node 0, zone      DMA            1            7            0            0            0 
+Node 0, zone   Normal           61         1139           16            0            0 
+"""
+
+IOMEM = """\
+00000000-00000fff : Reserved
+00001000-0009fbff : System RAM
+000a0000-000fffff : Reserved
+  000f0000-000fffff : System ROM
+00100000-bfffffff : System RAM
+  01000000-01ffffff : Kernel code
+100000000-1bfffffff : System RAM
+"""
+
+
+def test_parse_buddyinfo_pads_short_rows():
+    keys, nr_free = parse_buddyinfo(BUDDYINFO)
+    assert keys == [(0, 'DMA'), (0, 'DMA32'), (0, 'Normal'), (1, 'Normal')]
+    assert nr_free.shape == (4, NR_ORDERS)
+    assert nr_free[2].tolist() == [2, 270, 326, 869, 19, 10, 13, 8, 6, 0, 262]
+    assert nr_free[3].tolist() == [7, 6, 5, 4, 3, 2, 1, 0, 0, 0, 0]
+
+
+def test_parse_zoneinfo_reads_pfn_spanned_present():
+    zones = parse_zoneinfo(ZONEINFO)
+    assert zones[(0, 'DMA')] == (1, 4095, 3998)
+    assert zones[(0, 'Normal')] == (1048576, 786432, 786432)
+    # 空 zone 没有 start_pfn 行
+    assert zones[(0, 'Movable')] == (0, 0, 0)
+    assert zones[(1, 'Normal')] == (1835008, 524288, 524288)
+
+
+def test_parse_pagetypeinfo_caps_and_matches_layout():
+    keys, migratetypes, nr_free = parse_pagetypeinfo(PAGETYPEINFO)
+    assert keys == [(0, 'DMA'), (0, 'Normal')]
+    assert migratetypes == ('Unmovable', 'Movable', 'Reclaimable', 'HighAtomic', 'Isolate')
+    assert nr_free.shape == (2, 5, NR_ORDERS)
+    assert nr_free[1, 1].tolist() == [100000, 304, 323, 842, 0, 0, 1, 0, 1, 0, 262]
+    assert nr_free[0].sum(axis=0).tolist() == [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 3]
+
+
+def test_parse_pagetypeinfo_rejects_ragged_rows():
+    broken = PAGETYPEINFO.replace("type  Reclaimable      1      0      2", "type  Reclaimable      1      0", 1)
+    with pytest.raises(ValueError):
+        parse_pagetypeinfo(broken)
+
+
+def test_parse_pagetypeinfo_without_section():
+    keys, migratetypes, nr_free = parse_pagetypeinfo("Page block order: 9\n")
+    assert keys == [] and migratetypes == () and nr_free.shape == (0, 0, NR_ORDERS)
+
+
+def test_parse_iomem_only_top_level_ram():
+    assert parse_iomem(IOMEM) == [(0x1000, 0x9fbff), (0x100000, 0xbfffffff), (0x100000000, 0x1bfffffff)]
+
+
+def fake_sysfs(tmp_path, iomem, nodes):
+    (tmp_path / "iomem").write_text(iomem)
+    memory = tmp_path / "memory"
+    memory.mkdir()
+    (memory / "block_size_bytes").write_text("8000000\n")
+    node_dir = tmp_path / "node"
+    for node_id, blocks in nodes.items():
+        d = node_dir / f"node{node_id}"
+        d.mkdir(parents=True)
+        for block in blocks:
+            (d / f"memory{block}").mkdir()
+    return dict(iomem_path=str(tmp_path / "iomem"), node_dir=str(node_dir),
+                memory_dir=str(memory), page_size=4096)
+
+
+def test_node_start_pfns_from_ram_and_memory_blocks(tmp_path):
+    # 每个内存块 128 MB；节点 1 从第 0x38 个块（0x1c0000000）开始
+    paths = fake_sysfs(tmp_path, IOMEM + "1c0000000-23fffffff : System RAM\n",
+                       {0: range(0, 0x38), 1: range(0x38, 0x48)})
+    assert node_start_pfns([0, 1], **paths) == {0: 1, 1: 0x1c0000}
+
+
+def test_node_start_pfns_without_root(tmp_path):
+    # 非 root 读到的 /proc/iomem 地址全为 0
+    hidden = "00000000-00000000 : System RAM\n00000000-00000000 : System RAM\n"
+    paths = fake_sysfs(tmp_path, hidden, {0: range(0, 0x38)})
+    assert node_start_pfns([0], **paths) == {0: 0}
+
+
+def test_buddyinfo_source_snapshot(tmp_path):
+    (tmp_path / "buddyinfo").write_text(BUDDYINFO)
+    (tmp_path / "zoneinfo").write_text(ZONEINFO)
+    source = BuddyinfoSource(str(tmp_path / "buddyinfo"), str(tmp_path / "zoneinfo"))
+    snap = source.snapshot(2)
+    assert [zone[:2] for zone in snap.zones] == [(0, 'DMA'), (0, 'DMA32'), (0, 'Normal'), (1, 'Normal')]
+    assert snap.zones[0] == (0, 'DMA', 1, 4095, 3998)
+    assert snap.interval == 2
+    # 空闲页数为 sum(nr_free[order] << order)
+    assert snap.free_pages[0][0] == 256 + 512 + 3 * 1024
+
+
+def test_pagetypeinfo_reader_aligns_to_snapshot(tmp_path):
+    (tmp_path / "buddyinfo").write_text(BUDDYINFO)
+    (tmp_path / "zoneinfo").write_text(ZONEINFO)
+    (tmp_path / "pagetypeinfo").write_text(PAGETYPEINFO)
+    snap = BuddyinfoSource(str(tmp_path / "buddyinfo"), str(tmp_path / "zoneinfo")).snapshot()
+    reader = PagetypeinfoReader(str(tmp_path / "pagetypeinfo"))
+    snap = reader.extend(snap)
+    assert reader.error is None
+    assert snap.migratetypes[1] == 'Movable'
+    # DMA32 不在文件中，按全 0 计
+    assert np.array(snap.mt_nr_free[1]).sum() == 0
+    assert snap.mt_nr_free[2][0][3] == 26
+
+
+def test_pagetypeinfo_reader_keeps_snapshot_on_error(tmp_path):
+    (tmp_path / "buddyinfo").write_text(BUDDYINFO)
+    (tmp_path / "zoneinfo").write_text(ZONEINFO)
+    snap = BuddyinfoSource(str(tmp_path / "buddyinfo"), str(tmp_path / "zoneinfo")).snapshot()
+    reader = PagetypeinfoReader(str(tmp_path / "missing"))
+    assert reader.extend(snap) is snap
+    assert reader.error.startswith(str(tmp_path / "missing"))
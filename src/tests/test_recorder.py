@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from aggregator import synthetic_snapshots
+from exporter import decode_binary, render_binary
+from recorder import Recorder, Recording, record_dtype
+from replay import query
+from snapshot import Snapshot
+
+
+def test_record_stores_only_nr_free():
+    assert record_dtype(3).itemsize == 4 + 3 * 11 * 4
+
+
+def test_recording_round_trip(tmp_path):
+    snapshots = synthetic_snapshots(20, nodes=2)
+    path = str(tmp_path / "frag.rec")
+    recorder = Recorder(path)
+    for snap in snapshots:
+        recorder.append(snap)
+    recorder.close()
+    recording = Recording(path)
+    assert len(recording) == len(snapshots)
+    for i, snap in enumerate(snapshots):
+        replayed = recording.snapshot(i)
+        assert replayed.zones == snap.zones
+        assert replayed.interval == snap.interval
+        for name in ('free_pages', 'free_blocks_total', 'free_blocks_suitable', 'score_a', 'score_b'):
+            assert getattr(replayed, name) == getattr(snap, name)
+
+
+def test_query_derives_columns(tmp_path):
+    snapshots = synthetic_snapshots(10, nodes=1)
+    path = str(tmp_path / "frag.rec")
+    recorder = Recorder(path)
+    for snap in snapshots:
+        recorder.append(snap)
+    recorder.close()
+    stats = query([path])
+    key = (0, 'Normal')
+    assert stats.samples[key] == 10
+    free = np.array([snap.free_pages[1] for snap in snapshots])
+    score_b = np.array([snap.score_b[1] for snap in snapshots])
+    assert stats.minimum[key]['free_pages'].tolist() == free.min(axis=0).tolist()
+    assert stats.maximum[key]['score_b'].tolist() == score_b.max(axis=0).tolist()
+
+
+def test_old_version_rejected(tmp_path):
+    path = str(tmp_path / "frag.rec")
+    recorder = Recorder(path)
+    recorder.append(synthetic_snapshots(1)[0])
+    recorder.close()
+    with open(path, 'r+b') as f:
+        f.seek(4)
+        f.write(b'\x01\x00')
+    with pytest.raises(ValueError, match="version 1"):
+        Recording(path)
+
+
+def test_binary_snapshot_round_trip():
+    snap = synthetic_snapshots(3, nodes=3)[-1]
+    decoded = decode_binary(render_binary(snap))
+    assert decoded.zones == snap.zones
+    assert decoded.score_a == snap.score_a and decoded.free_pages == snap.free_pages
+
+
+def with_nodes(snap, nodes):
+    return Snapshot(snap.timestamp, snap.zones, nodes, snap.free_pages, snap.free_blocks_total,
+                    snap.free_blocks_suitable, snap.score_a, snap.score_b, interval=snap.interval)
+
+
+def test_node_start_pfn_round_trip(tmp_path):
+    # x86 的节点 0 从 pfn 1 开始，而不是 ZONE_DMA32 的起始 pfn
+    nodes = {0: 1, 1: (1 << 22) + 1}
+    snapshots = [with_nodes(snap, nodes) for snap in synthetic_snapshots(3)]
+    assert decode_binary(render_binary(snapshots[0])).nodes == nodes
+    path = str(tmp_path / "frag.rec")
+    recorder = Recorder(path)
+    for snap in snapshots:
+        recorder.append(snap)
+    # 节点起始 pfn 变化时轮转到新文件
+    recorder.append(with_nodes(snapshots[-1], {0: 0, 1: 1 << 22}))
+    recorder.close()
+    recording = Recording(path)
+    assert len(recording) == 1 and recording.snapshot(0).nodes == {0: 0, 1: 1 << 22}
+    assert Recording(path + ".1").snapshot(2).nodes == nodes
@@ -0,0 +1,54 @@
+import numpy as np
+
+from aggregator import synthetic_snapshots
+from snapshot import Snapshot
+from stats import NR_BINS, StreamStats
+
+
+def retimed(snap, timestamp):
+    return Snapshot(timestamp, snap.zones, snap.nodes, snap.free_pages, snap.free_blocks_total,
+                    snap.free_blocks_suitable, snap.score_a, snap.score_b, interval=snap.interval)
+
+
+def reference_percentile(hist, q):
+    cum = hist.cumsum(axis=-1)
+    total = cum[..., -1]
+    rank = np.maximum(np.ceil(total * q / 100.0), 1)[..., None]
+    return -1000 + np.argmax(cum >= rank, axis=-1) * 10 + 5
+
+
+def test_running_total_matches_buckets():
+    stats = StreamStats(window=60, buckets=6)
+    snapshots = synthetic_snapshots(200, nodes=2)
+    # 每 0.7 秒一个快照，跨过多次时间桶轮转
+    for i, snap in enumerate(snapshots):
+        summary = stats.update(retimed(snap, 1000 + i * 0.7))
+        assert (stats.total == stats.hist.sum(axis=0)).all()
+    assert stats.hist.dtype == np.uint8
+    hist = stats.hist.sum(axis=0)
+    assert summary.p50 == reference_percentile(hist, 50).tolist()
+    assert summary.p99 == reference_percentile(hist, 99).tolist()
+    # 窗口内只剩最近 6 个桶的样本
+    assert int(stats.total[0, 0, 0].sum()) == int(stats.bucket_samples.sum())
+    assert stats.bucket_samples.sum() <= 60 / 0.7 + 1
+
+
+def test_bucket_counts_upgrade_dtype():
+    stats = StreamStats(window=600, buckets=20)
+    snap = synthetic_snapshots(1)[0]
+    # 同一个 30 秒的桶中放入 300 个样本，超过 uint8
+    for i in range(300):
+        stats.update(retimed(snap, 3000 + i * 0.05))
+    assert stats.hist.dtype == np.uint16
+    assert int(stats.hist.max()) == 300 and int(stats.total.max()) == 300
+    assert stats.total.shape[-1] == NR_BINS
+
+
+def test_gap_longer_than_window_clears():
+    stats = StreamStats(window=60, buckets=6)
+    snap = synthetic_snapshots(1)[0]
+    stats.update(retimed(snap, 0))
+    stats.update(retimed(snap, 1))
+    stats.update(retimed(snap, 500))
+    assert int(stats.bucket_samples.sum()) == 1
+    assert int(stats.total[0, 0, 0].sum()) == 1
@@ -0,0 +1,65 @@
+import pytest
+
+from aggregator import synthetic_snapshots
+from recorder import Recording
+from snapshot import Snapshot
+from trigger import TriggerEngine, parse_condition, read_capture
+
+
+def at(snap, timestamp):
+    return Snapshot(timestamp, snap.zones, snap.nodes, snap.free_pages, snap.free_blocks_total,
+                    snap.free_blocks_suitable, snap.score_a, snap.score_b, interval=snap.interval)
+
+
+def test_parse_condition_rejects_bad_order():
+    assert parse_condition('unusable:Normal:10:0.9').order == 10
+    for text in ('unusable:Normal:11:0.9', 'unusable:Normal:-1:0.9', 'extfrag:*:9:0.5:0'):
+        with pytest.raises(ValueError):
+            parse_condition(text)
+
+
+def test_unknown_zone_reported_on_first_check():
+    engine = TriggerEngine([parse_condition('unusable:Norml:9:0.9'), parse_condition('unusable:*:9:0.9')])
+    errors = []
+    engine.error_listeners.append(errors.append)
+    snapshots = synthetic_snapshots(3)
+    engine.update(snapshots[0], 2)
+    assert errors == ["no zone named Norml"]
+    assert "no zone named Norml" in engine.status()
+    engine.update(snapshots[1], 2)
+    assert len(errors) == 1
+
+
+def test_dumps_in_same_second_are_unique(tmp_path):
+    # 事件速率交替高低：每两个快照触发一次，post=0 时下一个快照就写出转储
+    engine = TriggerEngine([parse_condition('events:5')], prefix=str(tmp_path / 'dump'), post=0,
+                           pre=1, min_interval=0.1)
+    dumped = []
+    engine.listeners.append(lambda path, reason: dumped.append(path))
+    events = 0
+    for i, snap in enumerate(synthetic_snapshots(9, nodes=1)):
+        events += 100 if i % 2 else 0
+        engine.update(at(snap, 1000.0 + i * 0.1), 2, events)
+    engine.close()
+    assert engine.error is None
+    assert engine.dumps == len(dumped) == 4
+    assert len(set(dumped)) == 4
+    for path in dumped:
+        assert len(Recording(path)) >= 2
+        reason, tasks = read_capture(path)
+        assert "extfrag events > 5/s" in reason
+        assert len(tasks) == 0
+
+
+def test_dump_does_not_overwrite(tmp_path):
+    prefix = str(tmp_path / 'dump')
+    paths = []
+    for _ in range(2):
+        engine = TriggerEngine([parse_condition('unusable:*:0:-1')], prefix=prefix, post=0)
+        engine.listeners.append(lambda path, reason: paths.append(path))
+        for snap in synthetic_snapshots(2, nodes=1):
+            engine.update(snap, 2)
+        engine.close()
+    # 两次运行的触发时间与序号相同，第二次不覆盖第一次的转储
+    assert len(paths) == 1
+    assert "File exists" in engine.error
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+import math
+import queue
+import struct
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from recorder import Recording, fill_record, record_columns, record_dtype, write_recording
+from snapshot import NR_ORDERS
+
+# 条件中可用的指标与对应的 Snapshot 列
+SCORE_METRICS = {'extfrag': 'score_a', 'unusable': 'score_b'}
+# 捕获窗口内的默认采样间隔。timer 模式的 cpu-clock 每 0.1 秒触发一次，
+# 间隔等于触发周期时抖动会让内核侧隔一次才采样，所以默认取两倍
+FAST_INTERVAL = 0.2
+MIN_FAST_INTERVAL = 0.1
+# 转储包含触发前 PRE_SECONDS 秒的历史与触发后 POST_SECONDS 秒的高频采样
+PRE_SECONDS = 60
+POST_SECONDS = 10
+# 转储中捕获窗口内外碎片化事件最多的进程数
+TOP_TASKS = 20
+# 附加在录制数据之后的进程表：magic, version, 原因文本字节数, 进程数；原因文本按 8 字节补齐
+TASKS_MAGIC = b'MFDT'
+TASKS_VERSION = 1
+TASKS_HEADER = struct.Struct('<4sHxxII')
+TASK_DTYPE = np.dtype([('pid', '<i4'), ('last_alloc_order', '<i4'), ('last_fallback_order', '<i4'),
+                       ('comm', 'S16'), ('count', '<u8')])
+
+
+class Condition:
+    """
+    连续 samples 个快照满足时触发。check(snap, columns, rate) 返回本快照是否刚好触发，
+    columns 为 record_columns() 由环形缓冲区中该快照的记录算出的各列，
+    rate 为外碎片化事件速率（没有时为 None）；
+    持续满足时只触发一次，不满足后重新计数
+    """
+    def __init__(self, text, samples):
+        self.samples = samples
+        self.text = text + (f" for {samples} samples" if samples > 1 else '')
+        self.hits = 0
+
+    def _count(self, over):
+        self.hits = self.hits + 1 if over else 0
+        return self.hits == self.samples
+
+
+class ScoreCondition(Condition):
+    """zone（'*' 为任意 zone）中任一 order >= order 的指标高于 threshold"""
+    def __init__(self, metric, zone, order, threshold, samples=1):
+        super().__init__(f"{metric} {zone} order>={order} > {threshold:g}", samples)
+        self.column = SCORE_METRICS[metric]
+        self.zone = zone
+        self.order = order
+        # 与快照一致，放大 1000 倍比较
+        self.limit = int(round(threshold * 1000))
+        self.zones = None
+        self.mask = None
+
+    def check(self, snap, columns, rate):
+        if snap.zones != self.zones:
+            self.zones = snap.zones
+            self.mask = np.array([self.zone in ('*', comm) for _, comm, _, _, _ in snap.zones])
+        # columns 由刚拷入环形缓冲区的 nr_free 一次算出，不必再转换快照的元组
+        scores = columns[self.column][self.mask, self.order:]
+        return self._count(bool((scores > self.limit).any()))
+
+
+class RateCondition(Condition):
+    """外碎片化事件（mm_page_alloc_extfrag）每秒超过 threshold 次"""
+    def __init__(self, threshold, samples=1):
+        super().__init__(f"extfrag events > {threshold:g}/s", samples)
+        self.threshold = threshold
+
+    def check(self, snap, columns, rate):
+        return self._count(rate is not None and rate > self.threshold)
+
+
+def parse_condition(text):
+    """
+    METRIC:ZONE:ORDER:VALUE[:N]，METRIC 为 unusable 或 extfrag，ZONE 为 zone 名或 *，
+    例如 unusable:Normal:9:0.9:3；或 events:RATE[:N]，外碎片化事件每秒超过 RATE 次。
+    格式不符时抛出 ValueError
+    """
+    parts = text.split(':')
+    if parts[0] == 'events' and len(parts) in (2, 3):
+        rate = float(parts[1])
+        samples = int(parts[2]) if len(parts) == 3 else 1
+        if rate < 0 or samples < 1:
+            raise ValueError(text)
+        return RateCondition(rate, samples)
+    if parts[0] in SCORE_METRICS and len(parts) in (4, 5) and parts[1]:
+        order, threshold = int(parts[2]), float(parts[3])
+        samples = int(parts[4]) if len(parts) == 5 else 1
+        if not 0 <= order < NR_ORDERS or samples < 1:
+            raise ValueError(text)
+        return ScoreCondition(parts[0], parts[1], order, threshold, samples)
+    raise ValueError(text)
+
+
+def task_delta(before, after, top):
+    """
+    两次 ExtFrag.get_count_data() 读数之差，即期间各进程的外碎片化事件，按次数降序取前 top 个。
+    期间被 LRU 淘汰又重新计数的进程差值不为正，不计入
+    """
+    base = {(task['pid'], task['pcomm']): task['count'] for task in before}
+    tasks = []
+    for task in after:
+        count = task['count'] - base.get((task['pid'], task['pcomm']), 0)
+        if count > 0:
+            tasks.append((task['pid'], task['last_alloc_order'], task['last_fallback_order'],
+                          task['pcomm'].encode()[:16], count))
+    tasks.sort(key=lambda task: task[-1], reverse=True)
+    return np.array(tasks[:top], dtype=TASK_DTYPE)
+
+
+def write_tasks(f, reason, tasks):
+    text = reason.encode()
+    text += b'\0' * (-len(text) % 8)
+    f.write(TASKS_HEADER.pack(TASKS_MAGIC, TASKS_VERSION, len(text), len(tasks)))
+    f.write(text)
+    f.write(tasks.tobytes())
+
+
+def read_capture(path):
+    """转储文件附加的 (触发原因, 进程表)，普通录制文件返回 None"""
+    recording = Recording(path)
+    with open(path, 'rb') as f:
+        f.seek(recording.size)
+        head = f.read(TASKS_HEADER.size)
+        if len(head) < TASKS_HEADER.size:
+            return None
+        magic, version, text_size, nr_tasks = TASKS_HEADER.unpack(head)
+        if magic != TASKS_MAGIC or version != TASKS_VERSION:
+            return None
+        reason = f.read(text_size).rstrip(b'\0').decode('utf-8', 'replace')
+        tasks = np.frombuffer(f.read(nr_tasks * TASK_DTYPE.itemsize), dtype=TASK_DTYPE)
+    return reason, tasks
+
+
+def format_capture(path, reason, tasks, out):
+    print(f"# {path}: {reason}", file=out)
+    print(f"{'PID':>10} {'COMM':>16} {'LAST_ALLOC_ORDER':>17} {'LAST_FALLBACK_ORDER':>20} {'COUNT':>12}", file=out)
+    for task in tasks:
+        comm = task['comm'].decode('utf-8', 'replace')
+        print(f"{task['pid']:>10} {comm:>16} {task['last_alloc_order']:>17} "
+              f"{task['last_fallback_order']:>20} {task['count']:>12}", file=out)
+
+
+class TriggerEngine:
+    """
+    每个快照评估一次触发条件。平时只把快照拷入预先分配的环形缓冲区（一次定长拷贝），
+    采样间隔保持不变；任一条件满足时切到 fast 间隔采集 post 秒，然后把触发前 pre 秒与
+    捕获窗口内的快照写成转储文件 prefix-时间-毫秒-序号.mfd，之后恢复原来的间隔。
+    采集线程只拷出转储的数据，文件由后台线程按顺序写出，close() 等待排队的转储写完。
+    转储是普通的录制文件（可以 -r 回放、-q 查询），记录区之后附加触发原因与捕获窗口内
+    外碎片化事件最多的 top 个进程（task_counts 为 None 时进程表为空）。
+    条件持续满足时不重复触发，恢复后重新计数；捕获期间满足的条件并入本次转储。
+    min_interval 为平时最短的采样间隔，决定环形缓冲区的容量。
+    """
+    def __init__(self, conditions, prefix='mfd-trigger', fast=FAST_INTERVAL, pre=PRE_SECONDS,
+                 post=POST_SECONDS, top=TOP_TASKS, min_interval=2):
+        self.conditions = list(conditions)
+        self.prefix = prefix
+        self.fast = fast
+        self.pre = pre
+        self.post = post
+        self.top = top
+        self.capacity = math.ceil(pre / min_interval) + math.ceil(post / fast) + 2
+        # 返回 ExtFrag.get_count_data() 格式的进程事件累计值，由 ExtFrag 设置
+        self.task_counts = None
+        # 每写出一个转储调用 listener(path, reason)
+        self.listeners = []
+        # 出错（条件中的 zone 不存在、转储写入失败）时调用 error_listener(text)
+        self.error_listeners = []
+        self.zones = None
+        self.nodes = None
+        self.records = None
+        self.timestamps = None
+        self.count = 0
+        self.capture = None
+        self.base = None
+        self.events = None
+        self.dumps = 0
+        self.last_dump = None
+        self.error = None
+        self._seq = 0
+        self._write_error = None
+        self._queue = queue.Queue()
+        self._writer = None
+
+    @property
+    def needs_events(self):
+        """有按事件速率的条件时，外碎片化事件需要一直统计"""
+        return any(isinstance(c, RateCondition) for c in self.conditions)
+
+    @property
+    def capturing(self):
+        return self.capture is not None
+
+    def _reset(self, zones, nodes):
+        self.zones = zones
+        self.nodes = nodes
+        self.records = np.zeros(self.capacity, dtype=record_dtype(len(zones)))
+        self.timestamps = np.zeros(self.capacity, dtype=np.uint64)
+        self.count = 0
+        # 条件中写错的 zone 名永远不会触发，布局变化后第一次评估时报告
+        names = {comm for _, comm, _, _, _ in zones}
+        missing = [c.zone for c in self.conditions
+                   if isinstance(c, ScoreCondition) and c.zone != '*' and c.zone not in names]
+        if missing:
+            self._report(', '.join(f"no zone named {zone}" for zone in dict.fromkeys(missing)))
+
+    def _report(self, error):
+        self.error = error
+        for listener in self.error_listeners:
+            listener(error)
+
+    def _rate(self, timestamp, events):
+        last, self.events = self.events, (timestamp, events)
+        if events is None or last is None or last[1] is None or timestamp <= last[0]:
+            return None
+        return (events - last[1]) / (timestamp - last[0])
+
+    def update(self, snap, interval, events=None):
+        """
+        加入一个快照并返回下一周期的采样间隔；interval 为不触发时应使用的间隔，
+        events 为外碎片化事件的累计次数（没有统计时为 None）
+        """
+        if not snap.zones:
+            return interval
+        if snap.zones != self.zones or snap.nodes != self.nodes:
+            # zone 布局或节点变化，先写出已经捕获的部分
+            if self.capture is not None:
+                self._dump()
+                interval = self.base
+            self._reset(snap.zones, dict(snap.nodes))
+        slot = self.count % self.capacity
+        fill_record(self.records, slot, snap, snap.interval)
+        self.timestamps[slot] = int(snap.timestamp * 1e9)
+        self.count += 1
+
+        rate = self._rate(snap.timestamp, events)
+        columns = record_columns(self.records[slot])
+        fired = [c.text for c in self.conditions if c.check(snap, columns, rate)]
+        if self.capture is None:
+            if not fired:
+                return interval
+            tasks = self.task_counts() if self.task_counts is not None else []
+            self.capture = (snap.timestamp, fired, tasks)
+            self.base = interval
+        else:
+            self.capture[1].extend(fired)
+            if snap.timestamp - self.capture[0] >= self.post:
+                self._dump()
+                return self.base
+        return self.fast
+
+    def _dump(self):
+        """在采集线程上拷出转储的数据，交给写线程"""
+        started, fired, before = self.capture
+        self.capture = None
+        n = min(self.count, self.capacity)
+        slots = np.arange(self.count - n, self.count) % self.capacity
+        slots = slots[self.timestamps[slots] >= int((started - self.pre) * 1e9)]
+        tasks = task_delta(before, self.task_counts() if self.task_counts is not None else [], self.top)
+        when = datetime.fromtimestamp(started)
+        reason = f"{when:%Y-%m-%d %H:%M:%S}: " + '; '.join(dict.fromkeys(fired))
+        # 同一秒内可能有多个转储（例如 zone 布局变化时提前写出），加上毫秒与序号
+        self._seq += 1
+        path = f"{self.prefix}-{when:%Y%m%d-%H%M%S}-{when.microsecond // 1000:03d}-{self._seq}.mfd"
+        # 按索引取出的是副本，写线程不会看到之后拷入环形缓冲区的快照
+        self._queue.put((path, reason, self.zones, self.nodes, self.timestamps[slots], self.records[slots],
+                         tasks))
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="mfd-trigger-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._write(*job)
+
+    def _write(self, path, reason, zones, nodes, timestamps, records, tasks):
+        try:
+            # 'xb' 不覆盖已有的文件（例如之前运行留下的同名转储）
+            with open(path, 'xb') as f:
+                write_recording(f, zones, nodes, timestamps, records)
+                write_tasks(f, reason, tasks)
+        except OSError as e:
+            self._write_error = f"{path}: {e.strerror}"
+            self._report(self._write_error)
+            return
+        # 写入恢复后清掉写入错误，zone 名的错误保留
+        if self.error is not None and self.error == self._write_error:
+            self.error = None
+        self.dumps += 1
+        self.last_dump = path
+        for listener in self.listeners:
+            listener(path, reason)
+
+    def close(self):
+        """等待排队的转储写完；之后再有转储会重新启动写线程"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def status(self):
+        state = 'capturing' if self.capture is not None else 'armed'
+        text = f"trigger: {state}, {self.dumps} dumps"
+        if self.last_dump is not None:
+            text += f", last {self.last_dump}"
+        if self.error is not None:
+            text += f", error: {self.error}"
+        return text